@@ -0,0 +1,113 @@
+"""
+Reading back a user's attempts: keyset-paginated history and streaming export.
+
+Both walk the composite index (user_id, created_at, id). A history page starts at
+its cursor (the last row's created_at and id) with a row comparison, so page 10,000
+costs the same as page 1 (an OFFSET would read and discard every row before it).
+
+Exports stream rows from a server-side cursor (yield_per) on a connection of their
+own, ATTEMPT_EXPORT_CHUNK_ROWS rows at a time, so memory stays constant whatever
+the number of attempts. In sync mode the generator runs on the threadpool; in
+async mode rows come through asyncpg, without holding a thread.
+"""
+import csv
+import io
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Iterator, List, NamedTuple, Optional, Sequence
+from sqlalchemy import select, tuple_
+from sqlalchemy.orm import Session
+from app.database import AsyncSessionLocal, SessionLocal
+from app.models import Attempt
+
+# Rows fetched from the server-side cursor and written to the response per chunk
+ATTEMPT_EXPORT_CHUNK_ROWS = int(os.getenv("ATTEMPT_EXPORT_CHUNK_ROWS", "1000"))
+
+ATTEMPT_HISTORY_MAX_PAGE_SIZE = 100
+
+EXPORT_COLUMNS = ("id", "problem_id", "time_seconds", "key_strokes", "ccpm", "created_at")
+
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+class HistoryCursor(NamedTuple):
+    """Position after the last attempt of a page"""
+    created_at: datetime
+    id: int
+
+    def encode(self) -> str:
+        # Microseconds since the epoch: exact, and safe in a URL without escaping
+        return f"{self.id}:{(self.created_at - EPOCH) // timedelta(microseconds=1)}"
+
+    @classmethod
+    def decode(cls, cursor: str) -> "HistoryCursor":
+        """Parse a cursor from a previous page; raises ValueError if it is malformed"""
+        attempt_id, created_at = cursor.split(":", 1)
+        try:
+            return cls(EPOCH + timedelta(microseconds=int(created_at)), int(attempt_id))
+        except OverflowError:
+            raise ValueError(f"Cursor timestamp out of range: {created_at}")
+
+
+def load_history_page(db: Session, user_id: int, after: Optional[HistoryCursor], limit: int) -> List[Attempt]:
+    """A user's attempts after the cursor, newest first (limit + 1 rows tell whether there are more)"""
+    query = (
+        select(Attempt)
+        .where(Attempt.user_id == user_id)
+        .order_by(Attempt.created_at.desc(), Attempt.id.desc())
+        .limit(limit)
+    )
+    if after is not None:
+        query = query.where(tuple_(Attempt.created_at, Attempt.id) < tuple_(after.created_at, after.id))
+    return list(db.execute(query).scalars())
+
+
+def export_query(user_id: int):
+    """All of a user's attempts, oldest first, as plain rows"""
+    return (
+        select(*(getattr(Attempt, column) for column in EXPORT_COLUMNS))
+        .where(Attempt.user_id == user_id)
+        .order_by(Attempt.created_at, Attempt.id)
+        .execution_options(yield_per=ATTEMPT_EXPORT_CHUNK_ROWS)
+    )
+
+
+def format_rows(rows: Sequence, export_format: str) -> str:
+    """Render one chunk of export rows"""
+    if export_format == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow((*row[:-1], row[-1].isoformat()))
+        return buffer.getvalue()
+    return "".join(
+        json.dumps({**row._asdict(), "created_at": row.created_at.isoformat()}, separators=(",", ":")) + "\n"
+        for row in rows
+    )
+
+
+def export_header(export_format: str) -> str:
+    return ",".join(EXPORT_COLUMNS) + "\r\n" if export_format == "csv" else ""
+
+
+def stream_export(user_id: int, export_format: str) -> Iterator[str]:
+    """Yield a user's attempts in chunks from a server-side cursor (synchronous engine)"""
+    yield export_header(export_format)
+    db = SessionLocal()
+    try:
+        for rows in db.execute(export_query(user_id)).partitions():
+            yield format_rows(rows, export_format)
+    finally:
+        db.close()
+
+
+async def stream_export_async(user_id: int, export_format: str) -> AsyncIterator[str]:
+    """Yield a user's attempts in chunks from a server-side cursor (asyncpg)"""
+    yield export_header(export_format)
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(export_query(user_id))
+        async for rows in result.partitions():
+            yield format_rows(rows, export_format)
@@ -1,16 +1,35 @@
 """
 Password hashing utilities using bcrypt
 """
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Optional, TypeVar
 import bcrypt
+from starlette.concurrency import run_in_threadpool
 
+# bcrypt cost factor for new hashes. Existing hashes with a different cost are
+# transparently rehashed the next time their user logs in.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
 
-def hash_password(password: str) -> str:
+# Number of worker processes that run bcrypt (0 = use the threadpool instead)
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+
+# Maximum hashing jobs running or queued per API worker before new ones are rejected
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "32"))
+
+T = TypeVar("T")
+
+
+def hash_password(password: str, rounds: Optional[int] = None) -> str:
     """
-    Hash a password using bcrypt with salt.
+    Hash a password using bcrypt with salt (cost factor defaults to BCRYPT_ROUNDS).
     Returns the hashed password as a string.
     """
     # Generate salt and hash password
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=rounds or BCRYPT_ROUNDS)
     hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
     return hashed.decode('utf-8')
 
@@ -26,8 +45,71 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     )
 
 
+def hash_rounds(hashed_password: str) -> Optional[int]:
+    """Return the cost factor of a bcrypt hash ("$2b$12$..." -> 12), or None if unrecognised"""
+    parts = hashed_password.split("$")
+    if len(parts) < 4 or not parts[2].isdigit():
+        return None
+    return int(parts[2])
+
+
+def needs_rehash(hashed_password: str) -> bool:
+    """True if a hash was made with a different cost factor than BCRYPT_ROUNDS"""
+    return hash_rounds(hashed_password) != BCRYPT_ROUNDS
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when too many hashing jobs are already pending"""
+
+
+class PasswordHasherPool:
+    """
+    Runs bcrypt in a dedicated process pool, so hashing bursts neither hold the GIL
+    nor occupy the threadpool that serves every other endpoint.
+    Admission is limited to max_pending jobs; beyond that PasswordHasherBusy is raised
+    instead of letting the queue (and latency) grow without bound.
+    """
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, max_pending: int = PASSWORD_HASH_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+        self.rejected = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: forking a process that already runs threads is unsafe
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
 
+    async def run(self, fn: Callable[..., T], *args) -> T:
+        if self._pending >= self.max_pending:
+            self.rejected += 1
+            raise PasswordHasherBusy()
+        self._pending += 1
+        try:
+            if self.workers <= 0:
+                return await run_in_threadpool(fn, *args)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+        except BrokenProcessPool:
+            # A worker died; start a fresh pool for the next job instead of failing forever
+            self.shutdown()
+            raise
+        finally:
+            self._pending -= 1
 
+    def shutdown(self):
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
 
+    def stats(self) -> dict:
+        return {"workers": self.workers, "pending": self._pending, "max_pending": self.max_pending, "rejected": self.rejected}
 
 
+password_hasher = PasswordHasherPool()
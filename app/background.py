@@ -0,0 +1,58 @@
+"""
+Background periodic tasks run by each worker (started and stopped from main.py).
+"""
+import logging
+import threading
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicTask:
+    """
+    Call a function every interval_seconds on a daemon thread.
+    wake() runs it early; stop() ends the thread and, by default, runs it one last time
+    so buffered work is not lost on graceful shutdown.
+    """
+
+    def __init__(self, name: str, interval_seconds: float, fn: Callable[[], object]):
+        self.name = name
+        self.interval_seconds = interval_seconds
+        self._fn = fn
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def wake(self):
+        """Run the task as soon as possible instead of waiting for the interval"""
+        self._wake.set()
+
+    def stop(self, run_final: bool = True):
+        if self._thread is not None:
+            self._stopping.set()
+            self._wake.set()
+            self._thread.join()
+            self._thread = None
+        if run_final:
+            self._run_once()
+
+    def _run_once(self):
+        try:
+            self._fn()
+        except Exception as e:
+            logger.error(f"Background task {self.name} failed: {e}")
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wake.wait(self.interval_seconds)
+            self._wake.clear()
+            if self._stopping.is_set():
+                break
+            self._run_once()
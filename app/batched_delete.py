@@ -0,0 +1,37 @@
+"""
+Batched deletes for the background pruners (expired sessions, idempotency keys,
+histogram windows).
+
+Each batch is its own short transaction and picks its rows with FOR UPDATE SKIP LOCKED,
+so a pruner never waits on (or blocks) concurrent writers and several workers can
+prune the same table at the same time.
+"""
+from sqlalchemy import delete, select
+from app.database import SessionLocal
+
+
+def delete_in_batches(model, key_column, condition, batch_size: int) -> int:
+    """
+    Delete the model's rows matching condition, batch_size rows (picked by their unique
+    key_column) per transaction, skipping rows that other transactions hold locked.
+    Returns the number of rows deleted.
+    """
+    batch = (
+        select(key_column)
+        .where(condition)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    statement = delete(model).where(key_column.in_(batch))
+    deleted = 0
+    while True:
+        db = SessionLocal()
+        try:
+            rows = db.execute(statement).rowcount
+            db.commit()
+        finally:
+            db.close()
+        deleted += rows
+        if rows < batch_size:
+            return deleted
@@ -0,0 +1,32 @@
+"""
+COPY helpers for bulk loads (problem imports, synthetic data).
+
+Rows are rendered as CSV with every field quoted and loaded with COPY ... (FORMAT csv).
+Quoting every field keeps empty strings empty: COPY reads an unquoted empty field as
+NULL. None has no rendering of its own (it would load as an empty string), so only
+NOT NULL columns are bulk loaded.
+"""
+import csv
+import io
+from typing import Iterable, Sequence, Tuple
+from sqlalchemy.engine import Connection
+
+
+def csv_rows(rows: Iterable[Sequence]) -> str:
+    """Render rows as COPY-ready CSV (values are written with str())"""
+    buffer = io.StringIO()
+    csv.writer(buffer, quoting=csv.QUOTE_ALL).writerows(rows)
+    return buffer.getvalue()
+
+
+def copy_csv(connection: Connection, table: str, columns: Tuple[str, ...], data: str):
+    """COPY CSV rendered by csv_rows into a table, part of the connection's transaction"""
+    column_list = ", ".join(f'"{column}"' for column in columns)
+    connection.connection.cursor().copy_expert(
+        f"COPY {table} ({column_list}) FROM STDIN WITH (FORMAT csv)", io.StringIO(data)
+    )
+
+
+def copy_rows(connection: Connection, table: str, columns: Tuple[str, ...], rows: Iterable[Sequence]):
+    """COPY rows into a table, part of the connection's transaction"""
+    copy_csv(connection, table, columns, csv_rows(rows))
@@ -0,0 +1,89 @@
+"""
+Small in-process caches shared by the routers.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+class LRUCache:
+    """
+    Thread-safe LRU mapping bounded by total weight.
+    Each value is weighed by `weigher` (1 per entry by default, so max_weight is an entry count);
+    the least recently used entries are evicted once the total exceeds max_weight.
+    With ttl_seconds, entries also expire that long after they were stored.
+    """
+
+    def __init__(
+        self,
+        max_weight: int,
+        weigher: Optional[Callable[[Any], int]] = None,
+        ttl_seconds: Optional[float] = None,
+    ):
+        self.max_weight = max_weight
+        self.ttl_seconds = ttl_seconds
+        self._weigher = weigher or (lambda value: 1)
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (value, weight, expires_at)
+        self._weight = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value (marking it recently used), or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] is not None and entry[2] <= time.monotonic():
+                del self._entries[key]
+                self._weight -= entry[1]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any):
+        """Store a value, evicting least recently used entries if over budget"""
+        weight = self._weigher(value)
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds is not None else None
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._weight -= old[1]
+            if weight > self.max_weight:
+                return  # Would never fit; don't flush the whole cache for it
+            self._entries[key] = (value, weight, expires_at)
+            self._weight += weight
+            while self._weight > self.max_weight:
+                _, (_, evicted_weight, _) = self._entries.popitem(last=False)
+                self._weight -= evicted_weight
+                self.evictions += 1
+
+    def pop(self, key: Hashable):
+        """Remove a key if present"""
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._weight -= old[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._weight = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "weight": self._weight,
+            "max_weight": self.max_weight,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,163 @@
+"""
+Per-worker, read-through cache of the problem catalog.
+
+Problems never change after they are inserted, so each worker keeps pre-built
+ProblemResponse base payloads (no user stats or histograms) keyed by problem id.
+Any insert, update or delete of a problem bumps the "catalog" version counter in
+the same transaction; workers notice the new version within
+CATALOG_VERSION_CHECK_SECONDS and drop their cached payloads.
+"""
+import os
+import threading
+from typing import Dict, Iterable, Optional
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session, object_session
+from app.cache import LRUCache
+from app.counters import CounterWatcher, bump_counter
+from app.diffing import fill_diff_metadata
+from app.models import Problem
+from app.schemas import ProblemResponse
+
+CATALOG_VERSION_COUNTER = "catalog"
+
+# How often (seconds) each worker re-reads the catalog version from the database
+CATALOG_VERSION_CHECK_SECONDS = float(os.getenv("CATALOG_VERSION_CHECK_SECONDS", "5"))
+
+# Memory budget for cached problem payloads per worker (approximate bytes)
+CATALOG_CACHE_MAX_BYTES = int(os.getenv("CATALOG_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Rough fixed cost of one cached payload on top of its text
+PAYLOAD_OVERHEAD_BYTES = 256
+
+catalog_version = CounterWatcher(CATALOG_VERSION_COUNTER, CATALOG_VERSION_CHECK_SECONDS)
+
+
+def build_problem_payload(problem: Problem) -> ProblemResponse:
+    """Build the user-independent part of a problem response"""
+    return ProblemResponse(
+        id=problem.id,
+        name=problem.name,
+        original_text=problem.original_text,
+        modified_text=problem.modified_text,
+        problem_id=str(problem.id),  # Frontend expects this as string
+        edit_script=problem.edit_script,
+        changed_chars=problem.changed_chars,
+        min_key_strokes=problem.min_key_strokes
+    )
+
+
+def payload_size(payload: ProblemResponse) -> int:
+    size = len(payload.name) + len(payload.original_text) + len(payload.modified_text) + PAYLOAD_OVERHEAD_BYTES
+    for _, _, inserted in payload.edit_script or ():
+        size += len(inserted) + PAYLOAD_OVERHEAD_BYTES // 4
+    return size
+
+
+class ProblemCatalog:
+    """Read-through cache of problem payloads, invalidated by the catalog version"""
+
+    def __init__(self, max_bytes: int = CATALOG_CACHE_MAX_BYTES):
+        self._cache = LRUCache(max_bytes, weigher=payload_size)
+        self._version: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _sync_version(self, db: Session) -> int:
+        version = catalog_version.current(db)
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._cache.clear()
+                    self._version = version
+        return version
+
+    def get(self, db: Session, problem_id: int) -> Optional[ProblemResponse]:
+        """
+        Return the base payload for a problem, loading it by primary key on a miss.
+        Returns None if the problem does not exist.
+        Callers must copy the payload (model_copy) before adding per-request fields.
+        """
+        version = self._sync_version(db)
+        payload = self._cache.get(problem_id)
+        if payload is not None:
+            return payload
+
+        problem = db.get(Problem, problem_id)
+        if problem is None:
+            return None
+        payload = build_problem_payload(problem)
+        # Don't cache a payload loaded under a version that changed meanwhile
+        if self._version == version:
+            self._cache.put(problem_id, payload)
+        return payload
+
+    def get_many(self, db: Session, problem_ids: Iterable[int]) -> Dict[int, ProblemResponse]:
+        """
+        Return the base payloads of several problems, loading all misses with one query.
+        Problems that do not exist are absent from the result.
+        """
+        version = self._sync_version(db)
+        payloads = {}
+        missing = []
+        for problem_id in problem_ids:
+            payload = self._cache.get(problem_id)
+            if payload is not None:
+                payloads[problem_id] = payload
+            else:
+                missing.append(problem_id)
+        if missing:
+            for problem in db.execute(select(Problem).where(Problem.id.in_(missing))).scalars():
+                payload = build_problem_payload(problem)
+                if self._version == version:
+                    self._cache.put(problem.id, payload)
+                payloads[problem.id] = payload
+        return payloads
+
+    def stats(self) -> dict:
+        return {"version": self._version, **self._cache.stats()}
+
+
+problem_catalog = ProblemCatalog()
+
+
+@event.listens_for(Problem, "before_insert")
+@event.listens_for(Problem, "before_update")
+def _compute_diff_metadata(mapper, connection, target):
+    """Diff a problem's texts once, when it is stored (not on the request path)"""
+    state = inspect(target)
+    texts_changed = any(
+        state.attrs[name].history.has_changes() for name in ("original_text", "modified_text")
+    )
+    if texts_changed or target.changed_chars is None:
+        fill_diff_metadata(target)
+
+
+@event.listens_for(Problem, "after_insert")
+@event.listens_for(Problem, "after_update")
+@event.listens_for(Problem, "after_delete")
+def _mark_problems_changed(mapper, connection, target):
+    """Remember on the session that the catalog changed"""
+    session = object_session(target)
+    if session is not None:
+        session.info["problems_changed"] = True
+
+
+@event.listens_for(Session, "after_flush")
+def _bump_catalog_version(session, flush_context):
+    """Bump the catalog version in the same transaction as the problem changes"""
+    if session.info.get("problems_changed") and not session.info.get("catalog_version_bumped"):
+        bump_counter(session.connection(), CATALOG_VERSION_COUNTER)
+        session.info["catalog_version_bumped"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_catalog_on_commit(session):
+    """Let this worker see its own catalog changes immediately"""
+    if session.info.pop("problems_changed", False):
+        catalog_version.invalidate()
+    session.info.pop("catalog_version_bumped", None)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_catalog_changes(session):
+    session.info.pop("problems_changed", None)
+    session.info.pop("catalog_version_bumped", None)
@@ -0,0 +1,67 @@
+"""
+Helpers for the shared version counters in the version_counters table.
+"""
+import threading
+import time
+from typing import Optional
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from app.models import VersionCounter
+
+
+def read_counter(db, name: str) -> int:
+    """Return the current value of a counter (0 if it was never bumped)"""
+    value = db.execute(select(VersionCounter.value).where(VersionCounter.name == name)).scalar()
+    return value or 0
+
+
+def bump_counter(db, name: str):
+    """
+    Atomically increment a counter, creating it if needed.
+    `db` may be a Session or a Connection; the bump is part of its current transaction.
+    """
+    statement = insert(VersionCounter).values(name=name, value=1)
+    statement = statement.on_conflict_do_update(
+        index_elements=[VersionCounter.name],
+        set_={"value": VersionCounter.value + 1},
+    )
+    db.execute(statement)
+
+
+class CounterWatcher:
+    """
+    Per-worker view of a counter that re-reads the database at most once every check_seconds.
+    Callers compare current() with the value their cached data was built from.
+    """
+
+    def __init__(self, name: str, check_seconds: float):
+        self.name = name
+        self.check_seconds = check_seconds
+        self._value: Optional[int] = None
+        self._checked_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        """Force the next current() call to re-read the counter"""
+        self._checked_at = None
+
+    def _is_due(self) -> bool:
+        return self._checked_at is None or time.monotonic() - self._checked_at >= self.check_seconds
+
+    def _reload(self, db):
+        self._value = read_counter(db, self.name)
+        self._checked_at = time.monotonic()
+
+    def current(self, db) -> int:
+        if self._is_due():
+            # Only one caller re-reads the counter; the others keep using the last value.
+            # Never block on the lock while it is held across a query: in async mode all
+            # requests share one thread, so waiting here would deadlock.
+            if self._lock.acquire(blocking=False):
+                try:
+                    self._reload(db)
+                finally:
+                    self._lock.release()
+            elif self._value is None:
+                self._reload(db)  # Nothing to fall back on yet
+        return self._value
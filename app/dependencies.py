@@ -1,7 +1,10 @@
 from fastapi import Header, HTTPException, status
 from sqlalchemy.orm import Session
 from app.database import get_db
-from app.models import Session as SessionModel
+from app.models import User
+from app.session_cache import CachedSession, session_cache
+from app.session_touch import session_touches
+from app.tokens import is_token, token_revocations, verify_token
 from datetime import datetime, timezone
 from typing import Optional
 
@@ -29,30 +32,50 @@ def get_optional_session_id(x_session_id: Optional[str] = Header(None)) -> Optio
     return x_session_id
 
 
-def verify_session(db: Session, session_id: str) -> SessionModel:
+def resolve_session(db: Session, session_id: Optional[str]) -> Optional[CachedSession]:
     """
-    Verify that the session exists and update last_accessed_at.
+    Look up a session (served from the per-worker session cache) and record the access.
+    Signed tokens are verified in memory instead (see app/tokens.py).
+    Returns None if no session ID was given or the session doesn't exist.
+    """
+    if not session_id:
+        return None
+    if is_token(session_id):
+        return resolve_token(db, session_id)
+    session = session_cache.get(db, session_id)
+    if session:
+        # Record last accessed time (written in bulk by session_touches)
+        session_touches.touch(session.session_id)
+    return session
+
+
+def resolve_token(db: Session, token: str) -> Optional[CachedSession]:
+    """Return the session a signed token stands for, or None if it is invalid, expired or revoked"""
+    claims = verify_token(token)
+    if claims is None or token_revocations.is_revoked(db, claims.token_id):
+        return None
+    return CachedSession(token, claims.user_id, claims.username, claims.issued_at, datetime.now(timezone.utc))
+
+
+def verify_session(db: Session, session_id: str) -> CachedSession:
+    """
+    Verify that the session exists and record the access.
     Raises 401 if session doesn't exist.
     """
-    session = db.query(SessionModel).filter(SessionModel.session_id == session_id).first()
+    session = resolve_session(db, session_id)
     if not session:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid or expired session"
         )
     
-    # Update last accessed time
-    session.last_accessed_at = datetime.now(timezone.utc)
-    db.commit()
-    
     return session
 
 
-def get_current_user(db: Session, session_id: str):
+def get_current_user(db: Session, session_id: str) -> User:
     """
     Get the current user from a session ID.
     Raises 401 if session doesn't exist or is invalid.
     """
     session = verify_session(db, session_id)
-    return session.user
-
+    return db.get(User, session.user_id)
@@ -0,0 +1,197 @@
+"""
+Character-level diff of a problem's original and modified text, computed once at ingest.
+
+The edit script is a list of hunks [start, end, inserted]: replace original_text[start:end]
+with `inserted`. Hunks are in order and don't overlap; applying them all turns
+original_text into modified_text (see apply_edit_script). Offsets count Unicode code points.
+
+Diffing runs in two passes, like most text diff tools, so large texts stay cheap:
+1. after stripping the common prefix and suffix, lines are diffed (each distinct line
+   interned to an int, so comparisons are O(1)),
+2. each changed run of lines is diffed again character by character.
+Both passes use Myers' O((N + M) * D) algorithm, which finds a shortest edit script.
+Its cost grows with the number of edits D, so it gives up after DIFF_MAX_EDIT_DISTANCE:
+lines are then matched with difflib's SequenceMatcher (near-linear on interned lines,
+not always minimal), and a run of lines needing more than DIFF_CHAR_LEVEL_MAX_EDITS
+character edits is treated as replaced as a whole. Scripts stay correct either way.
+
+From the script:
+- changed_chars counts deleted plus inserted characters; CCPM is changed_chars per
+  minute of the attempt's time.
+- min_key_strokes is a lower bound on the keystrokes of any attempt, valid even with
+  copy/paste and multiple cursors: at least one keystroke if anything changes, and one
+  per distinct inserted character that appears nowhere in the original text (it can't
+  be copied, and each keystroke types at most one character).
+"""
+import difflib
+import os
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+# Edits after which a region is treated as replaced as a whole (bounds diff time)
+DIFF_MAX_EDIT_DISTANCE = int(os.getenv("DIFF_MAX_EDIT_DISTANCE", "1000"))
+
+# Changed regions longer than this (characters, either side) are not diffed by character,
+# nor are regions needing more character edits (they are mostly rewritten anyway)
+DIFF_CHAR_LEVEL_MAX_CHARS = 20000
+DIFF_CHAR_LEVEL_MAX_EDITS = 300
+
+Hunk = List  # [start, end, inserted]: original_text[start:end] is replaced by inserted
+Block = Tuple[int, int, int]  # Matching run: a[i:i + size] == b[j:j + size]
+
+
+class DiffMetadata(NamedTuple):
+    edit_script: List[Hunk]
+    changed_chars: int
+    min_key_strokes: int
+
+
+def myers_matching_blocks(a: Sequence, b: Sequence, max_edits: int) -> Optional[List[Block]]:
+    """
+    Matching runs of a shortest edit script between two sequences, in order, or None
+    if it needs more than max_edits insertions and deletions.
+    """
+    n, m = len(a), len(b)
+    max_d = min(n + m, max_edits)
+    offset = max_d + 1
+    furthest = [0] * (2 * max_d + 3)  # Furthest x reached on each diagonal k = x - y
+    trace: List[List[int]] = []
+    for d in range(max_d + 1):
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and furthest[offset + k - 1] < furthest[offset + k + 1]):
+                x = furthest[offset + k + 1]  # Insertion (move down)
+            else:
+                x = furthest[offset + k - 1] + 1  # Deletion (move right)
+            y = x - k
+            while x < n and y < m and a[x] == b[y]:
+                x += 1
+                y += 1
+            furthest[offset + k] = x
+            if x >= n and y >= m:
+                trace.append(furthest[offset - d:offset + d + 1])
+                return _backtrack(trace, n, m)
+        trace.append(furthest[offset - d:offset + d + 1])
+    return None
+
+
+def _backtrack(trace: List[List[int]], n: int, m: int) -> List[Block]:
+    """Walk a Myers trace back from (n, m) and collect the diagonal runs"""
+    blocks = []
+    x, y = n, m
+    for d in range(len(trace) - 1, 0, -1):
+        previous = trace[d - 1]  # Diagonals -(d - 1)..d - 1
+        k = x - y
+        if k == -d or (k != d and previous[k - 1 + d - 1] < previous[k + 1 + d - 1]):
+            previous_k = k + 1
+            start_x = previous[previous_k + d - 1]
+            start_y = start_x - previous_k + 1
+        else:
+            previous_k = k - 1
+            start_x = previous[previous_k + d - 1] + 1
+            start_y = start_x - k
+        if x > start_x:
+            blocks.append((start_x, start_y, x - start_x))
+        x, y = start_x - (previous_k == k - 1), start_y - (previous_k == k + 1)
+    if x > 0:
+        blocks.append((0, 0, x))
+    blocks.reverse()
+    return blocks
+
+
+def _diff_chars(original: str, modified: str, start: int, end: int, new_start: int, new_end: int) -> List[Hunk]:
+    """Character-level hunks for original[start:end] -> modified[new_start:new_end]"""
+    a = original[start:end]
+    b = modified[new_start:new_end]
+    blocks = None
+    if a and b and max(len(a), len(b)) <= DIFF_CHAR_LEVEL_MAX_CHARS:
+        blocks = myers_matching_blocks(a, b, DIFF_CHAR_LEVEL_MAX_EDITS)
+    if blocks is None:
+        return [[start, end, b]] if a or b else []
+    hunks = []
+    i = j = 0
+    for block_i, block_j, size in blocks + [(len(a), len(b), 0)]:
+        if block_i > i or block_j > j:
+            hunks.append([start + i, start + block_i, b[j:block_j]])
+        i, j = block_i + size, block_j + size
+    return hunks
+
+
+def _common_length(matches, limit: int) -> int:
+    """Largest size <= limit for which matches(size) holds (binary search over slice comparisons, done in C)"""
+    low, high = 0, limit
+    while low < high:
+        middle = (low + high + 1) // 2
+        if matches(middle):
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def diff_texts(original: str, modified: str) -> List[Hunk]:
+    """Edit script turning original into modified (see the module docstring)"""
+    # Common prefix and suffix
+    limit = min(len(original), len(modified))
+    prefix = _common_length(lambda size: original[:size] == modified[:size], limit)
+    suffix = _common_length(
+        lambda size: original[len(original) - size:] == modified[len(modified) - size:], limit - prefix
+    )
+    end, new_end = len(original) - suffix, len(modified) - suffix
+    if prefix == end and prefix == new_end:
+        return []
+
+    # Line pass over the middle, lines interned to ints
+    old_lines = original[prefix:end].splitlines(keepends=True)
+    new_lines = modified[prefix:new_end].splitlines(keepends=True)
+    interned = {}
+    a = [interned.setdefault(line, len(interned)) for line in old_lines]
+    b = [interned.setdefault(line, len(interned)) for line in new_lines]
+    blocks = myers_matching_blocks(a, b, DIFF_MAX_EDIT_DISTANCE)
+    if blocks is None:
+        # Too many changed lines for Myers: match lines heuristically (drops the sentinel block)
+        blocks = [tuple(block) for block in difflib.SequenceMatcher(None, a, b).get_matching_blocks()[:-1]]
+
+    # Character offsets of every line start
+    old_offsets = [prefix]
+    for line in old_lines:
+        old_offsets.append(old_offsets[-1] + len(line))
+    new_offsets = [prefix]
+    for line in new_lines:
+        new_offsets.append(new_offsets[-1] + len(line))
+
+    hunks = []
+    i = j = 0
+    for block_i, block_j, size in blocks + [(len(a), len(b), 0)]:
+        if block_i > i or block_j > j:
+            hunks += _diff_chars(
+                original, modified, old_offsets[i], old_offsets[block_i], new_offsets[j], new_offsets[block_j]
+            )
+        i, j = block_i + size, block_j + size
+    return hunks
+
+
+def apply_edit_script(original: str, edit_script: List[Hunk]) -> str:
+    """Apply an edit script to the original text"""
+    parts = []
+    position = 0
+    for start, end, inserted in edit_script:
+        parts.append(original[position:start])
+        parts.append(inserted)
+        position = end
+    parts.append(original[position:])
+    return "".join(parts)
+
+
+def fill_diff_metadata(problem):
+    """Compute and set a Problem's edit_script, changed_chars and min_key_strokes"""
+    problem.edit_script, problem.changed_chars, problem.min_key_strokes = diff_metadata(
+        problem.original_text, problem.modified_text
+    )
+
+
+def diff_metadata(original: str, modified: str) -> DiffMetadata:
+    """Edit script, changed characters and minimum keystrokes for a problem"""
+    edit_script = diff_texts(original, modified)
+    changed_chars = sum(end - start + len(inserted) for start, end, inserted in edit_script)
+    inserted_chars = set().union(*(inserted for _, _, inserted in edit_script))
+    min_key_strokes = max(int(bool(edit_script)), len(inserted_chars - set(original)))
+    return DiffMetadata(edit_script, changed_chars, min_key_strokes)
@@ -0,0 +1,105 @@
+"""
+Optional write-behind aggregation of histogram increments and sketch updates.
+
+With HISTOGRAM_WRITE_BEHIND enabled, attempts add their bin increments (and quantile
+sketch updates) to in-memory delta maps instead of writing to problem_histograms
+and problem_sketches. A background task
+merges and flushes the map every HISTOGRAM_FLUSH_INTERVAL_SECONDS (or sooner once
+HISTOGRAM_FLUSH_MAX_PENDING attempts are buffered), and once more on graceful
+shutdown. Histograms and percentiles may therefore lag by up to the flush interval,
+and buffered increments count towards the hourly window they are flushed in.
+"""
+import logging
+import os
+import threading
+from sqlalchemy.orm import Session
+from app.background import PeriodicTask
+from app.database import SessionLocal
+from app.histogram_windows import apply_window_deltas
+from app.histograms import HistogramDeltas, apply_histogram_deltas, merge_histogram_deltas
+from app.sketches import SketchDeltas, apply_sketch_deltas, merge_sketch_deltas
+
+logger = logging.getLogger(__name__)
+
+HISTOGRAM_WRITE_BEHIND = os.getenv("HISTOGRAM_WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+
+# Maximum staleness (seconds) of histograms when write-behind is enabled
+HISTOGRAM_FLUSH_INTERVAL_SECONDS = float(os.getenv("HISTOGRAM_FLUSH_INTERVAL_SECONDS", "2"))
+
+# Number of buffered attempts that triggers an early flush
+HISTOGRAM_FLUSH_MAX_PENDING = int(os.getenv("HISTOGRAM_FLUSH_MAX_PENDING", "1000"))
+
+
+class HistogramBuffer:
+    """Per-worker maps of pending histogram increments and sketch updates, flushed in one upsert each"""
+
+    def __init__(
+        self,
+        enabled: bool = HISTOGRAM_WRITE_BEHIND,
+        flush_interval_seconds: float = HISTOGRAM_FLUSH_INTERVAL_SECONDS,
+        max_pending: int = HISTOGRAM_FLUSH_MAX_PENDING,
+    ):
+        self.enabled = enabled
+        self.max_pending = max_pending
+        self._deltas: HistogramDeltas = {}
+        self._sketches: SketchDeltas = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._task = PeriodicTask("histogram-flush", flush_interval_seconds, self.flush)
+
+    def record(self, db: Session, deltas: HistogramDeltas, sketches: SketchDeltas, attempts: int = 1):
+        """
+        Record histogram increments and sketch updates for one attempt (or the merged updates of several).
+        Written immediately (as part of db's transaction) unless write-behind is enabled.
+        """
+        if not self.enabled:
+            apply_histogram_deltas(db, deltas)
+            apply_window_deltas(db, deltas)
+            apply_sketch_deltas(db, sketches)
+            return
+
+        with self._lock:
+            merge_histogram_deltas(self._deltas, deltas)
+            merge_sketch_deltas(self._sketches, sketches)
+            self._pending += attempts
+            pending = self._pending
+        if pending >= self.max_pending:
+            self._task.wake()
+
+    def flush(self):
+        """Write all buffered increments in one transaction"""
+        with self._lock:
+            deltas, self._deltas = self._deltas, {}
+            sketches, self._sketches = self._sketches, {}
+            pending, self._pending = self._pending, 0
+        if not deltas and not sketches:
+            return
+
+        db = SessionLocal()
+        try:
+            apply_histogram_deltas(db, deltas)
+            apply_window_deltas(db, deltas)
+            apply_sketch_deltas(db, sketches)
+            db.commit()
+        except Exception:
+            db.rollback()
+            # Put the increments back so the next flush retries them
+            with self._lock:
+                merge_histogram_deltas(self._deltas, deltas)
+                merge_sketch_deltas(self._sketches, sketches)
+                self._pending += pending
+            raise
+        finally:
+            db.close()
+
+    def start(self):
+        if self.enabled:
+            self._task.start()
+
+    def stop(self):
+        """Stop the flush task and flush whatever is still buffered"""
+        if self.enabled:
+            self._task.stop()
+
+
+histogram_buffer = HistogramBuffer()
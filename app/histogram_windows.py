@@ -0,0 +1,210 @@
+"""
+Time-windowed problem histograms ("how did people do this week").
+
+Every attempt's histogram increments are also added to the problem's row for the
+current UTC hour in problem_histogram_windows (same atomic upsert as the all-time
+histograms). A background compactor periodically:
+- rolls each complete day's hourly rows up into one daily row (recomputed from the
+  hourly rows, so reruns and concurrent workers are harmless),
+- prunes hourly rows older than HISTOGRAM_HOURLY_RETENTION_HOURS and daily rows
+  older than HISTOGRAM_DAILY_RETENTION_DAYS, in bounded batches.
+The all-time aggregate remains problem_histograms, updated live.
+
+A window query merges at most one row per day plus the hourly rows of the current
+day, element-wise in Postgres, with a single statement.
+"""
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+from sqlalchemy import and_, literal_column, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from app.background import PeriodicTask
+from app.batched_delete import delete_in_batches
+from app.database import SessionLocal
+from app.histograms import HistogramDeltas, merged_values_sql
+from app.models import HistogramDataType, HistogramGranularity, ProblemHistogramWindow
+
+logger = logging.getLogger(__name__)
+
+# How long hourly and daily windows are kept (hourly rows go a whole day at a time, once rolled up)
+HISTOGRAM_HOURLY_RETENTION_HOURS = int(os.getenv("HISTOGRAM_HOURLY_RETENTION_HOURS", "48"))
+HISTOGRAM_DAILY_RETENTION_DAYS = int(os.getenv("HISTOGRAM_DAILY_RETENTION_DAYS", "90"))
+
+HISTOGRAM_COMPACTION_INTERVAL_SECONDS = float(os.getenv("HISTOGRAM_COMPACTION_INTERVAL_SECONDS", "600"))
+
+# Old windows deleted per transaction by the compactor
+HISTOGRAM_WINDOW_PRUNE_BATCH_SIZE = int(os.getenv("HISTOGRAM_WINDOW_PRUNE_BATCH_SIZE", "1000"))
+
+# A day is rolled up once it ended this long ago (covers commits and write-behind flushes in flight)
+COMPACTION_GRACE = timedelta(minutes=5)
+
+WINDOWS_TABLE = ProblemHistogramWindow.__tablename__
+
+# Rows of the windows table that have a daily row for their day
+HAS_DAILY_ROW_SQL = f"""EXISTS (
+    SELECT 1 FROM {WINDOWS_TABLE} AS d
+    WHERE d.problem_id = w.problem_id AND d.data_type = w.data_type AND d.granularity = 'DAY'
+        AND d.window_start = date_trunc('day', w.window_start, 'UTC')
+)"""
+
+# Sum each complete day's hourly rows element-wise into its daily row, replacing it. Days
+# whose hourly rows may have been pruned already (before :hourly_cutoff) are left alone
+# unless they have no daily row yet.
+ROLL_UP_DAYS_SQL = text(f"""
+    INSERT INTO {WINDOWS_TABLE} (problem_id, data_type, granularity, window_start, "values")
+    SELECT problem_id, data_type, 'DAY', day, array_agg(total ORDER BY ord)
+    FROM (
+        SELECT w.problem_id, w.data_type, date_trunc('day', w.window_start, 'UTC') AS day, bins.ord, sum(bins.count) AS total
+        FROM {WINDOWS_TABLE} AS w, unnest(w."values") WITH ORDINALITY AS bins(count, ord)
+        WHERE w.granularity = 'HOUR' AND w.window_start < :complete_before
+            AND (w.window_start >= :hourly_cutoff OR NOT {HAS_DAILY_ROW_SQL})
+        GROUP BY w.problem_id, w.data_type, day, bins.ord
+    ) AS summed
+    GROUP BY problem_id, data_type, day
+    ON CONFLICT (problem_id, data_type, granularity, window_start) DO UPDATE SET "values" = excluded."values"
+""")
+
+# Element-wise sum of a problem's windows since :since. Daily rows cover rolled-up days,
+# hourly rows the days that aren't yet (always including today).
+WINDOWED_HISTOGRAMS_SQL = text(f"""
+    SELECT data_type, array_agg(total ORDER BY ord) AS counts
+    FROM (
+        SELECT w.data_type, bins.ord, sum(bins.count) AS total
+        FROM {WINDOWS_TABLE} AS w, unnest(w."values") WITH ORDINALITY AS bins(count, ord)
+        WHERE w.problem_id = :problem_id AND w.window_start >= :since AND CASE
+            WHEN :hours_only THEN w.granularity = 'HOUR'
+            ELSE w.granularity = 'DAY' OR NOT {HAS_DAILY_ROW_SQL}
+        END
+        GROUP BY w.data_type, bins.ord
+    ) AS summed
+    GROUP BY data_type
+""")
+
+
+def hour_start(moment: datetime) -> datetime:
+    return moment.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def day_start(moment: datetime) -> datetime:
+    return hour_start(moment).replace(hour=0)
+
+
+def apply_window_deltas(db: Session, deltas: HistogramDeltas, at: datetime = None):
+    """
+    Add histogram increments to the hourly windows containing `at` (default: now), with a
+    single INSERT ... ON CONFLICT statement (part of the caller's transaction).
+    """
+    if not deltas:
+        return
+    window_start = hour_start(at or datetime.now(timezone.utc))
+    rows = [
+        {
+            "problem_id": problem_id,
+            "data_type": data_type,
+            "granularity": HistogramGranularity.HOUR,
+            "window_start": window_start,
+            "values": counts,
+        }
+        for (problem_id, data_type), counts in sorted(deltas.items(), key=lambda item: (item[0][0], item[0][1].name))
+    ]
+    statement = insert(ProblemHistogramWindow).values(rows)
+    statement = statement.on_conflict_do_update(
+        index_elements=[
+            ProblemHistogramWindow.problem_id,
+            ProblemHistogramWindow.data_type,
+            ProblemHistogramWindow.granularity,
+            ProblemHistogramWindow.window_start,
+        ],
+        set_={"values": merged_values_sql(WINDOWS_TABLE)},
+    )
+    db.execute(statement)
+
+
+def load_windowed_histograms(db: Session, problem_id: int, since: datetime, hours_only: bool) -> Dict[HistogramDataType, List[int]]:
+    """
+    Merged histograms of the attempts at a problem since `since` (a day boundary, or an
+    hour boundary with hours_only), one statement. Data types without attempts are absent.
+    """
+    rows = db.execute(WINDOWED_HISTOGRAMS_SQL, {
+        "problem_id": problem_id,
+        "since": since,
+        "hours_only": hours_only,
+    }).all()
+    return {HistogramDataType[data_type]: counts for data_type, counts in rows}
+
+
+class HistogramCompactor:
+    """Periodically roll hourly histogram windows up into days and prune old windows"""
+
+    def __init__(
+        self,
+        interval_seconds: float = HISTOGRAM_COMPACTION_INTERVAL_SECONDS,
+        batch_size: int = HISTOGRAM_WINDOW_PRUNE_BATCH_SIZE,
+    ):
+        self.batch_size = batch_size
+        self._task = PeriodicTask("histogram-compactor", interval_seconds, self.run_once)
+        self.runs = 0
+        self.last_run_days = 0
+        self.last_run_pruned = 0
+
+    def run_once(self):
+        started = time.perf_counter()
+        now = datetime.now(timezone.utc)
+        complete_before = day_start(now - COMPACTION_GRACE)
+
+        # Hourly rows are pruned a whole day at a time, and only once the day is rolled up
+        hourly_cutoff = min(day_start(now - timedelta(hours=HISTOGRAM_HOURLY_RETENTION_HOURS)), complete_before)
+        daily_cutoff = day_start(now - timedelta(days=HISTOGRAM_DAILY_RETENTION_DAYS))
+
+        db = SessionLocal()
+        try:
+            rolled_up = db.execute(ROLL_UP_DAYS_SQL, {
+                "complete_before": complete_before,
+                "hourly_cutoff": hourly_cutoff,
+            }).rowcount
+            db.commit()
+        finally:
+            db.close()
+
+        windows = ProblemHistogramWindow.__table__.alias("w")
+        # The windows table has a composite key; batches are picked by physical row id
+        row_id = literal_column("w.ctid")
+        pruned = delete_in_batches(
+            windows,
+            row_id,
+            and_(
+                windows.c.granularity == HistogramGranularity.HOUR,
+                windows.c.window_start < hourly_cutoff,
+                text(HAS_DAILY_ROW_SQL),
+            ),
+            self.batch_size,
+        )
+        pruned += delete_in_batches(
+            windows,
+            row_id,
+            and_(windows.c.granularity == HistogramGranularity.DAY, windows.c.window_start < daily_cutoff),
+            self.batch_size,
+        )
+
+        self.runs += 1
+        self.last_run_days = rolled_up
+        self.last_run_pruned = pruned
+        logger.info(
+            f"Histogram compaction rolled up {rolled_up} daily windows and pruned {pruned} old windows "
+            f"in {time.perf_counter() - started:.2f}s"
+        )
+
+    def start(self):
+        self._task.start()
+
+    def stop(self):
+        self._task.stop(run_final=False)
+
+    def stats(self) -> dict:
+        return {"runs": self.runs, "last_run_days": self.last_run_days, "last_run_pruned": self.last_run_pruned}
+
+
+histogram_compactor = HistogramCompactor()
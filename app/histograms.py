@@ -0,0 +1,198 @@
+"""
+Histogram binning and atomic histogram updates for problem statistics.
+
+Histograms are stored as int4 arrays where each index is a bin and the value is the count.
+Each HistogramDataType has a HistogramSpec defining its bins:
+- Time: bin width = 2.5 seconds (bin 0 = 0-1.25s, bin 1 = 1.25-3.75s, bin 2 = 3.75-6.25s, etc.)
+- Strokes: bin width = 5 keystrokes (bin 0 = 0-2.5, bin 1 = 2.5-7.5, bin 2 = 7.5-12.5, etc.)
+- CCPM: bin width = 100 (bin 0 = 0-50, bin 1 = 50-150, bin 2 = 150-250, etc.)
+Only the first 25 bars (indices 0-24) are stored; values beyond them are dropped.
+
+Every spec bins one value at a time (live attempts) or whole NumPy arrays at once
+(rebuilds and synthetic data); both paths produce identical bins.
+"""
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from app.models import ProblemHistogram, HistogramDataType
+
+MAX_BARS = 25  # Maximum number of bars to store (indices 0-24)
+
+
+@dataclass(frozen=True)
+class HistogramSpec:
+    """
+    Bins of one histogram: bin 0 covers [0, offset], bin 1 the half bin above it, and
+    bin i >= 2 is centered on offset + (i - 1) * bin_width (ties round to even). Values
+    past the last of `bars` bars are dropped, or counted in the last bar when
+    clamp_overflow is set.
+    """
+    bin_width: float
+    offset: float
+    bars: int = MAX_BARS
+    clamp_overflow: bool = False
+
+    def bin_index(self, value: float) -> Optional[int]:
+        """Bin of a single value, or None if it is dropped"""
+        if value <= self.offset:
+            return 0
+        position = (value - self.offset) / self.bin_width
+        # `not <` also catches infinity and NaN, which can't be rounded to an int
+        if not position < self.bars or int(round(position)) + 1 >= self.bars:
+            return self.bars - 1 if self.clamp_overflow else None
+        return int(round(position)) + 1
+
+    def bin_indices(self, values: np.ndarray) -> np.ndarray:
+        """Bins of many values at once; dropped values get -1"""
+        values = np.asarray(values, dtype=np.float64)
+        # np.rint rounds half to even, like round() in bin_index; fmin caps huge values
+        # (and NaN) at the overflow position before the integer conversion
+        positions = np.fmin(np.rint((values - self.offset) / self.bin_width) + 1, self.bars)
+        indices = np.where(values <= self.offset, 0, positions).astype(np.int64)
+        overflow = indices >= self.bars
+        indices[overflow] = self.bars - 1 if self.clamp_overflow else -1
+        return indices
+
+    def bin_counts(self, values: np.ndarray) -> np.ndarray:
+        """Histogram (length `bars`) of many values"""
+        indices = self.bin_indices(values)
+        return np.bincount(indices[indices >= 0], minlength=self.bars)
+
+    def grouped_bin_counts(self, group_ids: np.ndarray, values: np.ndarray) -> Dict[int, np.ndarray]:
+        """Histograms of many values belonging to several groups (e.g. problems): group id -> counts"""
+        groups, group_indices = np.unique(np.asarray(group_ids), return_inverse=True)
+        indices = self.bin_indices(values)
+        kept = indices >= 0
+        flat = np.bincount(
+            group_indices[kept] * self.bars + indices[kept], minlength=len(groups) * self.bars
+        ).reshape(len(groups), self.bars)
+        return {int(group): flat[position] for position, group in enumerate(groups)}
+
+
+def centered_spec(bin_width: float) -> HistogramSpec:
+    """Spec whose first bar covers half a bin width"""
+    return HistogramSpec(bin_width=bin_width, offset=bin_width / 2.0)
+
+
+HISTOGRAM_SPECS = {
+    HistogramDataType.TIME: centered_spec(2.5),       # 2.5 seconds
+    HistogramDataType.STROKES: centered_spec(5.0),    # 5 keystrokes
+    HistogramDataType.CCPM: centered_spec(100.0),     # 100 CCPM
+}
+
+# Pending increments: (problem_id, data_type) -> per-bin counts to add
+HistogramDeltas = Dict[Tuple[int, HistogramDataType], List[int]]
+
+
+def merged_values_sql(table: str):
+    """
+    Element-wise sum of the stored array and the incoming delta array, for the
+    ON CONFLICT clause of an upsert into `table`.
+    unnest() pads the shorter array with NULLs, so histograms grow to fit the delta.
+    """
+    return text(
+        '(SELECT array_agg(coalesce(merged.old, 0) + coalesce(merged.delta, 0) ORDER BY merged.ord) '
+        f'FROM unnest({table}."values", excluded."values") WITH ORDINALITY AS merged(old, delta, ord))'
+    )
+
+
+MERGED_VALUES_SQL = merged_values_sql("problem_histograms")
+
+
+def add_histogram_value(deltas: HistogramDeltas, problem_id: int, data_type: HistogramDataType, value: float):
+    """
+    Record one value in a pending delta map.
+    Values that would land beyond the last bar are ignored.
+    """
+    bin_index = HISTOGRAM_SPECS[data_type].bin_index(value)
+    if bin_index is None:
+        return  # Ignore this value
+
+    counts = deltas.setdefault((problem_id, data_type), [])
+    if len(counts) <= bin_index:
+        counts.extend([0] * (bin_index + 1 - len(counts)))
+    counts[bin_index] += 1
+
+
+def trimmed_counts(counts: np.ndarray) -> List[int]:
+    """Counts as stored: trailing empty bars are left off, like histograms grown by add_histogram_value"""
+    nonzero = np.flatnonzero(counts)
+    return counts[:nonzero[-1] + 1].tolist() if len(nonzero) else []
+
+
+def add_histogram_values(
+    deltas: HistogramDeltas,
+    data_type: HistogramDataType,
+    problem_ids: np.ndarray,
+    values: np.ndarray,
+):
+    """Record many values (of one data type, for any problems) in a pending delta map, vectorized"""
+    source: HistogramDeltas = {}
+    for problem_id, counts in HISTOGRAM_SPECS[data_type].grouped_bin_counts(problem_ids, values).items():
+        counts = trimmed_counts(counts)
+        if counts:
+            source[(problem_id, data_type)] = counts
+    merge_histogram_deltas(deltas, source)
+
+
+def merge_histogram_deltas(target: HistogramDeltas, source: HistogramDeltas):
+    """Add every count in source into target (in place)"""
+    for key, counts in source.items():
+        merged = target.setdefault(key, [])
+        if len(merged) < len(counts):
+            merged.extend([0] * (len(counts) - len(merged)))
+        for index, count in enumerate(counts):
+            merged[index] += count
+
+
+def add_attempt_values(deltas: HistogramDeltas, problem_id: int, time_seconds: float, key_strokes: int, ccpm: float):
+    """Record one attempt's TIME, STROKES and CCPM values in a pending delta map"""
+    add_histogram_value(deltas, problem_id, HistogramDataType.TIME, time_seconds)
+    add_histogram_value(deltas, problem_id, HistogramDataType.STROKES, float(key_strokes))
+    add_histogram_value(deltas, problem_id, HistogramDataType.CCPM, ccpm)
+
+
+def add_attempt_arrays(
+    deltas: HistogramDeltas,
+    problem_ids: np.ndarray,
+    time_seconds: np.ndarray,
+    key_strokes: np.ndarray,
+    ccpm: np.ndarray,
+):
+    """Record many attempts' TIME, STROKES and CCPM values in a pending delta map, vectorized"""
+    add_histogram_values(deltas, HistogramDataType.TIME, problem_ids, time_seconds)
+    add_histogram_values(deltas, HistogramDataType.STROKES, problem_ids, key_strokes)
+    add_histogram_values(deltas, HistogramDataType.CCPM, problem_ids, ccpm)
+
+
+def attempt_histogram_deltas(problem_id: int, time_seconds: float, key_strokes: int, ccpm: float) -> HistogramDeltas:
+    """Build the histogram increments for a single attempt (TIME, STROKES and CCPM)"""
+    deltas: HistogramDeltas = {}
+    add_attempt_values(deltas, problem_id, time_seconds, key_strokes, ccpm)
+    return deltas
+
+
+def apply_histogram_deltas(db: Session, deltas: HistogramDeltas):
+    """
+    Add pending increments to the stored histograms in a single INSERT ... ON CONFLICT statement.
+    Missing histograms are created from their delta; existing ones have the delta added
+    element-wise by Postgres, so concurrent updates never lose counts and no array is
+    read back into Python. Rows are written in a fixed order to avoid deadlocks between
+    concurrent multi-row upserts.
+    """
+    if not deltas:
+        return
+
+    rows = [
+        {"problem_id": problem_id, "data_type": data_type, "values": counts}
+        for (problem_id, data_type), counts in sorted(deltas.items(), key=lambda item: (item[0][0], item[0][1].name))
+    ]
+    statement = insert(ProblemHistogram).values(rows)
+    statement = statement.on_conflict_do_update(
+        constraint="uq_problem_histogram",
+        set_={"values": MERGED_VALUES_SQL},
+    )
+    db.execute(statement)
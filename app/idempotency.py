@@ -0,0 +1,93 @@
+"""
+Idempotency keys for batched attempt submissions.
+
+Each attempt in POST /api/attempts/batch carries a client-chosen key. Keys are
+claimed with INSERT ... ON CONFLICT DO NOTHING RETURNING in the same transaction
+that stores the attempts, so an attempt is counted exactly once no matter how often
+the client retries (a concurrent retry waits for the first transaction, then finds
+the key taken). Keys are kept for ATTEMPT_IDEMPOTENCY_KEY_TTL_SECONDS, then pruned.
+
+Keys are scoped to the submitting user, so one user's keys can never make another
+user's attempts look like duplicates. Anonymous submissions share a separate namespace:
+they only update histograms, and a client reusing another anonymous client's key can
+at worst keep that anonymous attempt out of them.
+"""
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Optional, Set
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from app.background import PeriodicTask
+from app.batched_delete import delete_in_batches
+from app.models import AttemptIdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+# How long a key protects against double counting, i.e. the longest supported retry delay
+ATTEMPT_IDEMPOTENCY_KEY_TTL_SECONDS = float(os.getenv("ATTEMPT_IDEMPOTENCY_KEY_TTL_SECONDS", str(7 * 24 * 3600)))
+
+PRUNE_INTERVAL_SECONDS = 3600
+
+# Expired keys deleted per transaction by the pruner
+ATTEMPT_IDEMPOTENCY_KEY_PRUNE_BATCH_SIZE = int(os.getenv("ATTEMPT_IDEMPOTENCY_KEY_PRUNE_BATCH_SIZE", "1000"))
+
+
+def claim_keys(db: Session, keys: Iterable[str], user_id: Optional[int]) -> Set[str]:
+    """
+    Record a user's keys (user_id None: anonymous) as used, part of the caller's transaction,
+    and return the ones that user had not used before. Keys are inserted in sorted order to
+    avoid deadlocks between overlapping batches.
+    """
+    rows = [{"key": key, "user_id": user_id} for key in sorted(set(keys))]
+    if not rows:
+        return set()
+    # Only a conflict within the caller's namespace makes a key a duplicate
+    if user_id is None:
+        conflict = {"index_elements": [AttemptIdempotencyKey.key], "index_where": AttemptIdempotencyKey.user_id.is_(None)}
+    else:
+        conflict = {
+            "index_elements": [AttemptIdempotencyKey.user_id, AttemptIdempotencyKey.key],
+            "index_where": AttemptIdempotencyKey.user_id.is_not(None),
+        }
+    statement = (
+        insert(AttemptIdempotencyKey).values(rows).on_conflict_do_nothing(**conflict).returning(AttemptIdempotencyKey.key)
+    )
+    return set(db.execute(statement).scalars())
+
+
+class IdempotencyKeyPruner:
+    """Periodically delete idempotency keys older than ATTEMPT_IDEMPOTENCY_KEY_TTL_SECONDS"""
+
+    def __init__(
+        self,
+        interval_seconds: float = PRUNE_INTERVAL_SECONDS,
+        batch_size: int = ATTEMPT_IDEMPOTENCY_KEY_PRUNE_BATCH_SIZE,
+    ):
+        self.batch_size = batch_size
+        self._task = PeriodicTask("idempotency-key-pruner", interval_seconds, self.run_once)
+        self.last_run_rows = 0
+        self.total_rows = 0
+
+    def run_once(self) -> int:
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=ATTEMPT_IDEMPOTENCY_KEY_TTL_SECONDS)
+        deleted = delete_in_batches(
+            AttemptIdempotencyKey, AttemptIdempotencyKey.id,
+            AttemptIdempotencyKey.created_at < cutoff, self.batch_size
+        )
+        self.last_run_rows = deleted
+        self.total_rows += deleted
+        logger.info(f"Pruned {deleted} expired attempt idempotency keys")
+        return deleted
+
+    def start(self):
+        self._task.start()
+
+    def stop(self):
+        self._task.stop(run_final=False)
+
+    def stats(self) -> dict:
+        return {"last_run_rows": self.last_run_rows, "total_rows": self.total_rows}
+
+
+idempotency_key_pruner = IdempotencyKeyPruner()
@@ -0,0 +1,142 @@
+"""
+Per-problem leaderboards (best time, fewest keystrokes, highest CCPM).
+
+Leaderboards are read from user_problem_best, the per-user rollup every stored
+attempt already updates, through one composite index per metric
+(problem_id, best value, user_id), so a page is an index range scan of its own rows
+no matter how many attempts or users a problem has.
+
+Each worker caches the top LEADERBOARD_TOP_N rows per problem and metric for
+LEADERBOARD_CACHE_TTL_SECONDS (and drops them when it stores an attempt for the
+problem). Pages beyond the cached rows use keyset pagination: the cursor carries
+the last row's value, user id and rank, so a page never counts or skips the rows
+above it.
+"""
+import os
+from typing import List, NamedTuple, Optional, Tuple
+from sqlalchemy import or_, select
+from sqlalchemy.orm import Session
+from app.cache import LRUCache
+from app.models import HistogramDataType, User, UserProblemBest
+
+# Rows cached per problem and metric (also the size of the first pages served without a query)
+LEADERBOARD_TOP_N = int(os.getenv("LEADERBOARD_TOP_N", "100"))
+
+# How long a cached top N may be served (other workers' attempts show up after at most this long)
+LEADERBOARD_CACHE_TTL_SECONDS = float(os.getenv("LEADERBOARD_CACHE_TTL_SECONDS", "5"))
+LEADERBOARD_CACHE_MAX_ENTRIES = int(os.getenv("LEADERBOARD_CACHE_MAX_ENTRIES", "10000"))
+
+LEADERBOARD_MAX_PAGE_SIZE = 100
+
+# Metric -> (column, True if higher is better)
+LEADERBOARD_COLUMNS = {
+    HistogramDataType.TIME: (UserProblemBest.best_time, False),
+    HistogramDataType.STROKES: (UserProblemBest.best_key_strokes, False),
+    HistogramDataType.CCPM: (UserProblemBest.best_ccpm, True),
+}
+
+
+class LeaderboardRow(NamedTuple):
+    rank: int  # 1-based position (ties are ordered by user id)
+    user_id: int
+    username: str
+    value: float
+
+
+class Cursor(NamedTuple):
+    """Position after the last row of a page"""
+    rank: int
+    user_id: int
+    value: float
+
+    def encode(self) -> str:
+        return f"{self.rank}:{self.user_id}:{self.value!r}"
+
+    @classmethod
+    def decode(cls, cursor: str) -> "Cursor":
+        """Parse a cursor from a previous page; raises ValueError if it is malformed"""
+        rank, user_id, value = cursor.split(":", 2)
+        return cls(int(rank), int(user_id), float(value))
+
+    @classmethod
+    def after(cls, row: LeaderboardRow) -> "Cursor":
+        return cls(row.rank, row.user_id, row.value)
+
+
+def load_leaderboard_rows(
+    db: Session, problem_id: int, metric: HistogramDataType, after: Optional[Cursor], limit: int
+) -> List[LeaderboardRow]:
+    """Fetch up to `limit` rows following `after` (from the top without it), one index range scan"""
+    column, descending = LEADERBOARD_COLUMNS[metric]
+    query = (
+        select(UserProblemBest.user_id, User.username, column)
+        .join(User, User.id == UserProblemBest.user_id)
+        .where(UserProblemBest.problem_id == problem_id)
+        .order_by(column.desc() if descending else column, UserProblemBest.user_id)
+        .limit(limit)
+    )
+    if after is not None:
+        # The non-strict bound on the value alone is what lets the index scan start at the cursor
+        if descending:
+            query = query.where(column <= after.value, or_(column < after.value, UserProblemBest.user_id > after.user_id))
+        else:
+            query = query.where(column >= after.value, or_(column > after.value, UserProblemBest.user_id > after.user_id))
+    start = after.rank if after is not None else 0
+    return [
+        LeaderboardRow(start + position, user_id, username, float(value))
+        for position, (user_id, username, value) in enumerate(db.execute(query).all(), start=1)
+    ]
+
+
+class LeaderboardCache:
+    """Per-worker cache of each problem's top rows per metric"""
+
+    def __init__(
+        self,
+        top_n: int = LEADERBOARD_TOP_N,
+        ttl_seconds: float = LEADERBOARD_CACHE_TTL_SECONDS,
+        max_entries: int = LEADERBOARD_CACHE_MAX_ENTRIES,
+    ):
+        self.top_n = top_n
+        self._cache = LRUCache(max_entries, ttl_seconds=ttl_seconds)
+
+    def _top(self, db: Session, problem_id: int, metric: HistogramDataType) -> List[LeaderboardRow]:
+        top = self._cache.get((problem_id, metric))
+        if top is None:
+            top = load_leaderboard_rows(db, problem_id, metric, None, self.top_n)
+            self._cache.put((problem_id, metric), top)
+        return top
+
+    def page(
+        self, db: Session, problem_id: int, metric: HistogramDataType, after: Optional[Cursor], limit: int
+    ) -> Tuple[List[LeaderboardRow], Optional[Cursor]]:
+        """
+        Return a page of up to `limit` rows after the cursor, and the cursor of the next page
+        (None on the last page). Served from the cached top rows when they cover the page.
+        """
+        top = self._top(db, problem_id, metric)
+        start = after.rank if after is not None else 0
+        complete = len(top) < self.top_n
+        cursor_matches = after is None or (
+            0 < start <= len(top) and (top[start - 1].user_id, top[start - 1].value) == (after.user_id, after.value)
+        )
+        if cursor_matches and (start + limit < len(top) or complete):
+            rows = top[start:start + limit]
+            has_more = start + limit < len(top)
+        else:
+            # One extra row tells whether there is a next page
+            rows = load_leaderboard_rows(db, problem_id, metric, after, limit + 1)
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+        return rows, Cursor.after(rows[-1]) if has_more else None
+
+    def forget(self, problem_id: int):
+        """Drop a problem's cached leaderboards (after storing an attempt for it)"""
+        for metric in LEADERBOARD_COLUMNS:
+            self._cache.pop((problem_id, metric))
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+
+leaderboard_cache = LeaderboardCache()
@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, Text, Float, DateTime, ForeignKey, Enum as SQLEnum, UniqueConstraint
-from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy import Column, Integer, BigInteger, String, Text, Float, DateTime, ForeignKey, Enum as SQLEnum, Index, UniqueConstraint
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
@@ -27,19 +27,30 @@ class Problem(Base):
     original_text = Column(Text, nullable=False)
     modified_text = Column(Text, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Diff metadata (app/diffing.py), filled in on insert and update; NULL until backfilled
+    edit_script = Column(JSONB, nullable=True)  # [[start, end, inserted], ...]
+    changed_chars = Column(Integer, nullable=True)  # Characters deleted plus inserted
+    min_key_strokes = Column(Integer, nullable=True)  # Lower bound on an attempt's keystrokes
+    # Set by import_problems.py: the problem's identity in the import source, and a hash of its content
+    import_key = Column(String(255), nullable=True)
+    content_hash = Column(String(64), nullable=True)
 
     # Relationships
     attempts = relationship("Attempt", back_populates="problem")
     histograms = relationship("ProblemHistogram", back_populates="problem", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        Index("ix_problems_import_key", "import_key", unique=True),
+    )
+
 
 class Session(Base):
     __tablename__ = "sessions"
 
     session_id = Column(String(255), primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    last_accessed_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)  # Absolute expiry
+    last_accessed_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), index=True)  # Idle expiry
 
     # Relationships
     user = relationship("User", back_populates="sessions")
@@ -57,7 +68,7 @@ class ProblemHistogram(Base):
     id = Column(Integer, primary_key=True, index=True)
     problem_id = Column(Integer, ForeignKey("problems.id"), nullable=False, index=True)
     data_type = Column(SQLEnum(HistogramDataType), nullable=False, index=True)
-    values = Column(ARRAY(Float), nullable=False, default=[])  # Array of float values
+    values = Column(ARRAY(Integer), nullable=False, default=[])  # Attempt count per bin (int4[], see migrate.py)
     
     # Relationships
     problem = relationship("Problem", back_populates="histograms")
@@ -67,6 +78,40 @@ class ProblemHistogram(Base):
     )
 
 
+class HistogramGranularity(enum.Enum):
+    HOUR = "hour"
+    DAY = "day"
+
+
+class ProblemHistogramWindow(Base):
+    """
+    Histogram counts of the attempts made during one hour or one day (UTC).
+    Hourly rows are written live; daily rows are rolled up from them by the
+    histogram compactor (app/histogram_windows.py), which also prunes old rows.
+    """
+    __tablename__ = "problem_histogram_windows"
+
+    problem_id = Column(Integer, ForeignKey("problems.id"), primary_key=True)
+    data_type = Column(SQLEnum(HistogramDataType), primary_key=True)
+    granularity = Column(SQLEnum(HistogramGranularity), primary_key=True)
+    window_start = Column(DateTime(timezone=True), primary_key=True)
+    values = Column(ARRAY(Integer), nullable=False, default=[])  # Attempt count per bin
+
+    __table_args__ = (
+        Index("ix_problem_histogram_windows_granularity_start", "granularity", "window_start"),
+    )
+
+
+class ProblemSketch(Base):
+    """Quantile sketch (see app/sketches.py) of every attempt's value of one metric for a problem"""
+    __tablename__ = "problem_sketches"
+
+    problem_id = Column(Integer, ForeignKey("problems.id"), primary_key=True)
+    metric = Column(SQLEnum(HistogramDataType), primary_key=True)
+    zero_count = Column(BigInteger, nullable=False, default=0)  # Values too small to index
+    counts = Column(JSONB, nullable=False, default=dict)  # Bucket key -> count
+
+
 class Attempt(Base):
     __tablename__ = "attempts"
 
@@ -82,3 +127,70 @@ class Attempt(Base):
     user = relationship("User", back_populates="attempts")
     problem = relationship("Problem", back_populates="attempts")
 
+    # A user's attempt history in order (keyset pagination and exports)
+    __table_args__ = (
+        Index("ix_attempts_user_created_id", "user_id", "created_at", "id"),
+    )
+
+
+class AttemptIdempotencyKey(Base):
+    """
+    Client-supplied keys of attempts already stored by POST /api/attempts/batch,
+    so retried submissions are not counted twice. Pruned after a retention period.
+    Keys are unique per user; anonymous submissions share one namespace of their own.
+    """
+    __tablename__ = "attempt_idempotency_keys"
+
+    id = Column(BigInteger, primary_key=True)
+    key = Column(String(128), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)  # NULL: anonymous
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False, index=True)
+
+    __table_args__ = (
+        Index("ix_attempt_idempotency_keys_user_key", "user_id", "key", unique=True,
+              postgresql_where=user_id.is_not(None)),
+        Index("ix_attempt_idempotency_keys_anonymous_key", "key", unique=True, postgresql_where=user_id.is_(None)),
+    )
+
+
+class RevokedToken(Base):
+    """
+    Signed session tokens ended by logout before they expire (see app/tokens.py).
+    Rows can be deleted once the token has expired.
+    """
+    __tablename__ = "revoked_tokens"
+
+    token_id = Column(String(64), primary_key=True)
+    expires_at = Column(DateTime(timezone=True), nullable=True, index=True)  # NULL: the token never expires
+
+
+class UserProblemBest(Base):
+    """
+    Each user's best results per problem, maintained incrementally as attempts are stored.
+    The three bests are tracked independently (they may come from different attempts).
+    """
+    __tablename__ = "user_problem_best"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    problem_id = Column(Integer, ForeignKey("problems.id"), primary_key=True)
+    best_time = Column(Float, nullable=False)  # Minimum time_seconds
+    best_key_strokes = Column(Integer, nullable=False)  # Minimum key_strokes
+    best_ccpm = Column(Float, nullable=False)  # Maximum ccpm
+
+    # Leaderboards: each page is a range scan in ranking order (ties by user id)
+    __table_args__ = (
+        Index("ix_user_problem_best_time", "problem_id", "best_time", "user_id"),
+        Index("ix_user_problem_best_key_strokes", "problem_id", "best_key_strokes", "user_id"),
+        Index("ix_user_problem_best_ccpm", "problem_id", best_ccpm.desc(), "user_id"),
+    )
+
+
+class VersionCounter(Base):
+    """
+    Named, monotonically increasing counters shared by all workers.
+    Workers compare them against the value they last saw to invalidate in-process caches.
+    """
+    __tablename__ = "version_counters"
+
+    name = Column(String(64), primary_key=True)
+    value = Column(BigInteger, nullable=False, default=0)
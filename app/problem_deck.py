@@ -0,0 +1,95 @@
+"""
+Per-session shuffled decks of problems for /api/problems/batch.
+
+Each session gets its own random permutation of the catalog's ID pool and is dealt
+problems from it in order, so it sees every problem once before any repeats; when
+the deck runs out (or the catalog changes) it is reshuffled.
+
+The permutation is a Fisher-Yates shuffle performed lazily: dealing the i-th card
+swaps a random not-yet-dealt position into slot i, and only the slots that were
+swapped are stored. Creating a deck is O(1) and dealing N cards is O(N), whatever
+the catalog size; a deck holds at most one entry per card dealt.
+"""
+import os
+import random
+import threading
+from typing import Dict, List, Set
+from app.cache import LRUCache
+
+# How long an idle session's deck is kept (a later batch starts a fresh shuffle)
+PROBLEM_DECK_TTL_SECONDS = float(os.getenv("PROBLEM_DECK_TTL_SECONDS", "3600"))
+PROBLEM_DECK_MAX_SESSIONS = int(os.getenv("PROBLEM_DECK_MAX_SESSIONS", "10000"))
+
+# Largest batch a single request may ask for
+PROBLEM_BATCH_MAX_COUNT = int(os.getenv("PROBLEM_BATCH_MAX_COUNT", "100"))
+
+
+class ShuffledDeck:
+    """A lazily shuffled permutation of an ID pool, dealt from the front"""
+
+    def __init__(self, pool: List[int], rng: random.Random):
+        self.pool = pool
+        self.dealt = 0
+        self._rng = rng
+        self._swapped: Dict[int, int] = {}  # position -> ID, where it differs from pool[position]
+
+    def remaining(self) -> int:
+        return len(self.pool) - self.dealt
+
+    def deal(self) -> int:
+        """Deal the next card (the deck must not be exhausted)"""
+        position = self.dealt
+        chosen = self._rng.randrange(position, len(self.pool))
+        card = self._swapped.get(chosen, self.pool[chosen])
+        if chosen != position:
+            self._swapped[chosen] = self._swapped.get(position, self.pool[position])
+        # Slot `position` is never read again
+        self._swapped.pop(position, None)
+        self.dealt += 1
+        return card
+
+
+class ProblemDecks:
+    """Per-worker decks keyed by session"""
+
+    def __init__(
+        self,
+        ttl_seconds: float = PROBLEM_DECK_TTL_SECONDS,
+        max_sessions: int = PROBLEM_DECK_MAX_SESSIONS,
+    ):
+        self._decks = LRUCache(max_sessions, ttl_seconds=ttl_seconds)
+        self._lock = threading.Lock()
+        self._rng = random.Random()
+        self.reshuffles = 0
+
+    def deal(self, session_key: str, pool: List[int], count: int, exclude: Set[int] = frozenset()) -> List[int]:
+        """
+        Deal up to `count` distinct IDs (fewer only if the pool is smaller) from the session's
+        deck, skipping `exclude`. The deck is reshuffled when it runs out or the pool changed.
+        """
+        count = min(count, len(pool) - len(exclude))
+        cards: List[int] = []
+        if count <= 0:
+            return cards
+        with self._lock:
+            deck = self._decks.get(session_key)
+            if deck is None or deck.pool is not pool:
+                deck = ShuffledDeck(pool, self._rng)
+            seen = set(exclude)
+            while len(cards) < count:
+                if not deck.remaining():
+                    # A new round; cards already in this batch are skipped so it stays distinct
+                    deck = ShuffledDeck(pool, self._rng)
+                    self.reshuffles += 1
+                card = deck.deal()
+                if card not in seen:
+                    seen.add(card)
+                    cards.append(card)
+            self._decks.put(session_key, deck)
+        return cards
+
+    def stats(self) -> dict:
+        return {"reshuffles": self.reshuffles, **self._decks.stats()}
+
+
+problem_decks = ProblemDecks()
@@ -0,0 +1,93 @@
+"""
+In-memory pool of problem IDs used to pick random problems.
+
+Instead of running ORDER BY random() over the whole problems table, each worker
+keeps a dense list of problem IDs, picks one uniformly in O(1) and then loads
+only that row by primary key.
+"""
+import random
+import threading
+from typing import Callable, List, Optional, TypeVar
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from app.catalog import catalog_version
+from app.models import Problem
+
+# How many times to retry when the picked ID no longer exists (deleted elsewhere)
+MAX_PICK_ATTEMPTS = 3
+
+T = TypeVar("T")
+
+
+def load_problem(db: Session, problem_id: int) -> Optional[Problem]:
+    return db.get(Problem, problem_id)
+
+
+class ProblemIdPool:
+    """
+    Dense list of problem IDs for uniform random selection.
+    The pool is reloaded whenever the catalog version changes (see app.catalog), and the
+    list is replaced as a whole, so readers never see a partial pool.
+    """
+
+    def __init__(self):
+        self._ids: List[int] = []
+        self._version: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        """Force the next pick to reload the pool from the database"""
+        self._version = None
+        catalog_version.invalidate()
+
+    def refresh(self, db: Session, version: Optional[int] = None):
+        """
+        Reload all problem IDs.
+        Only the primary key is selected, so Postgres can answer from the index
+        without touching the large text columns.
+        """
+        ids = list(db.execute(select(Problem.id)).scalars())
+        self._ids = ids
+        self._version = version
+
+    def get_ids(self, db: Session) -> List[int]:
+        """Return the current pool, reloading it first if the catalog version changed"""
+        version = catalog_version.current(db)
+        if version != self._version:
+            # Only one caller reloads; the others keep picking from the previous pool.
+            # Never block on the lock while it is held across a query (see CounterWatcher).
+            if self._lock.acquire(blocking=False):
+                try:
+                    self.refresh(db, version)
+                finally:
+                    self._lock.release()
+            elif not self._ids:
+                self.refresh(db, version)  # Nothing to fall back on yet
+        return self._ids
+
+    def pick_id(self, db: Session) -> Optional[int]:
+        """Pick a problem ID uniformly at random, or None if there are no problems"""
+        ids = self.get_ids(db)
+        if not ids:
+            return None
+        return random.choice(ids)
+
+    def pick(self, db: Session, load: Callable[[Session, int], Optional[T]] = load_problem) -> Optional[T]:
+        """
+        Pick a random problem and load it with `load` (by primary key by default).
+        If the picked problem was deleted by another worker, the pool is reloaded and
+        the pick is retried, so every returned problem is chosen uniformly from the
+        problems that currently exist.
+        """
+        for _ in range(MAX_PICK_ATTEMPTS):
+            problem_id = self.pick_id(db)
+            if problem_id is None:
+                return None
+            problem = load(db, problem_id)
+            if problem is not None:
+                return problem
+            self.invalidate()
+        return None
+
+
+problem_pool = ProblemIdPool()
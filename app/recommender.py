@@ -0,0 +1,278 @@
+"""
+Per-user weighted choice of the next problem to practice.
+
+Every problem falls into one weight class for a user:
+- NEW: never attempted (RECOMMENDER_WEIGHT_NEW)
+- BEHIND: best time more than RECOMMENDER_BEHIND_FACTOR times the problem's median
+  time (RECOMMENDER_WEIGHT_BEHIND)
+- AVERAGE: best time above the median, or no median known yet (weight 1)
+- MASTERED: best time at or below the median (RECOMMENDER_WEIGHT_MASTERED)
+
+Each worker keeps, per recently active user, the attempted problems grouped by class
+in dense arrays with an index map (O(1) insert, move and uniform pick), built from
+the user's user_problem_best rows with one query. A pick chooses a class with
+probability proportional to weight x size (a handful of classes), then a problem
+uniformly within it, so its cost depends on neither the catalog size nor the user's
+history. NEW problems are drawn from the catalog's ID pool by rejection while most
+problems are unattempted, and from an explicit list of the few remaining ones
+otherwise.
+
+Attempts stored by this worker move the problem to its new class immediately; a
+user's state is rebuilt after RECOMMENDER_STATE_TTL_SECONDS to pick up attempts
+stored elsewhere. Median times come from the problems' quantile sketches, reloaded
+in the background every RECOMMENDER_MEDIAN_REFRESH_SECONDS.
+"""
+import enum
+import logging
+import os
+import random
+import threading
+from typing import Dict, Hashable, List, Optional
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from app.background import PeriodicTask
+from app.cache import LRUCache
+from app.database import SessionLocal
+from app.models import HistogramDataType, ProblemSketch, UserProblemBest
+from app.sketches import DDSketch, SKETCH_RELATIVE_ACCURACY
+
+logger = logging.getLogger(__name__)
+
+RECOMMENDER_WEIGHT_NEW = float(os.getenv("RECOMMENDER_WEIGHT_NEW", "4"))
+RECOMMENDER_WEIGHT_BEHIND = float(os.getenv("RECOMMENDER_WEIGHT_BEHIND", "3"))
+RECOMMENDER_WEIGHT_MASTERED = float(os.getenv("RECOMMENDER_WEIGHT_MASTERED", "0.25"))
+
+# A best time this many times the median (or more) counts as far behind
+RECOMMENDER_BEHIND_FACTOR = float(os.getenv("RECOMMENDER_BEHIND_FACTOR", "1.5"))
+
+RECOMMENDER_STATE_TTL_SECONDS = float(os.getenv("RECOMMENDER_STATE_TTL_SECONDS", "600"))
+RECOMMENDER_STATE_MAX_USERS = int(os.getenv("RECOMMENDER_STATE_MAX_USERS", "10000"))
+RECOMMENDER_MEDIAN_REFRESH_SECONDS = float(os.getenv("RECOMMENDER_MEDIAN_REFRESH_SECONDS", "300"))
+
+# Draw NEW problems by rejection from the catalog while at least this share is unattempted
+# (at most 1 / share expected draws); below it, keep an explicit list of them
+REJECTION_MIN_NEW_SHARE = 0.1
+MAX_REJECTION_DRAWS = 64
+
+
+class WeightClass(enum.Enum):
+    NEW = "new"
+    BEHIND = "behind"
+    AVERAGE = "average"
+    MASTERED = "mastered"
+
+
+CLASS_WEIGHTS = {
+    WeightClass.NEW: RECOMMENDER_WEIGHT_NEW,
+    WeightClass.BEHIND: RECOMMENDER_WEIGHT_BEHIND,
+    WeightClass.AVERAGE: 1.0,
+    WeightClass.MASTERED: RECOMMENDER_WEIGHT_MASTERED,
+}
+
+
+def classify(best_time: float, median_time: Optional[float]) -> WeightClass:
+    """Weight class of an attempted problem"""
+    if median_time is None:
+        return WeightClass.AVERAGE
+    # Medians are read from sketches, accurate to SKETCH_RELATIVE_ACCURACY
+    if best_time <= median_time * (1 + SKETCH_RELATIVE_ACCURACY):
+        return WeightClass.MASTERED
+    if best_time >= median_time * RECOMMENDER_BEHIND_FACTOR:
+        return WeightClass.BEHIND
+    return WeightClass.AVERAGE
+
+
+class IndexedSet:
+    """Dense list plus position map: O(1) add, remove and uniform choice"""
+
+    def __init__(self, items=()):
+        self._items: List[Hashable] = []
+        self._positions: Dict[Hashable, int] = {}
+        for item in items:
+            self.add(item)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, item) -> bool:
+        return item in self._positions
+
+    def add(self, item):
+        if item not in self._positions:
+            self._positions[item] = len(self._items)
+            self._items.append(item)
+
+    def remove(self, item):
+        """Remove an item (if present) by moving the last item into its slot"""
+        position = self._positions.pop(item, None)
+        if position is None:
+            return
+        last = self._items.pop()
+        if position < len(self._items):
+            self._items[position] = last
+            self._positions[last] = position
+
+    def choice(self, rng: random.Random):
+        return self._items[rng.randrange(len(self._items))]
+
+
+class UserProblemWeights:
+    """One user's attempted problems grouped by weight class"""
+
+    def __init__(self, best_times: Dict[int, float], medians: Dict[int, float]):
+        self.best_times = dict(best_times)
+        self.classes: Dict[WeightClass, IndexedSet] = {
+            weight_class: IndexedSet() for weight_class in CLASS_WEIGHTS if weight_class is not WeightClass.NEW
+        }
+        self.class_of: Dict[int, WeightClass] = {}
+        for problem_id, best_time in self.best_times.items():
+            self._place(problem_id, classify(best_time, medians.get(problem_id)))
+        # Explicit list of unattempted problems, built only once few are left
+        self._new: Optional[IndexedSet] = None
+        self._new_pool: Optional[List[int]] = None
+
+    def _place(self, problem_id: int, weight_class: WeightClass):
+        previous = self.class_of.get(problem_id)
+        if previous is weight_class:
+            return
+        if previous is not None:
+            self.classes[previous].remove(problem_id)
+        self.classes[weight_class].add(problem_id)
+        self.class_of[problem_id] = weight_class
+
+    def record(self, problem_id: int, time_seconds: float, median_time: Optional[float]):
+        """Fold in a new attempt (O(1))"""
+        best_time = min(time_seconds, self.best_times.get(problem_id, time_seconds))
+        self.best_times[problem_id] = best_time
+        self._place(problem_id, classify(best_time, median_time))
+        if self._new is not None:
+            self._new.remove(problem_id)
+
+    def _pick_new(self, rng: random.Random, pool: List[int]) -> Optional[int]:
+        unattempted = len(pool) - len(self.class_of)
+        if unattempted <= 0:
+            return None
+        if unattempted >= REJECTION_MIN_NEW_SHARE * len(pool):
+            for _ in range(MAX_REJECTION_DRAWS):
+                problem_id = pool[rng.randrange(len(pool))]
+                if problem_id not in self.class_of:
+                    return problem_id
+        if self._new is None or self._new_pool is not pool:
+            # The pool was reloaded (or few problems are left): list the unattempted ones
+            self._new = IndexedSet(problem_id for problem_id in pool if problem_id not in self.class_of)
+            self._new_pool = pool
+        return self._new.choice(rng) if len(self._new) else None
+
+    def pick(self, rng: random.Random, pool: List[int]) -> Optional[int]:
+        """Pick a problem id: a weight class by total weight, then uniformly within it"""
+        sizes = {weight_class: len(members) for weight_class, members in self.classes.items()}
+        sizes[WeightClass.NEW] = max(0, len(pool) - len(self.class_of))
+        weights = [
+            (weight_class, CLASS_WEIGHTS[weight_class] * size)
+            for weight_class, size in sizes.items() if size and CLASS_WEIGHTS[weight_class] > 0
+        ]
+        if not weights:
+            return None
+        target = rng.random() * sum(weight for _, weight in weights)
+        for weight_class, weight in weights:
+            target -= weight
+            if target < 0:
+                break
+        if weight_class is WeightClass.NEW:
+            problem_id = self._pick_new(rng, pool)
+            if problem_id is not None:
+                return problem_id
+            weight_class = max(self.classes, key=lambda candidate: len(self.classes[candidate]))
+        members = self.classes[weight_class]
+        return members.choice(rng) if len(members) else None
+
+
+class ProblemMedians:
+    """Per-worker median time of every problem, computed from the quantile sketches"""
+
+    def __init__(self, refresh_seconds: float = RECOMMENDER_MEDIAN_REFRESH_SECONDS):
+        self.medians: Dict[int, float] = {}
+        self.loaded = False
+        self._task = PeriodicTask("recommender-medians", refresh_seconds, self.refresh)
+
+    def load(self, db: Session):
+        rows = db.execute(
+            select(ProblemSketch.problem_id, ProblemSketch.zero_count, ProblemSketch.counts)
+            .where(ProblemSketch.metric == HistogramDataType.TIME)
+        ).all()
+        medians = {}
+        for problem_id, zero_count, counts in rows:
+            sketch = DDSketch(counts={int(key): count for key, count in counts.items()}, zero_count=zero_count)
+            median = sketch.quantile(0.5)
+            if median is not None:
+                medians[problem_id] = median
+        self.medians = medians  # Replaced as a whole
+        self.loaded = True
+
+    def refresh(self):
+        db = SessionLocal()
+        try:
+            self.load(db)
+        finally:
+            db.close()
+
+    def get(self, db: Session) -> Dict[int, float]:
+        if not self.loaded:
+            self.load(db)  # Before the first background refresh
+        return self.medians
+
+    def start(self):
+        self._task.start()
+
+    def stop(self):
+        self._task.stop(run_final=False)
+
+
+class Recommender:
+    """Per-worker cache of users' weight classes, and the pick"""
+
+    def __init__(
+        self,
+        ttl_seconds: float = RECOMMENDER_STATE_TTL_SECONDS,
+        max_users: int = RECOMMENDER_STATE_MAX_USERS,
+    ):
+        self.medians = ProblemMedians()
+        self._states = LRUCache(max_users, ttl_seconds=ttl_seconds)
+        self._lock = threading.Lock()
+        self._rng = random.Random()
+
+    def _state(self, db: Session, user_id: int) -> UserProblemWeights:
+        state = self._states.get(user_id)
+        if state is None:
+            best_times = dict(db.execute(
+                select(UserProblemBest.problem_id, UserProblemBest.best_time).where(UserProblemBest.user_id == user_id)
+            ).all())
+            state = UserProblemWeights(best_times, self.medians.get(db))
+            self._states.put(user_id, state)
+        return state
+
+    def pick_id(self, db: Session, user_id: int, pool: List[int]) -> Optional[int]:
+        """Pick the next problem id for a user from the catalog pool"""
+        state = self._state(db, user_id)
+        with self._lock:
+            return state.pick(self._rng, pool)
+
+    def record_attempt(self, user_id: int, problem_id: int, time_seconds: float):
+        """Update a cached user's classes after this worker stored an attempt (no DB access)"""
+        state = self._states.get(user_id)
+        if state is None:
+            return
+        with self._lock:
+            state.record(problem_id, time_seconds, self.medians.medians.get(problem_id))
+
+    def start(self):
+        self.medians.start()
+
+    def stop(self):
+        self.medians.stop()
+
+    def stats(self) -> dict:
+        return {"medians": len(self.medians.medians), **self._states.stats()}
+
+
+recommender = Recommender()
@@ -1,98 +1,62 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
-from typing import Optional
-from datetime import datetime, timezone
-from app.database import get_db
-from app.models import Attempt, Problem, Session as SessionModel, ProblemHistogram, HistogramDataType
-from app.schemas import AttemptCreate, AttemptResponse
-from app.dependencies import get_optional_session_id
-
-router = APIRouter()
+from typing import Dict, Literal, Optional
+import math
+import os
+from app.attempt_history import (
+    ATTEMPT_HISTORY_MAX_PAGE_SIZE, EXPORT_MEDIA_TYPES, HistoryCursor, load_history_page, stream_export,
+    stream_export_async
+)
+from app.catalog import problem_catalog
+from app.database import AsyncSessionLocal, get_db, run_db, DatabaseSession
+from app.models import Attempt
+from app.schemas import (
+    AttemptCreate, AttemptResponse, AttemptHistoryResponse, AttemptBatchCreate, AttemptBatchResponse, AttemptBatchResult,
+    ProblemResponse
+)
+from app.dependencies import get_optional_session_id, get_session_id, resolve_session, verify_session
+from app.histograms import HistogramDeltas, attempt_histogram_deltas, merge_histogram_deltas
+from app.histogram_buffer import histogram_buffer
+from app.idempotency import claim_keys
+from app.leaderboard import leaderboard_cache
+from app.recommender import recommender
+from app.sketches import SketchDeltas, attempt_sketch_deltas, merge_sketch_deltas
+from app.user_best import Bests, merge_best, record_best, record_bests
 
+# Maximum number of attempts accepted by one POST /api/attempts/batch
+ATTEMPT_BATCH_MAX_SIZE = int(os.getenv("ATTEMPT_BATCH_MAX_SIZE", "100"))
 
-def calculate_bin_index(value: float, bin_width: float) -> int:
-    """
-    Calculate which bin index a value belongs to based on bin width.
-    First bar (bin 0) covers 0 to bin_width/2.
-    Subsequent bars cover bin_width intervals.
-    For example, with bin_width=2.5:
-    - value 0-1.25 -> bin 0 (first bar, half interval)
-    - value 1.25-3.75 -> bin 1 (round((2.5-1.25)/2.5) + 1 = 1)
-    - value 3.75-6.25 -> bin 2 (round((5-1.25)/2.5) + 1 = 2)
-    """
-    half_width = bin_width / 2.0
-    if value <= half_width:
-        return 0
-    # For values > half_width, calculate bin index
-    return int(round((value - half_width) / bin_width)) + 1
+router = APIRouter()
 
 
-def update_histogram(db: Session, problem_id: int, data_type: HistogramDataType, new_value: float):
+def attempt_ccpm(problem: ProblemResponse, attempt: AttemptCreate) -> float:
     """
-    Update or create histogram data for a problem.
-    Stores histogram as an array where each index represents a bin, and the value is the count.
-    Only stores the first 25 bars (indices 0-24). Data beyond that is ignored.
-    - Time: bin width = 2.5 seconds (bin 0 = 0-1.25s, bin 1 = 1.25-3.75s, bin 2 = 3.75-6.25s, etc.)
-    - Strokes: bin width = 5 keystrokes (bin 0 = 0-2.5, bin 1 = 2.5-7.5, bin 2 = 7.5-12.5, etc.)
-    - CCPM: bin width = 100 (bin 0 = 0-50, bin 1 = 50-150, bin 2 = 150-250, etc.)
+    Compute an attempt's CCPM from the problem's changed characters (precomputed at ingest,
+    served from the catalog cache). Raises ValueError for attempts that can't have happened.
     """
-    MAX_BARS = 25  # Maximum number of bars to store (indices 0-24)
-    
-    # Determine bin width based on data type
-    bin_widths = {
-        HistogramDataType.TIME: 2.5,      # 2.5 seconds
-        HistogramDataType.STROKES: 5.0,   # 5 keystrokes
-        HistogramDataType.CCPM: 100.0     # 100 CCPM
-    }
-    
-    bin_width = bin_widths.get(data_type, 1.0)
-    bin_index = calculate_bin_index(new_value, bin_width)
-    
-    # Ignore data that would be stored beyond the 25th bar (index >= 25)
-    if bin_index >= MAX_BARS:
-        return  # Ignore this value
-    
-    histogram = db.query(ProblemHistogram).filter(
-        ProblemHistogram.problem_id == problem_id,
-        ProblemHistogram.data_type == data_type
-    ).first()
-    
-    if histogram:
-        # Get existing counts array or initialize empty array
-        if histogram.values is None:
-            counts = []
-        else:
-            counts = list(histogram.values)
-        
-        # Extend array if needed to accommodate this bin index (but cap at MAX_BARS)
-        while len(counts) <= bin_index and len(counts) < MAX_BARS:
-            counts.append(0)
-        
-        # Increment count for this bin (we already checked bin_index < MAX_BARS)
-        if bin_index < len(counts):
-            counts[bin_index] = counts[bin_index] + 1
-        
-        # Ensure array doesn't exceed MAX_BARS (trim if somehow it does)
-        if len(counts) > MAX_BARS:
-            counts = counts[:MAX_BARS]
-        
-        histogram.values = counts
-    else:
-        # Create new histogram entry with initial count for this bin
-        counts = [0] * (bin_index + 1)  # Initialize array with zeros up to bin_index
-        counts[bin_index] = 1  # Set count for this bin to 1
-        histogram = ProblemHistogram(
-            problem_id=problem_id,
-            data_type=data_type,
-            values=counts
-        )
-        db.add(histogram)
+    if problem.changed_chars is None:
+        # Diff metadata not backfilled yet: take the client's figure
+        if attempt.ccpm is None:
+            raise ValueError("ccpm is required for this problem")
+        return attempt.ccpm
+    if attempt.key_strokes < problem.min_key_strokes:
+        raise ValueError(f"key_strokes must be at least {problem.min_key_strokes} for this problem")
+    if attempt.time_seconds <= 0:
+        if problem.changed_chars:
+            raise ValueError("time_seconds must be positive")
+        return 0.0
+    ccpm = problem.changed_chars * 60 / attempt.time_seconds
+    if not math.isfinite(ccpm):
+        raise ValueError("time_seconds is too small")
+    return ccpm
 
 
 @router.post("", status_code=status.HTTP_201_CREATED)
-def create_attempt(
+async def create_attempt(
     attempt: AttemptCreate,
-    db: Session = Depends(get_db),
+    db: DatabaseSession = Depends(get_db),
     session_id: Optional[str] = Depends(get_optional_session_id)
 ):
     """
@@ -100,25 +64,35 @@ def create_attempt(
     Session ID is optional in the X-Session-ID header.
     If provided, it will be validated and the user_id will be extracted and stored.
     The attempt data will be added to the problem's histogram statistics.
+    CCPM is computed from the problem's changed characters (the submitted ccpm is only used
+    for problems without diff metadata); impossible attempts are rejected with 400.
     """
-    # Get user_id from session if provided
+    return await run_db(db, store_attempt, attempt, session_id)
+
+
+def store_attempt(db: Session, attempt: AttemptCreate, session_id: Optional[str]):
+    """Store an attempt and update histograms (runs with a synchronous Session)"""
+    # Get user_id from session if provided (served from the session cache)
     user_id = None
-    if session_id:
-        session = db.query(SessionModel).filter(SessionModel.session_id == session_id).first()
-        if session:
-            # Update last accessed time
-            session.last_accessed_at = datetime.now(timezone.utc)
-            user_id = session.user_id
-            db.commit()
-        # If session doesn't exist, continue without user_id (allow unauthenticated attempts)
+    session = resolve_session(db, session_id)
+    if session:
+        user_id = session.user_id
+    # If session doesn't exist, continue without user_id (allow unauthenticated attempts)
     
-    # Verify problem exists
-    problem = db.query(Problem).filter(Problem.id == attempt.problem_id).first()
+    # Verify problem exists (through the catalog cache, which also holds its diff metadata)
+    problem = problem_catalog.get(db, attempt.problem_id)
     if not problem:
         raise HTTPException(
             status_code=404,
             detail=f"Problem with id {attempt.problem_id} not found"
         )
+    try:
+        ccpm = attempt_ccpm(problem, attempt)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=str(e)
+        )
     
     # Only create attempt if user is logged in (user_id is not None)
     db_attempt = None
@@ -128,20 +102,27 @@ def create_attempt(
             problem_id=attempt.problem_id,
             time_seconds=attempt.time_seconds,
             key_strokes=attempt.key_strokes,
-            ccpm=attempt.ccpm
+            ccpm=ccpm
         )
         db.add(db_attempt)
+        # Write the attempt before the upserts below: a histogram rebuild locks attempts, then histograms
+        db.flush()
+        # Keep the user's per-problem bests up to date for problem fetches
+        record_best(db, user_id, attempt.problem_id, attempt.time_seconds, attempt.key_strokes, ccpm)
     
-    # Always update histogram data for this problem (even if user is not logged in)
-    update_histogram(db, attempt.problem_id, HistogramDataType.TIME, attempt.time_seconds)
-    update_histogram(db, attempt.problem_id, HistogramDataType.STROKES, float(attempt.key_strokes))
-    update_histogram(db, attempt.problem_id, HistogramDataType.CCPM, attempt.ccpm)
+    # Always update histogram data and percentile sketches for this problem (even if user is not logged in).
+    # All three data types are updated by one atomic upsert each, or buffered when write-behind is enabled.
+    metrics = (attempt.problem_id, attempt.time_seconds, attempt.key_strokes, ccpm)
+    histogram_buffer.record(db, attempt_histogram_deltas(*metrics), attempt_sketch_deltas(*metrics))
     
     # Commit all changes (attempt + histogram updates) together
     db.commit()
     
     # If attempt was created, refresh it and return response
     if db_attempt:
+        # The user's bests may have improved; other workers catch up within the cache TTL
+        leaderboard_cache.forget(attempt.problem_id)
+        recommender.record_attempt(user_id, attempt.problem_id, attempt.time_seconds)
         db.refresh(db_attempt)
         return AttemptResponse(
             id=db_attempt.id,
@@ -155,6 +136,177 @@ def create_attempt(
     else:
         # User not logged in - histogram updated but no attempt record created
         # Return 204 No Content to indicate success but no body
-        from fastapi import Response
         return Response(status_code=status.HTTP_204_NO_CONTENT)
 
+
+@router.get("/me", response_model=AttemptHistoryResponse)
+async def get_my_attempts(
+    limit: int = Query(20, ge=1, le=ATTEMPT_HISTORY_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: DatabaseSession = Depends(get_db),
+    session_id: str = Depends(get_session_id)
+):
+    """
+    The logged-in user's attempts, newest first.
+    Requires X-Session-ID header. Pass a page's next_cursor as `cursor` to get the next (older) page.
+    """
+    after = None
+    if cursor is not None:
+        try:
+            after = HistoryCursor.decode(cursor)
+        except ValueError:
+            raise HTTPException(
+                status_code=400,
+                detail="Invalid cursor"
+            )
+    return await run_db(db, load_my_attempts, session_id, after, limit)
+
+
+def load_my_attempts(db: Session, session_id: str, after: Optional[HistoryCursor], limit: int) -> AttemptHistoryResponse:
+    """Fetch a page of the session user's attempts (runs with a synchronous Session)"""
+    session = verify_session(db, session_id)
+    
+    # One extra row tells whether there is a next page
+    attempts = load_history_page(db, session.user_id, after, limit + 1)
+    next_cursor = None
+    if len(attempts) > limit:
+        attempts = attempts[:limit]
+        next_cursor = HistoryCursor(attempts[-1].created_at, attempts[-1].id).encode()
+    return AttemptHistoryResponse(
+        attempts=[AttemptResponse.model_validate(db_attempt) for db_attempt in attempts],
+        next_cursor=next_cursor
+    )
+
+
+@router.get("/me/export")
+async def export_my_attempts(
+    export_format: Literal["ndjson", "csv"] = Query("ndjson", alias="format"),
+    db: DatabaseSession = Depends(get_db),
+    session_id: str = Depends(get_session_id)
+):
+    """
+    Download all of the logged-in user's attempts, oldest first, as NDJSON (one object
+    per line) or CSV. Requires X-Session-ID header.
+    Rows are streamed from a server-side cursor in chunks, so exports of any size use
+    constant memory.
+    """
+    session = await run_db(db, verify_session, session_id)
+    if AsyncSessionLocal is not None:
+        rows = stream_export_async(session.user_id, export_format)
+    else:
+        rows = stream_export(session.user_id, export_format)  # Iterated on the threadpool
+    return StreamingResponse(
+        rows,
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="attempts.{export_format}"'}
+    )
+
+
+@router.post("/batch", response_model=AttemptBatchResponse)
+async def create_attempt_batch(
+    batch: AttemptBatchCreate,
+    db: DatabaseSession = Depends(get_db),
+    session_id: Optional[str] = Depends(get_optional_session_id)
+):
+    """
+    Store several attempts at once (e.g. queued while offline), in a single transaction.
+    Each attempt carries an idempotency_key; attempts whose key was already submitted
+    are reported as duplicates and not counted again, so failed requests can be retried as-is.
+    Attempts with impossible metrics are reported as rejected, with the reason in `error`.
+    Returns one result per attempt, in the order submitted.
+    """
+    if len(batch.attempts) > ATTEMPT_BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"A batch may contain at most {ATTEMPT_BATCH_MAX_SIZE} attempts"
+        )
+    return await run_db(db, store_attempt_batch, batch, session_id)
+
+
+def store_attempt_batch(db: Session, batch: AttemptBatchCreate, session_id: Optional[str]) -> AttemptBatchResponse:
+    """Store a batch of attempts and update histograms (runs with a synchronous Session)"""
+    session = resolve_session(db, session_id)
+    user_id = session.user_id if session else None
+    
+    # Validate every problem through the catalog cache (misses loaded with one query)
+    problems = problem_catalog.get_many(db, {item.problem_id for item in batch.attempts})
+    
+    # Check each attempt and compute its CCPM; keys repeated within the batch are resolved by their first occurrence
+    statuses: Dict[str, str] = {}
+    errors: Dict[str, str] = {}
+    valid = {}  # key -> (attempt, ccpm)
+    for item in batch.attempts:
+        key = item.idempotency_key
+        if key in statuses:
+            continue
+        if item.problem_id not in problems:
+            statuses[key] = "problem_not_found"
+            continue
+        try:
+            valid[key] = (item, attempt_ccpm(problems[item.problem_id], item))
+            statuses[key] = "created" if user_id is not None else "recorded"
+        except ValueError as e:
+            statuses[key] = "rejected"
+            errors[key] = str(e)
+    
+    # Claim the keys of valid attempts
+    claimed = claim_keys(db, valid, user_id)
+    accepted = []
+    for key, (item, ccpm) in valid.items():
+        if key in claimed:
+            accepted.append((item, ccpm))
+        else:
+            statuses[key] = "duplicate"
+    
+    # Merge all histogram increments, sketch updates (and the user's bests) so each row is written once
+    deltas: HistogramDeltas = {}
+    sketches: SketchDeltas = {}
+    bests: Bests = {}
+    for item, ccpm in accepted:
+        metrics = (item.problem_id, item.time_seconds, item.key_strokes, ccpm)
+        merge_histogram_deltas(deltas, attempt_histogram_deltas(*metrics))
+        merge_sketch_deltas(sketches, attempt_sketch_deltas(*metrics))
+        if user_id is not None:
+            merge_best(bests, user_id, item.problem_id, item.time_seconds, item.key_strokes, ccpm)
+    
+    # Bulk insert the attempts of a logged-in user
+    created: Dict[str, AttemptResponse] = {}
+    if user_id is not None and accepted:
+        stored = db.execute(
+            insert(Attempt).returning(Attempt, sort_by_parameter_order=True),
+            [
+                {
+                    "user_id": user_id,
+                    "problem_id": item.problem_id,
+                    "time_seconds": item.time_seconds,
+                    "key_strokes": item.key_strokes,
+                    "ccpm": ccpm,
+                }
+                for item, ccpm in accepted
+            ],
+        ).scalars().all()
+        for (item, _), db_attempt in zip(accepted, stored):
+            created[item.idempotency_key] = AttemptResponse.model_validate(db_attempt)
+        record_bests(db, bests)
+    
+    histogram_buffer.record(db, deltas, sketches, attempts=len(accepted))
+    
+    # Commit attempts, bests, histogram updates and claimed keys together
+    db.commit()
+    for (_, problem_id), (best_time, _, _) in bests.items():
+        leaderboard_cache.forget(problem_id)
+        recommender.record_attempt(user_id, problem_id, best_time)
+    
+    results = []
+    reported = set()
+    for item in batch.attempts:
+        key = item.idempotency_key
+        if key in reported:
+            # Repeated key within the batch: only its first occurrence is counted
+            results.append(AttemptBatchResult(idempotency_key=key, status="duplicate"))
+            continue
+        reported.add(key)
+        results.append(AttemptBatchResult(
+            idempotency_key=key, status=statuses[key], attempt=created.get(key), error=errors.get(key)
+        ))
+    return AttemptBatchResponse(results=results)
@@ -1,25 +1,41 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Header
+from fastapi import APIRouter, Depends, HTTPException, Response, status, Header
 from sqlalchemy.orm import Session
-from app.database import get_db
+from typing import Optional, Tuple
+from app.database import get_db, run_db, DatabaseSession
 from app.models import User, Session as SessionModel
 from app.schemas import UserCreate, UserResponse, LoginRequest, LoginResponse, SessionResponse
-from app.auth import hash_password, verify_password
-from app.dependencies import get_session_id
+from app.auth import BCRYPT_ROUNDS, hash_password, verify_password, needs_rehash, password_hasher, PasswordHasherBusy
+from app.dependencies import get_session_id, verify_session
+from app.session_cache import revoke_sessions
+from app.tokens import SESSION_TOKENS, is_token, issue_token, token_revocations, verify_token
 import uuid
-from datetime import datetime, timezone
 
 router = APIRouter()
 
 
+async def run_password_task(fn, *args):
+    """
+    Run a bcrypt function in the password hashing pool.
+    Returns 503 when the pool is saturated so clients back off instead of piling up.
+    """
+    try:
+        return await password_hasher.run(fn, *args)
+    except PasswordHasherBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many sign-in requests, please retry shortly",
+            headers={"Retry-After": "1"}
+        )
+
+
 @router.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-def register_user(user_data: UserCreate, db: Session = Depends(get_db)):
+async def register_user(user_data: UserCreate, db: DatabaseSession = Depends(get_db)):
     """
     Create a new user account.
     Username must be unique. Password will be hashed before storage.
     """
     # Check if username already exists
-    existing_user = db.query(User).filter(User.username == user_data.username).first()
-    if existing_user:
+    if await run_db(db, username_exists, user_data.username):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Username already exists"
@@ -38,12 +54,20 @@ def register_user(user_data: UserCreate, db: Session = Depends(get_db)):
             detail="Password must be at least 3 characters long"
         )
     
-    # Hash password
-    hashed_password = hash_password(user_data.password)
+    # Hash password (CPU-bound, so run in the hashing pool outside the DB session)
+    hashed_password = await run_password_task(hash_password, user_data.password, BCRYPT_ROUNDS)
     
-    # Create new user
+    return await run_db(db, create_user, user_data.username.strip(), hashed_password)
+
+
+def username_exists(db: Session, username: str) -> bool:
+    return db.query(User.id).filter(User.username == username).first() is not None
+
+
+def create_user(db: Session, username: str, hashed_password: str) -> UserResponse:
+    """Insert a new user (runs with a synchronous Session)"""
     db_user = User(
-        username=user_data.username.strip(),
+        username=username,
         hashed_password=hashed_password
     )
     db.add(db_user)
@@ -58,34 +82,68 @@ def register_user(user_data: UserCreate, db: Session = Depends(get_db)):
 
 
 @router.post("/login", response_model=LoginResponse)
-def login(login_data: LoginRequest, db: Session = Depends(get_db)):
+async def login(login_data: LoginRequest, db: DatabaseSession = Depends(get_db)):
     """
     Authenticate user and create a session.
-    Returns a session ID that should be stored client-side and included in subsequent requests.
+    Returns a session ID that should be stored client-side and included in subsequent requests
+    (a signed token when SESSION_TOKENS is enabled).
     """
     # Find user by username
-    user = db.query(User).filter(User.username == login_data.username).first()
+    credentials = await run_db(db, load_credentials, login_data.username)
     
-    if not user:
+    if not credentials:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid username or password"
         )
+    user_id, hashed_password = credentials
     
-    # Verify password
-    if not verify_password(login_data.password, user.hashed_password):
+    # Verify password (CPU-bound, so run in the hashing pool outside the DB session)
+    if not await run_password_task(verify_password, login_data.password, hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid username or password"
         )
     
+    # Upgrade the stored hash if the configured bcrypt cost changed since it was made.
+    # This is optional work, so under load it is simply left for a later login.
+    if needs_rehash(hashed_password):
+        try:
+            new_hash = await password_hasher.run(hash_password, login_data.password, BCRYPT_ROUNDS)
+            await run_db(db, update_password_hash, user_id, hashed_password, new_hash)
+        except PasswordHasherBusy:
+            pass
+    
+    if SESSION_TOKENS:
+        # Stateless: nothing to store
+        token, claims = issue_token(user_id, login_data.username)
+        return LoginResponse(session_id=token, created_at=claims.issued_at)
+    return await run_db(db, create_login_session, user_id)
+
+
+def load_credentials(db: Session, username: str) -> Optional[Tuple[int, str]]:
+    """Return (user_id, hashed_password) for a username, or None"""
+    row = db.query(User.id, User.hashed_password).filter(User.username == username).first()
+    return tuple(row) if row else None
+
+
+def update_password_hash(db: Session, user_id: int, old_hash: str, new_hash: str):
+    """Replace a user's hash, unless the password was changed meanwhile"""
+    db.query(User).filter(User.id == user_id, User.hashed_password == old_hash).update(
+        {User.hashed_password: new_hash}, synchronize_session=False
+    )
+    db.commit()
+
+
+def create_login_session(db: Session, user_id: int) -> LoginResponse:
+    """Insert a new session for an authenticated user (runs with a synchronous Session)"""
     # Generate a unique session ID
     session_id = str(uuid.uuid4())
     
     # Create new session linked to user
     db_session = SessionModel(
         session_id=session_id,
-        user_id=user.id
+        user_id=user_id
     )
     db.add(db_session)
     db.commit()
@@ -98,38 +156,46 @@ def login(login_data: LoginRequest, db: Session = Depends(get_db)):
 
 
 @router.get("/validate", response_model=SessionResponse)
-def validate_session(
-    db: Session = Depends(get_db),
+async def validate_session(
+    db: DatabaseSession = Depends(get_db),
     session_id: str = Depends(get_session_id)
 ):
     """
     Validate a session ID and return the associated username.
     Requires X-Session-ID header.
     """
-    
-    # Find session with user relationship loaded
-    session = db.query(SessionModel).filter(SessionModel.session_id == session_id).first()
-    
-    if not session:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid or expired session"
-        )
-    
-    # Update last accessed time
-    session.last_accessed_at = datetime.now(timezone.utc)
-    db.commit()
-    
-    # Ensure user relationship is loaded
-    if not session.user:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Session user not found"
-        )
+    return await run_db(db, load_session, session_id)
+
+
+def load_session(db: Session, session_id: str) -> SessionResponse:
+    """Look up and touch a session (runs with a synchronous Session)"""
+    # Served from the session cache; the username comes with the session, no extra query
+    session = verify_session(db, session_id)
     
     return SessionResponse(
         session_id=session.session_id,
-        username=session.user.username,
+        username=session.username,
         created_at=session.created_at
     )
 
+
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(
+    db: DatabaseSession = Depends(get_db),
+    session_id: str = Depends(get_session_id)
+):
+    """
+    End a session.
+    Requires X-Session-ID header. The session is deleted (or the token revoked) on every worker.
+    """
+    await run_db(db, end_session, session_id)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+def end_session(db: Session, session_id: str):
+    """Revoke a session (runs with a synchronous Session)"""
+    verify_session(db, session_id)
+    if is_token(session_id):
+        token_revocations.revoke(db, verify_token(session_id))
+    else:
+        revoke_sessions(db, session_id)
@@ -1,19 +1,31 @@
-from fastapi import APIRouter, Depends, Header, HTTPException
+import random
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from sqlalchemy import and_, null, select
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import Optional
-from datetime import datetime, timezone
-from app.database import get_db
-from app.models import Problem, Attempt, Session as SessionModel, ProblemHistogram, HistogramDataType
-from app.schemas import ProblemResponse
-from app.dependencies import get_session_id, verify_session, get_optional_session_id
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+from app.database import get_db, run_db, DatabaseSession
+from app.models import Problem, ProblemHistogram, HistogramDataType, UserProblemBest
+from app.schemas import (
+    ProblemResponse, ProblemBatchResponse, PercentileResponse, WindowedHistogramResponse, LeaderboardEntry, LeaderboardResponse
+)
+from app.dependencies import get_session_id, verify_session, get_optional_session_id, resolve_session
+from app.catalog import problem_catalog
+from app.problem_pool import MAX_PICK_ATTEMPTS, problem_pool
+from app.problem_deck import PROBLEM_BATCH_MAX_COUNT, problem_decks
+from app.recommender import recommender
+from app.histogram_windows import (
+    HISTOGRAM_DAILY_RETENTION_DAYS, HISTOGRAM_HOURLY_RETENTION_HOURS, day_start, hour_start, load_windowed_histograms
+)
+from app.leaderboard import LEADERBOARD_MAX_PAGE_SIZE, Cursor, leaderboard_cache
+from app.sketches import LOWER_IS_BETTER, load_sketch
 
 router = APIRouter()
 
 
 @router.get("/random", response_model=ProblemResponse)
-def get_random_problem(
-    db: Session = Depends(get_db),
+async def get_random_problem(
+    db: DatabaseSession = Depends(get_db),
     session_id: Optional[str] = Depends(get_optional_session_id)
 ):
     """
@@ -22,8 +34,13 @@ def get_random_problem(
     If provided and valid, will include best attempt stats for that user.
     Always returns histogram data for the problem (time, strokes, CCPM) if available.
     """
-    # Get random problem
-    problem = db.query(Problem).order_by(func.random()).first()
+    return await run_db(db, load_random_problem, session_id)
+
+
+def load_random_problem(db: Session, session_id: Optional[str]) -> ProblemResponse:
+    """Pick a random problem and build its response (runs with a synchronous Session)"""
+    # Get random problem (picked from the in-memory ID pool, payload served from the catalog cache)
+    problem = problem_pool.pick(db, problem_catalog.get)
     
     if not problem:
         raise HTTPException(
@@ -31,61 +48,312 @@ def get_random_problem(
             detail="No problems found in database"
         )
     
-    # Initialize best stats as None
-    best_time = None
-    best_key_strokes = None
-    best_ccpm = None
-    user_id = None
+    # If session_id is provided, verify it (through the session cache) and get user_id
+    session = resolve_session(db, session_id)
+    user_id = session.user_id if session else None
+    
+    return with_problem_stats(db, problem, user_id)
+
+
+@router.get("/next", response_model=ProblemResponse)
+async def get_next_problem(
+    db: DatabaseSession = Depends(get_db),
+    session_id: Optional[str] = Depends(get_optional_session_id)
+):
+    """
+    Get the next problem to practice.
+    For a logged-in user (X-Session-ID header), problems they haven't attempted yet or
+    are far behind the median time on are favored, and ones they have mastered are
+    rarely picked (see app/recommender.py). Without a session this is /random.
+    Returns the same fields as /random.
+    """
+    return await run_db(db, load_next_problem, session_id)
+
+
+def load_next_problem(db: Session, session_id: Optional[str]) -> ProblemResponse:
+    """Pick a problem with the user's weights and build its response (runs with a synchronous Session)"""
+    session = resolve_session(db, session_id)
+    if session is None:
+        return load_random_problem(db, None)
     
-    # If session_id is provided, verify it and get user_id
-    if session_id:
-        session = db.query(SessionModel).filter(SessionModel.session_id == session_id).first()
-        if session:
-            # Update last accessed time
-            session.last_accessed_at = datetime.now(timezone.utc)
-            user_id = session.user_id
-            db.commit()
-            
-            # Get best attempt for this problem and user
-            # Best time = minimum time_seconds (fastest completion)
-            best_attempt = db.query(Attempt).filter(
-                Attempt.user_id == user_id,
-                Attempt.problem_id == problem.id
-            ).order_by(Attempt.time_seconds.asc()).first()
-            
-            if best_attempt:
-                best_time = best_attempt.time_seconds
-                best_key_strokes = best_attempt.key_strokes
-                best_ccpm = best_attempt.ccpm
+    # O(1) weighted pick from the user's cached weight classes; the payload comes from the catalog cache
+    problem_id = recommender.pick_id(db, session.user_id, problem_pool.get_ids(db))
+    problem = problem_catalog.get(db, problem_id) if problem_id is not None else None
+    if problem is None:
+        # No problems, or the picked one was deleted meanwhile
+        problem = problem_pool.pick(db, problem_catalog.get)
+    if problem is None:
+        raise HTTPException(
+            status_code=404,
+            detail="No problems found in database"
+        )
+    
+    return with_problem_stats(db, problem, session.user_id)
+
+
+@router.get("/batch", response_model=ProblemBatchResponse)
+async def get_problem_batch(
+    count: int = Query(10, ge=1, le=PROBLEM_BATCH_MAX_COUNT),
+    db: DatabaseSession = Depends(get_db),
+    session_id: Optional[str] = Depends(get_optional_session_id)
+):
+    """
+    Get `count` distinct problems at once, each with the same fields as /random.
+    With a session (X-Session-ID header), problems are dealt from the session's shuffled
+    deck, so the whole catalog is seen before any problem repeats across batches.
+    Without one, the batch is a plain random sample.
+    Uses the same number of queries whatever the count.
+    """
+    return await run_db(db, load_problem_batch, session_id, count)
+
+
+def load_problem_batch(db: Session, session_id: Optional[str], count: int) -> ProblemBatchResponse:
+    """Deal a batch of problems and build their responses (runs with a synchronous Session)"""
+    session = resolve_session(db, session_id)
+    user_id = session.user_id if session else None
     
-    # Get histogram data for this problem
-    time_histogram = db.query(ProblemHistogram).filter(
-        ProblemHistogram.problem_id == problem.id,
-        ProblemHistogram.data_type == HistogramDataType.TIME
-    ).first()
+    problems: Dict[int, ProblemResponse] = {}
+    dealt: List[int] = []
+    for _ in range(MAX_PICK_ATTEMPTS):
+        pool = problem_pool.get_ids(db)
+        if session is not None:
+            # Keyed by the session, so each login has its own deck
+            ids = problem_decks.deal(session.session_id, pool, count - len(problems), exclude=set(dealt))
+        else:
+            # Retries sample replacements from the reloaded pool, never a problem dealt already
+            seen = set(dealt)
+            candidates = [problem_id for problem_id in pool if problem_id not in seen] if seen else pool
+            ids = random.sample(candidates, min(count - len(problems), len(candidates)))
+        dealt += ids
+        # Payloads from the catalog cache, misses loaded with one query
+        payloads = problem_catalog.get_many(db, ids)
+        problems.update((problem_id, payloads[problem_id]) for problem_id in ids if problem_id in payloads)
+        if len(problems) == count or len(payloads) == len(ids):
+            break
+        # Some dealt problems were deleted meanwhile: reload the pool and deal replacements
+        problem_pool.invalidate()
     
-    strokes_histogram = db.query(ProblemHistogram).filter(
-        ProblemHistogram.problem_id == problem.id,
-        ProblemHistogram.data_type == HistogramDataType.STROKES
-    ).first()
+    if not problems:
+        raise HTTPException(
+            status_code=404,
+            detail="No problems found in database"
+        )
     
-    ccpm_histogram = db.query(ProblemHistogram).filter(
-        ProblemHistogram.problem_id == problem.id,
-        ProblemHistogram.data_type == HistogramDataType.CCPM
-    ).first()
+    # Histograms and bests of every problem in the batch with one statement
+    stats = load_problems_stats(db, list(problems), user_id)
+    return ProblemBatchResponse(problems=[
+        add_problem_stats(problem, stats.get(problem_id)) for problem_id, problem in problems.items()
+    ])
+
+
+def with_problem_stats(db: Session, problem: ProblemResponse, user_id: Optional[int]) -> ProblemResponse:
+    """Add a problem's histograms and (for a logged-in user) their bests to its cached payload"""
+    # Histograms and the user's bests come back together in one round trip
+    return add_problem_stats(problem, load_problem_stats(db, problem.id, user_id))
+
+
+def add_problem_stats(problem: ProblemResponse, stats) -> ProblemResponse:
+    """Copy a cached base payload with a row from problem_stats_query (unchanged without one)"""
+    if stats is None:
+        # Problem was deleted after it was picked; serve it without stats
+        return problem
     
-    # Convert to response format (frontend expects problem_id as string)
-    return ProblemResponse(
-        id=problem.id,
-        name=problem.name,
-        original_text=problem.original_text,
-        modified_text=problem.modified_text,
-        problem_id=str(problem.id),  # Frontend expects this as string
-        best_time=best_time,
-        best_key_strokes=best_key_strokes,
-        best_ccpm=best_ccpm,
-        time_histogram=list(time_histogram.values) if time_histogram and time_histogram.values else None,
-        strokes_histogram=list(strokes_histogram.values) if strokes_histogram and strokes_histogram.values else None,
-        ccpm_histogram=list(ccpm_histogram.values) if ccpm_histogram and ccpm_histogram.values else None
+    # Add per-request fields to a copy of the cached base payload
+    return problem.model_copy(update={
+        "best_time": stats.best_time,
+        "best_key_strokes": stats.best_key_strokes,
+        "best_ccpm": stats.best_ccpm,
+        # int4[] columns arrive as lists of ints; pass them through without copying
+        "time_histogram": stats.time_histogram or None,
+        "strokes_histogram": stats.strokes_histogram or None,
+        "ccpm_histogram": stats.ccpm_histogram or None
+    })
+
+
+def histogram_values(data_type: HistogramDataType):
+    """Correlated subquery for one of the problem's histograms (NULL if it has none yet)"""
+    return select(ProblemHistogram.values).where(
+        ProblemHistogram.problem_id == Problem.id,
+        ProblemHistogram.data_type == data_type
+    ).scalar_subquery()
+
+
+def problem_stats_query(user_id: Optional[int]):
+    """
+    Problems' three histograms and, for a logged-in user, their best time, key strokes
+    and CCPM, one row per problem (callers add the WHERE clause on Problem.id)
+    """
+    columns = [
+        histogram_values(HistogramDataType.TIME).label("time_histogram"),
+        histogram_values(HistogramDataType.STROKES).label("strokes_histogram"),
+        histogram_values(HistogramDataType.CCPM).label("ccpm_histogram"),
+    ]
+    query = select(Problem.id)
+    if user_id is None:
+        columns += [
+            null().label("best_time"),
+            null().label("best_key_strokes"),
+            null().label("best_ccpm"),
+        ]
+    else:
+        # Primary-key lookup in the rollup maintained by create_attempt
+        query = query.outerjoin(UserProblemBest, and_(
+            UserProblemBest.user_id == user_id,
+            UserProblemBest.problem_id == Problem.id
+        ))
+        columns += [
+            UserProblemBest.best_time,
+            UserProblemBest.best_key_strokes,
+            UserProblemBest.best_ccpm,
+        ]
+    return query.add_columns(*columns)
+
+
+def load_problem_stats(db: Session, problem_id: int, user_id: Optional[int]):
+    """Fetch one problem's stats with a single statement. Returns None if the problem doesn't exist."""
+    return db.execute(problem_stats_query(user_id).where(Problem.id == problem_id)).first()
+
+
+def load_problems_stats(db: Session, problem_ids: List[int], user_id: Optional[int]) -> dict:
+    """Fetch several problems' stats with a single statement, keyed by problem id (deleted ones absent)"""
+    if not problem_ids:
+        return {}
+    rows = db.execute(problem_stats_query(user_id).where(Problem.id.in_(problem_ids))).all()
+    return {row.id: row for row in rows}
+
+
+@router.get("/{problem_id}/percentile", response_model=PercentileResponse)
+async def get_problem_percentile(
+    problem_id: int,
+    metric: HistogramDataType,
+    value: float = Query(..., ge=0, allow_inf_nan=False),
+    db: DatabaseSession = Depends(get_db)
+):
+    """
+    Where a result ranks among all attempts at a problem ("you beat X%").
+    Answered from the problem's quantile sketch for the metric (time, strokes or ccpm),
+    accurate to within 1% of the value, with one primary-key lookup.
+    """
+    return await run_db(db, load_percentile, problem_id, metric, value)
+
+
+def load_percentile(db: Session, problem_id: int, metric: HistogramDataType, value: float) -> PercentileResponse:
+    """Rank a value against a problem's sketch (runs with a synchronous Session)"""
+    if problem_catalog.get(db, problem_id) is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Problem with id {problem_id} not found"
+        )
+    
+    sketch = load_sketch(db, problem_id, metric)
+    rank = sketch.rank(value)
+    percentile = better_than = None
+    if rank is not None:
+        percentile = round(rank * 100, 2)
+        better_than = percentile if metric not in LOWER_IS_BETTER else round((1 - rank) * 100, 2)
+    return PercentileResponse(
+        problem_id=problem_id,
+        metric=metric.value,
+        value=value,
+        attempts=sketch.count,
+        percentile=percentile,
+        better_than=better_than
     )
 
+
+@router.get("/{problem_id}/histograms", response_model=WindowedHistogramResponse)
+async def get_windowed_histograms(
+    problem_id: int,
+    days: Optional[int] = Query(None, ge=1),
+    hours: Optional[int] = Query(None, ge=1),
+    db: DatabaseSession = Depends(get_db)
+):
+    """
+    A problem's histograms over recent attempts only: the last `days` UTC days (today
+    included) or the last `hours` UTC hours (the current hour included).
+    Merged from the daily and hourly rollups in problem_histogram_windows with one query.
+    """
+    if (days is None) == (hours is None):
+        raise HTTPException(
+            status_code=400,
+            detail="Specify exactly one of days or hours"
+        )
+    if days is not None and days > HISTOGRAM_DAILY_RETENTION_DAYS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"days must be at most {HISTOGRAM_DAILY_RETENTION_DAYS}"
+        )
+    if hours is not None and hours > HISTOGRAM_HOURLY_RETENTION_HOURS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"hours must be at most {HISTOGRAM_HOURLY_RETENTION_HOURS}"
+        )
+
+    now = datetime.now(timezone.utc)
+    if days is not None:
+        since = day_start(now) - timedelta(days=days - 1)
+    else:
+        since = hour_start(now) - timedelta(hours=hours - 1)
+    return await run_db(db, load_windowed_histogram_response, problem_id, since, hours is not None)
+
+
+def load_windowed_histogram_response(db: Session, problem_id: int, since: datetime, hours_only: bool) -> WindowedHistogramResponse:
+    """Merge a problem's histogram windows since a boundary (runs with a synchronous Session)"""
+    if problem_catalog.get(db, problem_id) is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Problem with id {problem_id} not found"
+        )
+
+    histograms = load_windowed_histograms(db, problem_id, since, hours_only)
+    return WindowedHistogramResponse(
+        problem_id=problem_id,
+        since=since,
+        time_histogram=histograms.get(HistogramDataType.TIME, []),
+        strokes_histogram=histograms.get(HistogramDataType.STROKES, []),
+        ccpm_histogram=histograms.get(HistogramDataType.CCPM, [])
+    )
+
+
+@router.get("/{problem_id}/leaderboard", response_model=LeaderboardResponse)
+async def get_leaderboard(
+    problem_id: int,
+    metric: HistogramDataType = HistogramDataType.TIME,
+    limit: int = Query(10, ge=1, le=LEADERBOARD_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: DatabaseSession = Depends(get_db)
+):
+    """
+    Users ranked by their best result at a problem: lowest time, fewest keystrokes or highest CCPM.
+    The top of each leaderboard is served from a short-lived per-worker cache; pass a page's
+    next_cursor as `cursor` to continue below it.
+    """
+    after = None
+    if cursor is not None:
+        try:
+            after = Cursor.decode(cursor)
+        except ValueError:
+            raise HTTPException(
+                status_code=400,
+                detail="Invalid cursor"
+            )
+    return await run_db(db, load_leaderboard, problem_id, metric, after, limit)
+
+
+def load_leaderboard(
+    db: Session, problem_id: int, metric: HistogramDataType, after: Optional[Cursor], limit: int
+) -> LeaderboardResponse:
+    """Fetch a leaderboard page (runs with a synchronous Session)"""
+    if problem_catalog.get(db, problem_id) is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Problem with id {problem_id} not found"
+        )
+
+    rows, next_cursor = leaderboard_cache.page(db, problem_id, metric, after, limit)
+    return LeaderboardResponse(
+        problem_id=problem_id,
+        metric=metric.value,
+        entries=[LeaderboardEntry(rank=row.rank, username=row.username, value=row.value) for row in rows],
+        next_cursor=next_cursor.encode() if next_cursor else None
+    )
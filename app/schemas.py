@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional, List
+from pydantic import BaseModel, Field
+from typing import Literal, Optional, List, Tuple
 from datetime import datetime
 
 
@@ -48,20 +48,58 @@ class ProblemResponse(BaseModel):
     best_time: Optional[float] = None  # Best time in seconds for this user (if logged in)
     best_key_strokes: Optional[int] = None  # Best (minimum) key strokes for this user (if logged in)
     best_ccpm: Optional[float] = None  # Best (maximum) CCPM for this user (if logged in)
-    time_histogram: Optional[List[float]] = None  # Histogram data for time (bucketized to 3 seconds)
-    strokes_histogram: Optional[List[float]] = None  # Histogram data for strokes (bucketized to 3 keystrokes)
-    ccpm_histogram: Optional[List[float]] = None  # Histogram data for CCPM (bucketized to 100 CCPM)
+    time_histogram: Optional[List[int]] = None  # Attempt counts per time bin (2.5 seconds wide)
+    strokes_histogram: Optional[List[int]] = None  # Attempt counts per strokes bin (5 keystrokes wide)
+    ccpm_histogram: Optional[List[int]] = None  # Attempt counts per CCPM bin (100 CCPM wide)
+    # Character-level diff: [start, end, inserted] replaces original_text[start:end] (None until computed)
+    edit_script: Optional[List[Tuple[int, int, str]]] = None
+    changed_chars: Optional[int] = None  # Characters deleted plus inserted; CCPM is these per minute
+    min_key_strokes: Optional[int] = None  # Fewest keystrokes any attempt can take
 
     class Config:
         from_attributes = True
 
 
+class ProblemBatchResponse(BaseModel):
+    problems: List[ProblemResponse]  # Distinct problems, in the order they were dealt
+
+
+class PercentileResponse(BaseModel):
+    problem_id: int
+    metric: str  # time, strokes or ccpm
+    value: float
+    attempts: int  # Number of attempts the percentile is based on
+    percentile: Optional[float] = None  # Percentage of attempts with a lower value (None without attempts)
+    better_than: Optional[float] = None  # Percentage of attempts this value beats (lower time/strokes, higher CCPM)
+
+
+class WindowedHistogramResponse(BaseModel):
+    problem_id: int
+    since: datetime  # Start of the window (UTC day or hour boundary); the window runs until now
+    time_histogram: List[int]  # Same bins as ProblemResponse; empty without attempts in the window
+    strokes_histogram: List[int]
+    ccpm_histogram: List[int]
+
+
+class LeaderboardEntry(BaseModel):
+    rank: int  # 1-based; equal values are ordered by user id
+    username: str
+    value: float  # The user's best time (seconds), fewest keystrokes or highest CCPM
+
+
+class LeaderboardResponse(BaseModel):
+    problem_id: int
+    metric: str  # time, strokes or ccpm
+    entries: List[LeaderboardEntry]
+    next_cursor: Optional[str] = None  # Pass as `cursor` for the next page; None on the last page
+
+
 # Attempt schemas
 class AttemptCreate(BaseModel):
     problem_id: int
-    time_seconds: float
+    time_seconds: float = Field(allow_inf_nan=False)
     key_strokes: int
-    ccpm: float
+    ccpm: Optional[float] = Field(None, allow_inf_nan=False)  # Only used for problems whose changed characters aren't known; computed otherwise
 
 
 class AttemptResponse(BaseModel):
@@ -76,3 +114,29 @@ class AttemptResponse(BaseModel):
     class Config:
         from_attributes = True
 
+
+class AttemptHistoryResponse(BaseModel):
+    attempts: List[AttemptResponse]  # Newest first
+    next_cursor: Optional[str] = None  # Pass as `cursor` for the next (older) page; None on the last page
+
+
+class AttemptBatchItem(AttemptCreate):
+    idempotency_key: str = Field(min_length=1, max_length=128)  # Client-chosen, e.g. a UUID; resubmitting it is a no-op
+
+
+class AttemptBatchCreate(BaseModel):
+    attempts: List[AttemptBatchItem]
+
+
+class AttemptBatchResult(BaseModel):
+    idempotency_key: str
+    # created: attempt stored (logged in); recorded: histograms updated only (anonymous);
+    # duplicate: key already submitted, nothing changed; problem_not_found, rejected (impossible
+    # metrics, see `error`): nothing changed
+    status: Literal["created", "recorded", "duplicate", "problem_not_found", "rejected"]
+    error: Optional[str] = None
+    attempt: Optional[AttemptResponse] = None
+
+
+class AttemptBatchResponse(BaseModel):
+    results: List[AttemptBatchResult]  # One per submitted attempt, in order
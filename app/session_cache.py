@@ -0,0 +1,136 @@
+"""
+Per-worker cache of session lookups, and session expiry.
+
+Maps session_id -> (user_id, username, created_at, last_accessed_at) so authenticated requests that
+hit the cache make no auth-related queries. Entries expire after
+SESSION_CACHE_TTL_SECONDS and the least recently used are evicted beyond
+SESSION_CACHE_MAX_ENTRIES.
+
+Sessions expire SESSION_IDLE_TIMEOUT_SECONDS after their last use and
+SESSION_ABSOLUTE_TIMEOUT_SECONDS after login; expired sessions are rejected here
+and deleted later by the session reaper (app/session_reaper.py).
+
+Revoking a session (logout) deletes its row and bumps the "sessions"
+version counter in the same transaction; every worker notices the new generation
+within SESSION_GENERATION_CHECK_SECONDS and drops its cached sessions.
+"""
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple, Optional
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from app.cache import LRUCache
+from app.counters import CounterWatcher, bump_counter
+from app.models import Session as SessionModel, User
+from app.session_touch import session_touches
+
+SESSION_CACHE_TTL_SECONDS = float(os.getenv("SESSION_CACHE_TTL_SECONDS", "60"))
+SESSION_CACHE_MAX_ENTRIES = int(os.getenv("SESSION_CACHE_MAX_ENTRIES", "10000"))
+
+# How often (seconds) each worker re-reads the session generation counter,
+# i.e. how long a revoked session may still be accepted by other workers
+SESSION_GENERATION_CHECK_SECONDS = float(os.getenv("SESSION_GENERATION_CHECK_SECONDS", "2"))
+
+# Session lifetimes (0 = no limit)
+SESSION_IDLE_TIMEOUT_SECONDS = float(os.getenv("SESSION_IDLE_TIMEOUT_SECONDS", str(7 * 24 * 3600)))
+SESSION_ABSOLUTE_TIMEOUT_SECONDS = float(os.getenv("SESSION_ABSOLUTE_TIMEOUT_SECONDS", str(30 * 24 * 3600)))
+
+SESSION_GENERATION_COUNTER = "sessions"
+
+session_generation = CounterWatcher(SESSION_GENERATION_COUNTER, SESSION_GENERATION_CHECK_SECONDS)
+
+
+class CachedSession(NamedTuple):
+    session_id: str
+    user_id: int
+    username: str
+    created_at: datetime
+    # Latest access known to this worker (the cache entry is only created by an access)
+    last_accessed_at: datetime
+
+
+def is_session_expired(created_at: datetime, last_accessed_at: datetime, now: Optional[datetime] = None) -> bool:
+    """True if a session exceeded its idle or absolute lifetime"""
+    now = now or datetime.now(timezone.utc)
+    if SESSION_IDLE_TIMEOUT_SECONDS and now - last_accessed_at > timedelta(seconds=SESSION_IDLE_TIMEOUT_SECONDS):
+        return True
+    if SESSION_ABSOLUTE_TIMEOUT_SECONDS and now - created_at > timedelta(seconds=SESSION_ABSOLUTE_TIMEOUT_SECONDS):
+        return True
+    return False
+
+
+class SessionCache:
+    """Read-through session cache invalidated by the session generation counter"""
+
+    def __init__(self, ttl_seconds: float = SESSION_CACHE_TTL_SECONDS, max_entries: int = SESSION_CACHE_MAX_ENTRIES):
+        self._cache = LRUCache(max_entries, ttl_seconds=ttl_seconds)
+        self._generation: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _sync_generation(self, db: Session) -> int:
+        generation = session_generation.current(db)
+        if generation != self._generation:
+            with self._lock:
+                if generation != self._generation:
+                    self._cache.clear()
+                    self._generation = generation
+        return generation
+
+    def get(self, db: Session, session_id: str) -> Optional[CachedSession]:
+        """
+        Return the session (with its user's name), loading it with one query on a miss.
+        Returns None if the session doesn't exist or has expired.
+        """
+        generation = self._sync_generation(db)
+        now = datetime.now(timezone.utc)
+        cached = self._cache.get(session_id)
+        if cached is not None:
+            last_accessed_at = max(cached.last_accessed_at, session_touches.last_touch(session_id) or cached.last_accessed_at)
+            if is_session_expired(cached.created_at, last_accessed_at, now):
+                self.forget(session_id)
+                return None
+            return cached
+
+        row = db.execute(
+            select(SessionModel.user_id, User.username, SessionModel.created_at, SessionModel.last_accessed_at)
+            .join(User, User.id == SessionModel.user_id)
+            .where(SessionModel.session_id == session_id)
+        ).first()
+        if row is None:
+            return None
+        user_id, username, created_at, last_accessed_at = row
+        last_accessed_at = max(last_accessed_at, session_touches.last_touch(session_id) or last_accessed_at)
+        if is_session_expired(created_at, last_accessed_at, now):
+            return None
+        cached = CachedSession(session_id, user_id, username, created_at, now)
+        # Don't cache a session loaded under a generation that changed meanwhile
+        if self._generation == generation:
+            self._cache.put(session_id, cached)
+        return cached
+
+    def forget(self, session_id: str):
+        """Drop a session from this worker's cache"""
+        self._cache.pop(session_id)
+
+    def stats(self) -> dict:
+        return {"generation": self._generation, **self._cache.stats()}
+
+
+session_cache = SessionCache()
+
+
+def revoke_sessions(db: Session, *session_ids: str):
+    """
+    Delete sessions and invalidate them on every worker (commits the transaction).
+    Use this for logout; expired sessions are already rejected everywhere and are
+    deleted by the session reaper without bumping the generation.
+    """
+    if not session_ids:
+        return
+    db.query(SessionModel).filter(SessionModel.session_id.in_(session_ids)).delete(synchronize_session=False)
+    bump_counter(db, SESSION_GENERATION_COUNTER)
+    db.commit()
+    for session_id in session_ids:
+        session_cache.forget(session_id)
+    session_generation.invalidate()
@@ -0,0 +1,89 @@
+"""
+Background deletion of expired sessions.
+
+Expired sessions are already rejected by app/session_cache.py; this task reclaims
+their rows so the sessions table (and its indexes) stops growing with every login.
+It also deletes revocations of signed tokens that have expired anyway (app/tokens.py).
+Rows are deleted in batches of SESSION_REAPER_BATCH_SIZE, each its own short
+transaction, picked through the last_accessed_at / created_at indexes with
+FOR UPDATE SKIP LOCKED so the reaper never waits on (or blocks) concurrent writers,
+and several workers can reap at the same time.
+"""
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import or_
+from app.background import PeriodicTask
+from app.batched_delete import delete_in_batches
+from app.models import RevokedToken, Session as SessionModel
+from app.session_cache import SESSION_ABSOLUTE_TIMEOUT_SECONDS, SESSION_IDLE_TIMEOUT_SECONDS
+from app.session_touch import SESSION_TOUCH_INTERVAL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+SESSION_REAPER_INTERVAL_SECONDS = float(os.getenv("SESSION_REAPER_INTERVAL_SECONDS", "300"))
+SESSION_REAPER_BATCH_SIZE = int(os.getenv("SESSION_REAPER_BATCH_SIZE", "1000"))
+
+
+class SessionReaper:
+    """Periodically delete sessions past their idle or absolute lifetime"""
+
+    def __init__(
+        self,
+        interval_seconds: float = SESSION_REAPER_INTERVAL_SECONDS,
+        batch_size: int = SESSION_REAPER_BATCH_SIZE,
+    ):
+        self.batch_size = batch_size
+        self._task = PeriodicTask("session-reaper", interval_seconds, self.run_once)
+        self.runs = 0
+        self.total_rows = 0
+        self.last_run_rows = 0
+        self.last_run_seconds = 0.0
+
+    def _expired_condition(self):
+        now = datetime.now(timezone.utc)
+        conditions = []
+        if SESSION_IDLE_TIMEOUT_SECONDS:
+            # Access times reach the table up to one touch interval late; don't reap
+            # a session whose latest use is still buffered in some worker
+            idle_cutoff = now - timedelta(seconds=SESSION_IDLE_TIMEOUT_SECONDS + SESSION_TOUCH_INTERVAL_SECONDS)
+            conditions.append(SessionModel.last_accessed_at < idle_cutoff)
+        if SESSION_ABSOLUTE_TIMEOUT_SECONDS:
+            conditions.append(SessionModel.created_at < now - timedelta(seconds=SESSION_ABSOLUTE_TIMEOUT_SECONDS))
+        return or_(*conditions) if conditions else None
+
+    def run_once(self) -> int:
+        """Delete all currently expired sessions (and token revocations) in bounded batches; returns the number of rows deleted"""
+        started = time.perf_counter()
+        deleted = delete_in_batches(
+            RevokedToken, RevokedToken.token_id, RevokedToken.expires_at < datetime.now(timezone.utc), self.batch_size
+        )
+        condition = self._expired_condition()
+        if condition is not None:
+            deleted += delete_in_batches(SessionModel, SessionModel.session_id, condition, self.batch_size)
+
+        self.runs += 1
+        self.total_rows += deleted
+        self.last_run_rows = deleted
+        self.last_run_seconds = time.perf_counter() - started
+        logger.info(f"Session reaper deleted {deleted} expired sessions and token revocations in {self.last_run_seconds:.2f}s")
+        return deleted
+
+    def start(self):
+        self._task.start()
+
+    def stop(self):
+        # Nothing is buffered, so don't make shutdown wait for a final sweep
+        self._task.stop(run_final=False)
+
+    def stats(self) -> dict:
+        return {
+            "runs": self.runs,
+            "last_run_rows": self.last_run_rows,
+            "last_run_seconds": round(self.last_run_seconds, 3),
+            "total_rows": self.total_rows,
+        }
+
+
+session_reaper = SessionReaper()
@@ -0,0 +1,108 @@
+"""
+Coalesced writes of sessions.last_accessed_at.
+
+Authenticated requests only record their access time in memory. A background task
+writes the latest access time of every touched session in one batched UPDATE every
+SESSION_TOUCH_INTERVAL_SECONDS, so each session is written at most once per interval
+no matter how many requests it makes, and read-only traffic stays read-only.
+"""
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Optional
+from sqlalchemy import DateTime, String, column, or_, update, values
+from app.background import PeriodicTask
+from app.database import SessionLocal
+from app.models import Session as SessionModel
+
+logger = logging.getLogger(__name__)
+
+SESSION_TOUCH_INTERVAL_SECONDS = float(os.getenv("SESSION_TOUCH_INTERVAL_SECONDS", "60"))
+
+
+class SessionTouchCoalescer:
+    """Per-worker buffer of session access times, flushed in bulk"""
+
+    def __init__(self, interval_seconds: float = SESSION_TOUCH_INTERVAL_SECONDS):
+        self._pending: Dict[str, datetime] = {}
+        self._lock = threading.Lock()
+        self._task = PeriodicTask("session-touch-flush", interval_seconds, self.flush)
+        self.touches = 0
+        self.rows_written = 0
+        self.flushes = 0
+
+    def touch(self, session_id: str, accessed_at: Optional[datetime] = None):
+        """Record that a session was used (only the latest time per session is kept)"""
+        accessed_at = accessed_at or datetime.now(timezone.utc)
+        with self._lock:
+            previous = self._pending.get(session_id)
+            if previous is None or accessed_at > previous:
+                self._pending[session_id] = accessed_at
+            self.touches += 1
+
+    def last_touch(self, session_id: str) -> Optional[datetime]:
+        """Latest access time recorded for a session and not yet written, if any"""
+        return self._pending.get(session_id)
+
+    def flush(self):
+        """Write all pending access times with a single UPDATE ... FROM (VALUES ...)"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+
+        touched = values(
+            column("session_id", String),
+            column("accessed_at", DateTime(timezone=True)),
+            name="touched",
+        ).data(list(pending.items()))
+        statement = (
+            update(SessionModel)
+            .where(SessionModel.session_id == touched.c.session_id)
+            # Never move last_accessed_at backwards (another worker may have written a later time)
+            .where(or_(
+                SessionModel.last_accessed_at.is_(None),
+                SessionModel.last_accessed_at < touched.c.accessed_at
+            ))
+            .values(last_accessed_at=touched.c.accessed_at)
+            .execution_options(synchronize_session=False)
+        )
+
+        db = SessionLocal()
+        try:
+            db.execute(statement)
+            db.commit()
+        except Exception:
+            db.rollback()
+            # Keep the access times for the next flush
+            with self._lock:
+                for session_id, accessed_at in pending.items():
+                    if session_id not in self._pending or self._pending[session_id] < accessed_at:
+                        self._pending[session_id] = accessed_at
+            raise
+        finally:
+            db.close()
+
+        self.rows_written += len(pending)
+        self.flushes += 1
+        logger.debug(f"Flushed access times for {len(pending)} sessions")
+
+    def start(self):
+        self._task.start()
+
+    def stop(self):
+        """Stop the flush task and write whatever is still pending"""
+        self._task.stop()
+
+    def stats(self) -> dict:
+        return {
+            "touches": self.touches,
+            "rows_written": self.rows_written,
+            "writes_saved": self.touches - self.rows_written - len(self._pending),
+            "pending": len(self._pending),
+            "flushes": self.flushes,
+        }
+
+
+session_touches = SessionTouchCoalescer()
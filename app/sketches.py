@@ -0,0 +1,219 @@
+"""
+Mergeable quantile sketches (DDSketch) of attempt metrics, for percentile ranks.
+
+Unlike the fixed-width histograms, a sketch covers every value: each value is
+counted in a logarithmic bucket whose key is ceil(log_gamma(value)), with
+gamma = (1 + a) / (1 - a) for relative accuracy a. Any quantile read back from the
+sketch is within a (1% by default) of the true value, and the number of buckets
+only grows with the logarithm of the value range, never with the number of attempts.
+
+Sketches are stored per (problem, metric) in problem_sketches as a JSONB map
+bucket key -> count. Like histogram increments, per-attempt sketch deltas are merged
+in memory and added to the stored sketch by one atomic INSERT ... ON CONFLICT.
+Sketch deltas of many values at once (synthetic data) are built with NumPy and
+bucket values exactly like DDSketch.add.
+"""
+import math
+from typing import Dict, Optional, Tuple
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from app.models import HistogramDataType, ProblemSketch
+
+SKETCH_RELATIVE_ACCURACY = 0.01
+
+# Values at or below this are counted in the zero bucket (metrics are never negative)
+MIN_INDEXABLE_VALUE = 1e-6
+
+# Metrics where a lower value is the better result
+LOWER_IS_BETTER = {HistogramDataType.TIME, HistogramDataType.STROKES}
+
+# Key-wise sum of the stored and incoming bucket counts ({} when both are empty, i.e. the
+# values so far all fell in the zero bucket: jsonb_object_agg over no rows is NULL)
+MERGED_COUNTS_SQL = text(
+    '(SELECT coalesce(jsonb_object_agg(entries.key, entries.total), \'{}\'::jsonb) FROM ('
+    'SELECT key, sum(value::bigint) AS total FROM ('
+    'SELECT * FROM jsonb_each_text(problem_sketches.counts) '
+    'UNION ALL SELECT * FROM jsonb_each_text(excluded.counts)'
+    ') AS pairs GROUP BY key) AS entries)'
+)
+
+
+class DDSketch:
+    """Log-bucketed quantile sketch with relative value accuracy"""
+
+    def __init__(
+        self,
+        relative_accuracy: float = SKETCH_RELATIVE_ACCURACY,
+        counts: Optional[Dict[int, int]] = None,
+        zero_count: int = 0,
+    ):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.counts: Dict[int, int] = dict(counts or {})
+        self.zero_count = zero_count
+
+    @property
+    def count(self) -> int:
+        return self.zero_count + sum(self.counts.values())
+
+    def key(self, value: float) -> int:
+        return math.ceil(math.log(value) / self._log_gamma)
+
+    def bucket_value(self, key: int) -> float:
+        """Representative value of a bucket (within relative_accuracy of everything in it)"""
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def add(self, value: float, count: int = 1):
+        """Count a value; infinity and NaN can't be bucketed and are ignored"""
+        if not math.isfinite(value):
+            return
+        if value <= MIN_INDEXABLE_VALUE:
+            self.zero_count += count
+        else:
+            key = self.key(value)
+            self.counts[key] = self.counts.get(key, 0) + count
+
+    def merge(self, other: "DDSketch"):
+        """Add every count of another sketch (with the same accuracy) into this one"""
+        self.zero_count += other.zero_count
+        for key, count in other.counts.items():
+            self.counts[key] = self.counts.get(key, 0) + count
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Value at quantile q (0..1), or None for an empty sketch"""
+        total = self.count
+        if total == 0:
+            return None
+        rank = q * (total - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.counts):
+            seen += self.counts[key]
+            if rank < seen:
+                return self.bucket_value(key)
+        return self.bucket_value(max(self.counts))
+
+    def rank(self, value: float) -> Optional[float]:
+        """
+        Fraction (0..1) of values below `value`, counting half of the values that share its
+        bucket (they are indistinguishable from it). None for an empty sketch or NaN.
+        """
+        total = self.count
+        if total == 0 or math.isnan(value):
+            return None
+        if value == math.inf:
+            return 1.0
+        if value <= MIN_INDEXABLE_VALUE:
+            return self.zero_count / 2 / total
+        value_key = self.key(value)
+        below = self.zero_count
+        for key, count in self.counts.items():
+            if key < value_key:
+                below += count
+            elif key == value_key:
+                below += count / 2
+        return below / total
+
+
+# Pending sketch updates: (problem_id, metric) -> sketch of the new values
+SketchDeltas = Dict[Tuple[int, HistogramDataType], DDSketch]
+
+
+def merge_sketch_deltas(target: SketchDeltas, source: SketchDeltas):
+    """Merge every sketch in source into target (in place)"""
+    for key, sketch in source.items():
+        if key in target:
+            target[key].merge(sketch)
+        else:
+            target[key] = DDSketch(sketch.relative_accuracy, sketch.counts, sketch.zero_count)
+
+
+def attempt_sketch_deltas(problem_id: int, time_seconds: float, key_strokes: int, ccpm: float) -> SketchDeltas:
+    """Build the sketch updates for a single attempt (TIME, STROKES and CCPM)"""
+    deltas: SketchDeltas = {}
+    for metric, value in (
+        (HistogramDataType.TIME, time_seconds),
+        (HistogramDataType.STROKES, float(key_strokes)),
+        (HistogramDataType.CCPM, ccpm),
+    ):
+        sketch = DDSketch()
+        sketch.add(value)
+        deltas[(problem_id, metric)] = sketch
+    return deltas
+
+
+def add_sketch_arrays(deltas: SketchDeltas, metric: HistogramDataType, problem_ids: np.ndarray, values: np.ndarray):
+    """Record many values (of one metric, for any problems) in pending sketch updates, vectorized"""
+    problem_ids = np.asarray(problem_ids, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    # Like DDSketch.add: infinity and NaN are ignored
+    finite = np.isfinite(values)
+    problem_ids, values = problem_ids[finite], values[finite]
+    indexable = values > MIN_INDEXABLE_VALUE
+    zero_problems, zero_counts = np.unique(problem_ids[~indexable], return_counts=True)
+    sketch = DDSketch()
+    keys = np.ceil(np.log(values[indexable]) / sketch._log_gamma).astype(np.int64)
+    pairs, counts = np.unique(np.stack([problem_ids[indexable], keys], axis=1), axis=0, return_counts=True)
+
+    def target(problem_id: int) -> DDSketch:
+        return deltas.setdefault((problem_id, metric), DDSketch())
+
+    for problem_id, count in zip(zero_problems.tolist(), zero_counts.tolist()):
+        target(problem_id).zero_count += count
+    for (problem_id, key), count in zip(pairs.tolist(), counts.tolist()):
+        sketch = target(problem_id)
+        sketch.counts[key] = sketch.counts.get(key, 0) + count
+
+
+def add_attempt_sketch_arrays(
+    deltas: SketchDeltas,
+    problem_ids: np.ndarray,
+    time_seconds: np.ndarray,
+    key_strokes: np.ndarray,
+    ccpm: np.ndarray,
+):
+    """Record many attempts' TIME, STROKES and CCPM values in pending sketch updates, vectorized"""
+    add_sketch_arrays(deltas, HistogramDataType.TIME, problem_ids, time_seconds)
+    add_sketch_arrays(deltas, HistogramDataType.STROKES, problem_ids, key_strokes)
+    add_sketch_arrays(deltas, HistogramDataType.CCPM, problem_ids, ccpm)
+
+
+def apply_sketch_deltas(db: Session, deltas: SketchDeltas):
+    """
+    Merge pending sketch updates into the stored sketches with a single INSERT ... ON CONFLICT
+    statement (part of the caller's transaction). Rows are written in a fixed order to avoid
+    deadlocks between concurrent multi-row upserts.
+    """
+    if not deltas:
+        return
+
+    rows = [
+        {
+            "problem_id": problem_id,
+            "metric": metric,
+            "zero_count": sketch.zero_count,
+            "counts": {str(key): count for key, count in sketch.counts.items()},
+        }
+        for (problem_id, metric), sketch in sorted(deltas.items(), key=lambda item: (item[0][0], item[0][1].name))
+    ]
+    statement = insert(ProblemSketch).values(rows)
+    statement = statement.on_conflict_do_update(
+        index_elements=[ProblemSketch.problem_id, ProblemSketch.metric],
+        set_={
+            "zero_count": ProblemSketch.zero_count + statement.excluded.zero_count,
+            "counts": MERGED_COUNTS_SQL,
+        },
+    )
+    db.execute(statement)
+
+
+def load_sketch(db: Session, problem_id: int, metric: HistogramDataType) -> DDSketch:
+    """Read a stored sketch (empty if the problem has no attempts yet) with a primary-key lookup"""
+    row = db.get(ProblemSketch, (problem_id, metric))
+    if row is None:
+        return DDSketch()
+    return DDSketch(counts={int(key): count for key, count in row.counts.items()}, zero_count=row.zero_count)
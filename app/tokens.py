@@ -0,0 +1,201 @@
+"""
+Signed, stateless session tokens.
+
+With SESSION_TOKENS enabled, login issues a token instead of a sessions row:
+
+    v1.<base64url JSON claims>.<base64url HMAC-SHA256 of the claims>
+
+The claims carry a random token id, the user's id and name, the issue time and the
+expiry (SESSION_ABSOLUTE_TIMEOUT_SECONDS after login). Tokens are sent in the same
+X-Session-ID header as UUID sessions and are verified entirely in memory, so
+authenticated requests make no auth-related queries at all. Tokens have no idle
+timeout, since their use is never recorded.
+
+Logout stores the token id in revoked_tokens and bumps the "revoked_tokens" version
+counter. Every worker keeps the ids of revoked, unexpired tokens in memory and
+reloads them when the counter changes (checked every TOKEN_REVOCATION_REFRESH_SECONDS
+by a background task), so a logged-out token may be accepted by other workers for at
+most that long. Expired rows are deleted by the session reaper.
+
+UUID sessions keep working in either mode, and tokens keep verifying after
+SESSION_TOKENS is turned off as long as their secret is still configured.
+"""
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import logging
+import os
+import re
+import secrets
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import List, NamedTuple, Optional, Set
+from sqlalchemy import or_, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from app.background import PeriodicTask
+from app.counters import bump_counter, read_counter
+from app.database import SessionLocal
+from app.models import RevokedToken
+from app.session_cache import SESSION_ABSOLUTE_TIMEOUT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+SESSION_TOKENS = os.getenv("SESSION_TOKENS", "false").lower() in ("1", "true", "yes")
+
+# Comma-separated signing secrets: the first signs new tokens, all of them verify
+# (append the old secret when rotating, and drop it once its tokens have expired)
+SESSION_TOKEN_SECRETS: List[bytes] = [
+    secret.strip().encode() for secret in os.getenv("SESSION_TOKEN_SECRET", "").split(",") if secret.strip()
+]
+
+# How often (seconds) each worker checks for logouts on other workers
+TOKEN_REVOCATION_REFRESH_SECONDS = float(os.getenv("TOKEN_REVOCATION_REFRESH_SECONDS", "2"))
+
+if SESSION_TOKENS and not SESSION_TOKEN_SECRETS:
+    raise RuntimeError("SESSION_TOKENS requires SESSION_TOKEN_SECRET")
+
+TOKEN_PREFIX = "v1."
+REVOKED_TOKENS_COUNTER = "revoked_tokens"
+
+BASE64URL = re.compile(r"[A-Za-z0-9_-]+")
+
+
+class TokenClaims(NamedTuple):
+    token_id: str
+    user_id: int
+    username: str
+    issued_at: datetime
+    expires_at: Optional[datetime]
+
+
+def _encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _signature(secret: bytes, payload: str) -> str:
+    return _encode(hmac.new(secret, payload.encode("ascii"), hashlib.sha256).digest())
+
+
+def _is_base64url(data: str) -> bool:
+    """True for unpadded base64url text (ASCII only, so it can be signed and compared)"""
+    return BASE64URL.fullmatch(data) is not None
+
+
+def is_token(session_id: str) -> bool:
+    """True for signed tokens (UUID session ids never start with the prefix)"""
+    return session_id.startswith(TOKEN_PREFIX)
+
+
+def issue_token(user_id: int, username: str, now: Optional[datetime] = None) -> tuple:
+    """Return (token, claims) for a new login"""
+    now = (now or datetime.now(timezone.utc)).replace(microsecond=0)
+    expires_at = now + timedelta(seconds=SESSION_ABSOLUTE_TIMEOUT_SECONDS) if SESSION_ABSOLUTE_TIMEOUT_SECONDS else None
+    claims = TokenClaims(secrets.token_hex(16), user_id, username, now, expires_at)
+    payload = _encode(json.dumps({
+        "jti": claims.token_id,
+        "uid": user_id,
+        "usr": username,
+        "iat": int(now.timestamp()),
+        "exp": int(expires_at.timestamp()) if expires_at else None,
+    }, separators=(",", ":")).encode())
+    return f"{TOKEN_PREFIX}{payload}.{_signature(SESSION_TOKEN_SECRETS[0], payload)}", claims
+
+
+def verify_token(token: str, now: Optional[datetime] = None) -> Optional[TokenClaims]:
+    """
+    Return a token's claims if its signature is valid and it hasn't expired, else None.
+    Revocation is checked separately (token_revocations.is_revoked).
+    """
+    if not SESSION_TOKEN_SECRETS or not is_token(token):
+        return None
+    payload, _, signature = token[len(TOKEN_PREFIX):].partition(".")
+    # Anything a client sends may reach here: reject what could never have been issued
+    if not _is_base64url(payload) or not _is_base64url(signature):
+        return None
+    if not any(
+        hmac.compare_digest(signature.encode("ascii"), _signature(secret, payload).encode("ascii"))
+        for secret in SESSION_TOKEN_SECRETS
+    ):
+        return None
+    try:
+        data = json.loads(_decode(payload))
+        claims = TokenClaims(
+            data["jti"],
+            data["uid"],
+            data["usr"],
+            datetime.fromtimestamp(data["iat"], timezone.utc),
+            datetime.fromtimestamp(data["exp"], timezone.utc) if data["exp"] is not None else None,
+        )
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        return None
+    if claims.expires_at is not None and claims.expires_at <= (now or datetime.now(timezone.utc)):
+        return None
+    return claims
+
+
+class TokenRevocations:
+    """Per-worker set of revoked token ids, reloaded when the revocation counter changes"""
+
+    def __init__(self, refresh_seconds: float = TOKEN_REVOCATION_REFRESH_SECONDS):
+        self._revoked: Optional[Set[str]] = None
+        self._version: Optional[int] = None
+        self._lock = threading.Lock()
+        self._task = PeriodicTask("token-revocation-refresh", refresh_seconds, self.refresh)
+        self.reloads = 0
+
+    def _load(self, db: Session):
+        version = read_counter(db, REVOKED_TOKENS_COUNTER)
+        if version == self._version:
+            return
+        now = datetime.now(timezone.utc)
+        revoked = set(db.execute(
+            select(RevokedToken.token_id).where(or_(RevokedToken.expires_at.is_(None), RevokedToken.expires_at > now))
+        ).scalars())
+        with self._lock:
+            self._revoked = revoked
+            self._version = version
+        self.reloads += 1
+
+    def refresh(self):
+        """Reload the revoked ids if any token was revoked since the last load (one query otherwise)"""
+        db = SessionLocal()
+        try:
+            self._load(db)
+        finally:
+            db.close()
+
+    def is_revoked(self, db: Session, token_id: str) -> bool:
+        if self._revoked is None:
+            self._load(db)  # Before the first background refresh
+        return token_id in self._revoked
+
+    def revoke(self, db: Session, claims: TokenClaims):
+        """Revoke a token on every worker (commits the transaction)"""
+        statement = insert(RevokedToken).values(token_id=claims.token_id, expires_at=claims.expires_at)
+        db.execute(statement.on_conflict_do_nothing())
+        bump_counter(db, REVOKED_TOKENS_COUNTER)
+        db.commit()
+        with self._lock:
+            if self._revoked is not None:
+                self._revoked.add(claims.token_id)
+
+    def start(self):
+        if SESSION_TOKEN_SECRETS:
+            self.refresh()
+            self._task.start()
+
+    def stop(self):
+        self._task.stop(run_final=False)
+
+    def stats(self) -> dict:
+        return {"revoked": len(self._revoked or ()), "version": self._version, "reloads": self.reloads}
+
+
+token_revocations = TokenRevocations()
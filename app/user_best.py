@@ -0,0 +1,84 @@
+"""
+Incremental maintenance of the user_problem_best rollup.
+
+Every stored attempt merges its results into the user's row for the problem with one
+INSERT ... ON CONFLICT statement (LEAST/GREATEST against the stored values), so
+concurrent attempts never overwrite a better result. Problem fetches then read a
+user's bests with a primary-key lookup instead of sorting their attempts.
+"""
+from typing import Dict, Tuple
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from app.models import Attempt, UserProblemBest
+
+
+# (user_id, problem_id) -> (best_time, best_key_strokes, best_ccpm)
+Bests = Dict[Tuple[int, int], Tuple[float, int, float]]
+
+
+def merge_best(bests: Bests, user_id: int, problem_id: int, time_seconds: float, key_strokes: int, ccpm: float):
+    """Fold one attempt into pending bests (in memory)"""
+    key = (user_id, problem_id)
+    if key in bests:
+        best_time, best_key_strokes, best_ccpm = bests[key]
+        bests[key] = (min(best_time, time_seconds), min(best_key_strokes, key_strokes), max(best_ccpm, ccpm))
+    else:
+        bests[key] = (time_seconds, key_strokes, ccpm)
+
+
+def _merge_bests(statement):
+    """ON CONFLICT clause keeping the better of the stored and incoming values"""
+    return statement.on_conflict_do_update(
+        index_elements=[UserProblemBest.user_id, UserProblemBest.problem_id],
+        set_={
+            "best_time": func.least(UserProblemBest.best_time, statement.excluded.best_time),
+            "best_key_strokes": func.least(UserProblemBest.best_key_strokes, statement.excluded.best_key_strokes),
+            "best_ccpm": func.greatest(UserProblemBest.best_ccpm, statement.excluded.best_ccpm),
+        },
+    )
+
+
+def record_best(db: Session, user_id: int, problem_id: int, time_seconds: float, key_strokes: int, ccpm: float):
+    """Merge one attempt into the user's bests for the problem (part of the caller's transaction)"""
+    record_bests(db, {(user_id, problem_id): (time_seconds, key_strokes, ccpm)})
+
+
+def record_bests(db: Session, bests: Bests):
+    """
+    Merge pending bests into the rollup with one statement (part of the caller's transaction).
+    Rows are written in key order to avoid deadlocks between concurrent multi-row upserts.
+    """
+    if not bests:
+        return
+    rows = [
+        {
+            "user_id": user_id,
+            "problem_id": problem_id,
+            "best_time": best_time,
+            "best_key_strokes": best_key_strokes,
+            "best_ccpm": best_ccpm,
+        }
+        for (user_id, problem_id), (best_time, best_key_strokes, best_ccpm) in sorted(bests.items())
+    ]
+    db.execute(_merge_bests(insert(UserProblemBest).values(rows)))
+
+
+def backfill_bests(db: Session, first_user_id: int, last_user_id: int) -> int:
+    """
+    Merge the bests of every attempt by users first_user_id..last_user_id (inclusive)
+    into the rollup. Safe to run while attempts are being stored. Returns the rows written.
+    """
+    aggregated = select(
+        Attempt.user_id,
+        Attempt.problem_id,
+        func.min(Attempt.time_seconds),
+        func.min(Attempt.key_strokes),
+        func.max(Attempt.ccpm),
+    ).where(
+        Attempt.user_id.between(first_user_id, last_user_id)
+    ).group_by(Attempt.user_id, Attempt.problem_id)
+    statement = insert(UserProblemBest).from_select(
+        ["user_id", "problem_id", "best_time", "best_key_strokes", "best_ccpm"], aggregated
+    )
+    return db.execute(_merge_bests(statement)).rowcount
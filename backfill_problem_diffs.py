@@ -0,0 +1,59 @@
+"""
+Script to compute the diff metadata (edit_script, changed_chars, min_key_strokes) of
+problems stored before it existed.
+
+New and edited problems get it when they are stored; run this once after
+`python migrate.py` adds the columns. Problems are processed in batches of
+--batch-size, each in its own transaction, and only those still missing metadata are
+touched, so the script is safe to re-run. Each batch bumps the catalog version, so
+workers pick up the metadata within CATALOG_VERSION_CHECK_SECONDS.
+
+Usage:
+    python backfill_problem_diffs.py [--batch-size 500]
+"""
+import argparse
+import time
+from sqlalchemy import select
+from app.database import SessionLocal
+from app.diffing import fill_diff_metadata
+from app.models import Problem
+import app.catalog  # noqa: F401  (bumps the catalog version when problems change)
+
+
+def backfill_problem_diffs(batch_size: int = 500):
+    """Fill in missing diff metadata, one batch of problems per transaction"""
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        done = 0
+        last_id = 0
+        while True:
+            problems = db.execute(
+                select(Problem)
+                .where(Problem.changed_chars.is_(None), Problem.id > last_id)
+                .order_by(Problem.id)
+                .limit(batch_size)
+            ).scalars().all()
+            if not problems:
+                break
+            for problem in problems:
+                fill_diff_metadata(problem)
+            last_id = problems[-1].id
+            db.commit()
+            done += len(problems)
+            print(f"  {done} problems...")
+        elapsed = time.perf_counter() - started
+        print(f"✓ Computed diff metadata for {done} problems in {elapsed:.1f}s")
+    except Exception as e:
+        db.rollback()
+        print(f"✗ Error backfilling problem diff metadata: {e}")
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compute diff metadata for existing problems")
+    parser.add_argument("--batch-size", type=int, default=500, help="Problems per transaction")
+    args = parser.parse_args()
+    backfill_problem_diffs(args.batch_size)
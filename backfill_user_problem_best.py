@@ -0,0 +1,50 @@
+"""
+Script to build the user_problem_best rollup from the existing attempts.
+
+Run this once after upgrading to a version that maintains user_problem_best (new
+attempts update it as they are stored). Users are processed in ranges of
+--batch-users IDs, each in its own transaction, so no long-running transaction
+holds locks on the rollup. Results are merged with the stored bests, so the script
+is safe to re-run and to run while the API is serving attempts.
+
+Usage:
+    python backfill_user_problem_best.py [--batch-users 1000]
+"""
+import argparse
+import time
+from sqlalchemy import func, select
+from app.database import SessionLocal
+from app.models import Attempt
+from app.user_best import backfill_bests
+
+
+def backfill_user_problem_best(batch_users: int = 1000):
+    """Backfill user_problem_best from attempts, one range of user IDs at a time"""
+    db = SessionLocal()
+    try:
+        first, last = db.execute(select(func.min(Attempt.user_id), func.max(Attempt.user_id))).one()
+        if first is None:
+            print("No attempts by logged-in users; nothing to backfill.")
+            return
+
+        print(f"Backfilling best attempts for user IDs {first}..{last}...")
+        started = time.perf_counter()
+        rows = 0
+        for start in range(first, last + 1, batch_users):
+            rows += backfill_bests(db, start, min(start + batch_users - 1, last))
+            db.commit()
+        elapsed = time.perf_counter() - started
+        print(f"✓ Wrote {rows} user/problem bests in {elapsed:.1f}s")
+    except Exception as e:
+        db.rollback()
+        print(f"✗ Error backfilling user_problem_best: {e}")
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build user_problem_best from existing attempts")
+    parser.add_argument("--batch-users", type=int, default=1000, help="User IDs per transaction")
+    args = parser.parse_args()
+    backfill_user_problem_best(args.batch_users)
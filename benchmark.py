@@ -0,0 +1,899 @@
+"""
+Benchmarks for the performance-sensitive parts of the Mouseless API.
+
+Benchmarks that need a database run against DATABASE_URL, but inside a temporary
+schema that is dropped afterwards, so existing data is never touched.
+
+Usage:
+    python benchmark.py random-problem [--sizes 10,1000,100000,1000000] [--iterations 1000]
+    python benchmark.py histogram-concurrency [--submissions 5000] [--workers 32]
+    python benchmark.py db-modes [--concurrency 200] [--requests 20000] [--path /api/problems/random]
+    python benchmark.py binning [--values 1000000]
+    python benchmark.py histogram-storage [--problems 10000] [--updates 20000]
+    python benchmark.py leaderboard [--users 50000] [--attempts-per-user 4] [--readers 8] [--writers 4]
+    python benchmark.py attempt-history [--attempts 1000000]
+    python benchmark.py recommender [--sizes 1000,100000,1000000] [--picks 100000]
+    python benchmark.py diff [--lines 1000,10000,100000]
+    python benchmark.py problem-import [--problems 50000] [--workers 4]
+    python benchmark.py synthetic-data [--users 20000] [--problems 1000] [--workers 4]
+"""
+import argparse
+import asyncio
+import difflib
+import json
+import os
+import socket
+import subprocess
+import sys
+import random
+import statistics
+import time
+import tracemalloc
+import numpy as np
+from collections import Counter
+from contextlib import contextmanager
+from typing import Callable, List
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.orm import Session
+from app.database import engine, Base
+from app.models import (
+    Attempt, HistogramDataType, Problem, ProblemHistogram, ProblemSketch, User
+)
+from app.diffing import apply_edit_script, diff_metadata
+from app.catalog import ProblemCatalog, catalog_version
+from app.attempt_history import HistoryCursor, export_query, format_rows, load_history_page
+from app.histogram_windows import HISTOGRAM_DAILY_RETENTION_DAYS
+from app.leaderboard import LeaderboardCache, Cursor, load_leaderboard_rows
+from app.histograms import (
+    HISTOGRAM_SPECS, MAX_BARS, HistogramDeltas, add_attempt_arrays, add_attempt_values,
+    attempt_histogram_deltas, apply_histogram_deltas, merge_histogram_deltas
+)
+from app.problem_pool import ProblemIdPool
+from app.recommender import UserProblemWeights
+from app.sketches import SketchDeltas, add_attempt_sketch_arrays
+from app.user_best import backfill_bests, record_best
+from generate_synthetic_data import SyntheticDataSettings, generate_synthetic_data, synthetic_problems
+from import_problems import ProblemRecord, import_problems
+
+BENCHMARK_SCHEMA = "mouseless_benchmark"
+
+
+@contextmanager
+def scratch_engine(pool_size: int = 5):
+    """
+    Yield an engine whose connections use a throwaway schema (via search_path) with
+    all tables created. The schema is dropped on exit.
+    """
+    with engine.begin() as connection:
+        connection.execute(text(f"DROP SCHEMA IF EXISTS {BENCHMARK_SCHEMA} CASCADE"))
+        connection.execute(text(f"CREATE SCHEMA {BENCHMARK_SCHEMA}"))
+
+    scratch = create_engine(
+        engine.url,
+        connect_args={"options": f"-csearch_path={BENCHMARK_SCHEMA}"},
+        pool_size=pool_size,
+        max_overflow=0,
+    )
+    try:
+        Base.metadata.create_all(bind=scratch)
+        yield scratch
+    finally:
+        scratch.dispose()
+        with engine.begin() as connection:
+            connection.execute(text(f"DROP SCHEMA IF EXISTS {BENCHMARK_SCHEMA} CASCADE"))
+
+
+@contextmanager
+def scratch_session():
+    """Yield a session on a scratch engine (see scratch_engine)"""
+    with scratch_engine() as scratch:
+        db = Session(bind=scratch)
+        try:
+            yield db
+        finally:
+            db.close()
+
+
+def time_calls(fn: Callable[[], object], iterations: int) -> List[float]:
+    """Call fn repeatedly and return the duration of each call in milliseconds"""
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000.0)
+    return samples
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def format_latency(samples: List[float]) -> str:
+    return (
+        f"mean {statistics.mean(samples):8.3f} ms   "
+        f"p50 {percentile(samples, 0.50):8.3f} ms   "
+        f"p99 {percentile(samples, 0.99):8.3f} ms"
+    )
+
+
+def insert_synthetic_problems(db: Session, start: int, end: int, text_size: int):
+    """Insert problems numbered start..end (inclusive) with text_size characters of text each"""
+    repeats = max(1, text_size // 32)
+    db.execute(
+        text(
+            "INSERT INTO problems (name, original_text, modified_text) "
+            "SELECT 'Problem ' || g, repeat(md5(g::text), :repeats), repeat(md5((g + 1)::text), :repeats) "
+            "FROM generate_series(:start, :end) AS g"
+        ),
+        {"start": start, "end": end, "repeats": repeats},
+    )
+    db.commit()
+    db.execute(text("ANALYZE problems"))
+    db.commit()
+
+
+def benchmark_random_problem(args):
+    """
+    Compare picking a random problem from the in-memory ID pool against ORDER BY random()
+    as the problems table grows.
+    """
+    sizes = sorted(int(size) for size in args.sizes.split(","))
+
+    with scratch_session() as db:
+        current_size = 0
+        for size in sizes:
+            insert_synthetic_problems(db, current_size + 1, size, args.text_size)
+            current_size = size
+
+            pool = ProblemIdPool()
+            refresh_samples = time_calls(lambda: pool.get_ids(db), 1)
+            catalog = ProblemCatalog()
+
+            def pick_from_pool():
+                db.expunge_all()  # Make every pick load its row from the database
+                return pool.pick(db)
+
+            def pick_from_catalog():
+                return pool.pick(db, catalog.get)
+
+            def pick_order_by_random():
+                db.expunge_all()
+                return db.query(Problem).order_by(text("random()")).first()
+
+            pool_samples = time_calls(pick_from_pool, args.iterations)
+            time_calls(pick_from_catalog, args.iterations)  # Warm the catalog cache
+            catalog_samples = time_calls(pick_from_catalog, args.iterations)
+            baseline_samples = time_calls(pick_order_by_random, args.baseline_iterations)
+
+            print(f"\n{size:,} problems (pool refresh took {refresh_samples[0]:.1f} ms)")
+            print(f"  id pool + primary key   {format_latency(pool_samples)}")
+            print(f"  id pool + catalog cache {format_latency(catalog_samples)}")
+            print(f"  ORDER BY random()       {format_latency(baseline_samples)}")
+
+        # Uniformity check on the smallest catalog: every ID should be picked about equally often
+        pool = ProblemIdPool()
+        pool.get_ids(db)
+        pool._ids = pool._ids[:sizes[0]]
+        draws = 100_000
+        counts = Counter(pool.pick_id(db) for _ in range(draws))
+        expected = draws / len(pool._ids)
+        chi_square = sum((count - expected) ** 2 / expected for count in counts.values())
+        print(
+            f"\nUniformity over {len(pool._ids)} IDs and {draws:,} draws: "
+            f"chi-square {chi_square:.1f} with {len(pool._ids) - 1} degrees of freedom"
+        )
+
+
+def random_attempt_values(rng: random.Random):
+    """Plausible (time_seconds, key_strokes, ccpm) for one attempt"""
+    return rng.uniform(0.5, 60.0), rng.randint(1, 120), rng.uniform(10.0, 2500.0)
+
+
+def benchmark_histogram_concurrency(args):
+    """
+    Throughput of many attempts submitted for one problem from parallel connections,
+    all merging into the same histogram rows (tests/test_histogram_concurrency.py checks
+    that no increment is lost).
+    """
+    rng = random.Random(0)
+    submissions = [random_attempt_values(rng) for _ in range(args.submissions)]
+
+    with scratch_engine(pool_size=args.workers) as scratch:
+        with Session(bind=scratch) as db:
+            problem = Problem(name="Concurrency", original_text="a", modified_text="b")
+            db.add(problem)
+            db.commit()
+            problem_id = problem.id
+
+        def submit(values):
+            with Session(bind=scratch) as db:
+                apply_histogram_deltas(db, attempt_histogram_deltas(problem_id, *values))
+                db.commit()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            list(executor.map(submit, submissions))
+        elapsed = time.perf_counter() - start
+
+    print(f"{args.submissions:,} submissions from {args.workers} workers in {elapsed:.2f} s "
+          f"({args.submissions / elapsed:,.0f} submissions/s)")
+
+
+async def http_load(host: str, port: int, path: str, headers: dict, concurrency: int, total: int):
+    """
+    Send `total` GET requests over `concurrency` keep-alive connections.
+    Returns (per-request latencies in ms, status code counts, elapsed seconds).
+    """
+    header_lines = "".join(f"{name}: {value}\r\n" for name, value in headers.items())
+    request = f"GET {path} HTTP/1.1\r\nHost: {host}\r\n{header_lines}\r\n".encode()
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    remaining = [total]
+
+    async def connection_loop():
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            while remaining[0] > 0:
+                remaining[0] -= 1
+                start = time.perf_counter()
+                writer.write(request)
+                await writer.drain()
+                status_line = await reader.readline()
+                content_length = 0
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    if name.lower() == "content-length":
+                        content_length = int(value)
+                await reader.readexactly(content_length)
+                latencies.append((time.perf_counter() - start) * 1000.0)
+                statuses[int(status_line.split()[1])] += 1
+        finally:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(connection_loop() for _ in range(concurrency)))
+    return latencies, statuses, time.perf_counter() - start
+
+
+def wait_for_port(host: str, port: int, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise SystemExit(f"Server did not start listening on {host}:{port}")
+
+
+def benchmark_db_modes(args):
+    """
+    Start the API once per DATABASE_MODE and measure requests/sec and latency of the same
+    endpoint under high concurrency. Runs against the (seeded) database in DATABASE_URL;
+    the default endpoint only reads.
+    """
+    headers = {"X-Session-ID": args.session_id} if args.session_id else {}
+    for mode in args.modes.split(","):
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", args.host, "--port", str(args.port),
+             "--log-level", "warning", "--no-access-log"],
+            env=dict(os.environ, DATABASE_MODE=mode),
+        )
+        try:
+            wait_for_port(args.host, args.port)
+            asyncio.run(http_load(args.host, args.port, args.path, headers, args.concurrency, args.concurrency * 5))
+            latencies, statuses, elapsed = asyncio.run(
+                http_load(args.host, args.port, args.path, headers, args.concurrency, args.requests)
+            )
+        finally:
+            server.terminate()
+            server.wait()
+
+        print(f"\n{mode} mode: {len(latencies) / elapsed:,.0f} requests/s "
+              f"({args.requests:,} requests, {args.concurrency} connections)")
+        print(f"  {format_latency(latencies)}")
+        print(f"  status codes: {dict(statuses)}")
+
+
+def benchmark_binning(args):
+    """
+    Histogram binning throughput: the scalar path live attempts use, one value at a time,
+    against the vectorized NumPy path used by rebuilds and synthetic data
+    (tests/test_histograms.py checks that both give identical bins).
+    """
+    rng = np.random.default_rng(0)
+    count = args.values
+    problem_ids = rng.integers(1, args.problems + 1, count)
+    time_seconds = rng.lognormal(2.3, 0.8, count)
+    key_strokes = rng.geometric(1 / 25.0, count).astype(np.float64)
+    ccpm = rng.lognormal(6.5, 0.9, count)
+
+    for data_type, spec in HISTOGRAM_SPECS.items():
+        values = {"time": time_seconds, "strokes": key_strokes, "ccpm": ccpm}[data_type.value]
+        started = time.perf_counter()
+        for value in values.tolist():
+            spec.bin_index(value)
+        scalar_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        spec.bin_indices(values)
+        vector_seconds = time.perf_counter() - started
+        print(
+            f"  {data_type.value:<8} scalar {count / scalar_seconds / 1e6:7.2f} M values/s   "
+            f"vectorized {count / vector_seconds / 1e6:8.2f} M values/s   "
+            f"({scalar_seconds / vector_seconds:,.0f}x)"
+        )
+
+    # Whole attempts into per-problem histograms, as a rebuild does
+    rows = list(zip(problem_ids.tolist(), time_seconds.tolist(), key_strokes.tolist(), ccpm.tolist()))
+    started = time.perf_counter()
+    scalar_deltas: HistogramDeltas = {}
+    for row in rows:
+        add_attempt_values(scalar_deltas, *row)
+    scalar_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    vector_deltas: HistogramDeltas = {}
+    add_attempt_arrays(vector_deltas, problem_ids, time_seconds, key_strokes, ccpm)
+    vector_seconds = time.perf_counter() - started
+    print(
+        f"\n{count:,} attempts over {args.problems} problems: scalar {scalar_seconds:.2f} s, "
+        f"vectorized {vector_seconds:.3f} s ({count / vector_seconds / 1e6:.1f} M attempts/s)."
+    )
+
+    single = time_calls(lambda: attempt_histogram_deltas(1, 12.3, 40, 830.0), 100000)
+    print(f"Single attempt (scalar path): {statistics.mean(single) * 1000:.2f} µs per attempt")
+
+
+def benchmark_histogram_storage(args):
+    """
+    Compare the old float8[] histogram encoding with int4[]: table size, WAL written by
+    the atomic merge upsert, and the JSON payload and decode cost of problem fetches.
+    """
+    rng = random.Random(0)
+    histograms = [
+        (problem_id, data_type, [rng.randint(0, 50000) for _ in range(MAX_BARS)])
+        for problem_id in range(1, args.problems + 1)
+        for data_type in ("TIME", "STROKES", "CCPM")
+    ]
+    with scratch_engine() as scratch:
+        for label, element_type in (("float8[]", "double precision"), ("int4[]", "integer")):
+            table = f"histograms_{element_type.split()[0]}"
+            with scratch.begin() as connection:
+                connection.execute(text(
+                    f"CREATE TABLE {table} (problem_id integer, data_type text, "
+                    f"\"values\" {element_type}[], UNIQUE (problem_id, data_type))"
+                ))
+                connection.execute(
+                    text(f"INSERT INTO {table} VALUES (:problem_id, :data_type, :values)"),
+                    [{"problem_id": p, "data_type": d, "values": v} for p, d, v in histograms],
+                )
+                size = connection.execute(text(f"SELECT pg_total_relation_size('{table}')")).scalar()
+
+            upsert = text(
+                f"INSERT INTO {table} VALUES (:problem_id, :data_type, :values) "
+                f"ON CONFLICT (problem_id, data_type) DO UPDATE SET \"values\" = "
+                f"(SELECT array_agg(coalesce(merged.old, 0) + coalesce(merged.delta, 0) ORDER BY merged.ord) "
+                f"FROM unnest({table}.\"values\", excluded.\"values\") WITH ORDINALITY AS merged(old, delta, ord))"
+            )
+            updates = [
+                {"problem_id": rng.randint(1, args.problems), "data_type": "TIME",
+                 "values": [0] * rng.randint(0, MAX_BARS - 1) + [1]}
+                for _ in range(args.updates)
+            ]
+            with scratch.begin() as connection:
+                wal_start = connection.execute(text("SELECT pg_current_wal_lsn()")).scalar()
+            started = time.perf_counter()
+            with scratch.begin() as connection:
+                for update in updates:
+                    connection.execute(upsert, update)
+            update_seconds = time.perf_counter() - started
+            with scratch.begin() as connection:
+                wal_bytes = connection.execute(
+                    text("SELECT pg_wal_lsn_diff(pg_current_wal_lsn(), :start)"), {"start": wal_start}
+                ).scalar()
+
+            with scratch.connect() as connection:
+                started = time.perf_counter()
+                rows = connection.execute(text(f"SELECT \"values\" FROM {table}")).scalars().all()
+                decode_seconds = time.perf_counter() - started
+            payload = sum(len(json.dumps(values)) for values in rows) / len(rows)
+
+            print(f"\n{label}")
+            print(f"  table + indexes   {size / 1024 / 1024:8.2f} MB for {len(histograms):,} histograms")
+            print(f"  WAL per upsert    {wal_bytes / args.updates:8.0f} bytes ({args.updates:,} upserts in {update_seconds:.1f} s)")
+            print(f"  fetch + decode    {decode_seconds * 1e6 / len(rows):8.2f} µs per histogram")
+            print(f"  JSON payload      {payload:8.0f} bytes per histogram")
+
+
+def group_by_leaderboard(db: Session, problem_id: int, limit: int):
+    """Top users by best time computed from attempts (what the leaderboard replaces)"""
+    return db.execute(text(
+        "SELECT a.user_id, u.username, min(a.time_seconds) AS best FROM attempts a JOIN users u ON u.id = a.user_id "
+        "WHERE a.problem_id = :problem_id GROUP BY a.user_id, u.username ORDER BY best, a.user_id LIMIT :limit"
+    ), {"problem_id": problem_id, "limit": limit}).all()
+
+
+def benchmark_leaderboard(args):
+    """
+    Leaderboard reads (cached top pages and deep keyset pages) mixed with concurrent
+    attempt writes for one problem, compared with a GROUP BY over attempts. Exits with
+    an error if the final leaderboard differs from the one computed from attempts.
+    """
+    with scratch_engine(pool_size=args.readers + args.writers + 1) as scratch:
+        with Session(bind=scratch) as db:
+            problem = Problem(name="Leaderboard", original_text="a", modified_text="b")
+            db.add(problem)
+            db.commit()
+            problem_id = problem.id
+            db.execute(text(
+                "INSERT INTO users (username, hashed_password) SELECT 'user' || g, 'x' FROM generate_series(1, :users) AS g"
+            ), {"users": args.users})
+            db.execute(text(
+                "INSERT INTO attempts (user_id, problem_id, time_seconds, key_strokes, ccpm) "
+                "SELECT u.id, :problem_id, 5 + random() * 55, 10 + (random() * 90)::int, 50 + random() * 2000 "
+                "FROM users u, generate_series(1, :attempts)"
+            ), {"problem_id": problem_id, "attempts": args.attempts_per_user})
+            backfill_bests(db, 1, 2 ** 31 - 1)
+            db.commit()
+            db.execute(text("ANALYZE"))
+            db.commit()
+            user_ids = list(db.execute(select(User.id)).scalars())
+
+            print(f"{args.users:,} users, {args.users * args.attempts_per_user:,} attempts")
+            print(f"  GROUP BY attempts, top 10     {format_latency(time_calls(lambda: group_by_leaderboard(db, problem_id, 10), 20))}")
+            print(f"  index scan, top 10            {format_latency(time_calls(lambda: load_leaderboard_rows(db, problem_id, HistogramDataType.TIME, None, 10), 200))}")
+            middle = load_leaderboard_rows(db, problem_id, HistogramDataType.TIME, None, args.users // 2)[-1]
+            print(f"  keyset page at rank {middle.rank:<8,} {format_latency(time_calls(lambda: load_leaderboard_rows(db, problem_id, HistogramDataType.TIME, Cursor.after(middle), 10), 200))}")
+            db.rollback()
+
+        cache = LeaderboardCache()
+        deadline = time.perf_counter() + args.duration
+        metrics = list(HistogramDataType)
+
+        def read(seed: int) -> List[float]:
+            rng = random.Random(seed)
+            samples = []
+            with Session(bind=scratch) as db:
+                while time.perf_counter() < deadline:
+                    after = Cursor(rng.randrange(1, args.users // 2), rng.choice(user_ids), rng.uniform(5, 60)) \
+                        if rng.random() < args.deep_fraction else None
+                    start = time.perf_counter()
+                    cache.page(db, problem_id, rng.choice(metrics), after, 10)
+                    samples.append((time.perf_counter() - start) * 1000.0)
+                    db.rollback()
+            return samples
+
+        def write(seed: int) -> int:
+            rng = random.Random(seed)
+            writes = 0
+            with Session(bind=scratch) as db:
+                while time.perf_counter() < deadline:
+                    user_id = rng.choice(user_ids)
+                    values = random_attempt_values(rng)
+                    db.add(Attempt(user_id=user_id, problem_id=problem_id, time_seconds=values[0],
+                                   key_strokes=values[1], ccpm=values[2]))
+                    record_best(db, user_id, problem_id, *values)
+                    db.commit()
+                    cache.forget(problem_id)
+                    writes += 1
+            return writes
+
+        with ThreadPoolExecutor(max_workers=args.readers + args.writers) as executor:
+            readers = [executor.submit(read, seed) for seed in range(args.readers)]
+            writers = [executor.submit(write, 1000 + seed) for seed in range(args.writers)]
+            samples = [sample for future in readers for sample in future.result()]
+            writes = sum(future.result() for future in writers)
+
+        print(f"\nMixed load for {args.duration:.0f} s: {args.readers} readers, {args.writers} writers "
+              f"({args.deep_fraction:.0%} of reads below the cached top {cache.top_n})")
+        if samples:
+            print(f"  reads  {len(samples) / args.duration:10,.0f}/s   {format_latency(samples)}")
+        print(f"  writes {writes / args.duration:10,.0f}/s")
+        print(f"  cache  {cache.stats()}")
+
+        with Session(bind=scratch) as db:
+            expected = [(user_id, best) for user_id, _, best in group_by_leaderboard(db, problem_id, 100)]
+            stored = [(row.user_id, row.value) for row in load_leaderboard_rows(db, problem_id, HistogramDataType.TIME, None, 100)]
+    if stored != expected:
+        raise SystemExit("Leaderboard differs from the one computed from attempts")
+    print("Leaderboard matches the attempts table.")
+
+
+def benchmark_attempt_history(args):
+    """
+    Deep pages of one prolific user's attempt history with OFFSET vs keyset pagination,
+    and the memory and throughput of a full streaming export vs loading every row.
+    """
+    with scratch_engine() as scratch:
+        with Session(bind=scratch) as db:
+            user = User(username="history", hashed_password="x")
+            problem = Problem(name="History", original_text="a", modified_text="b")
+            db.add_all([user, problem])
+            db.flush()
+            user_id = user.id
+            db.execute(text(
+                "INSERT INTO attempts (user_id, problem_id, time_seconds, key_strokes, ccpm, created_at) "
+                "SELECT :user_id, :problem_id, random() * 60, (random() * 100)::int, random() * 2000, "
+                "now() - g * interval '1 second' FROM generate_series(1, :attempts) AS g"
+            ), {"user_id": user_id, "problem_id": problem.id, "attempts": args.attempts})
+            db.commit()
+            db.execute(text("ANALYZE attempts"))
+            db.commit()
+
+            print(f"{args.attempts:,} attempts by one user, pages of {args.page_size}")
+            for depth in (0, args.attempts // 10, args.attempts // 2, args.attempts - args.page_size):
+                offset_page = text(
+                    "SELECT * FROM attempts WHERE user_id = :user_id ORDER BY created_at DESC, id DESC "
+                    "LIMIT :limit OFFSET :offset"
+                )
+                offset_samples = time_calls(lambda: db.execute(
+                    offset_page, {"user_id": user_id, "limit": args.page_size, "offset": depth}
+                ).all(), args.iterations)
+                after = None
+                if depth:
+                    last = db.execute(offset_page, {"user_id": user_id, "limit": 1, "offset": depth - 1}).one()
+                    after = HistoryCursor(last.created_at, last.id)
+                keyset_samples = time_calls(lambda: load_history_page(db, user_id, after, args.page_size), args.iterations)
+                db.rollback()
+                print(f"  row {depth:>10,}  OFFSET  {format_latency(offset_samples)}")
+                print(f"  {'':>14}  keyset  {format_latency(keyset_samples)}")
+
+        for label, streaming in (("load all rows", False), ("stream (server-side cursor)", True)):
+            tracemalloc.start()
+            start = time.perf_counter()
+            written = rows_read = 0
+            with Session(bind=scratch) as db:
+                query = export_query(user_id)
+                if streaming:
+                    chunks = db.execute(query).partitions()
+                else:
+                    chunks = [db.execute(query.execution_options(yield_per=None, stream_results=False)).all()]
+                for rows in chunks:
+                    written += len(format_rows(rows, "ndjson"))
+                    rows_read += len(rows)
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"\nExport, {label}: {rows_read:,} rows, {written / 1e6:,.1f} MB NDJSON in {elapsed:.2f} s "
+                  f"({rows_read / elapsed:,.0f} rows/s), peak Python memory {peak / 1e6:,.1f} MB")
+
+
+def benchmark_recommender(args):
+    """
+    Cost of a weighted next-problem pick, and of folding in an attempt, as the catalog
+    and the user's history grow (no database: the per-user state is built from synthetic
+    bests). tests/test_recommender.py checks the distribution of the picks.
+    """
+    rng = random.Random(0)
+    for size in (int(value) for value in args.sizes.split(",")):
+        pool = list(range(1, size + 1))
+        medians = {problem_id: 30.0 for problem_id in pool}
+        for share in (0.0, 0.1, 0.5, 0.95, 1.0):
+            attempted = rng.sample(pool, int(size * share))
+            # Best times spread over the mastered, average and behind classes
+            bests = {problem_id: rng.choice((20.0, 40.0, 60.0)) for problem_id in attempted}
+            state = UserProblemWeights(bests, medians)
+
+            start = time.perf_counter()
+            for _ in range(args.picks):
+                state.pick(rng, pool)
+            pick_us = (time.perf_counter() - start) / args.picks * 1e6
+
+            start = time.perf_counter()
+            for _ in range(args.picks):
+                state.record(rng.choice(attempted or pool), rng.choice((20.0, 40.0, 60.0)), 30.0)
+            record_us = (time.perf_counter() - start) / args.picks * 1e6
+
+            print(f"  catalog {size:>9,}  attempted {share:>4.0%}  pick {pick_us:6.2f} us  record attempt {record_us:6.2f} us")
+
+
+def synthetic_source(rng: random.Random, lines: int) -> List[str]:
+    """Lines of code-like text"""
+    names = ["total", "items", "user", "result", "count", "index", "value", "response"]
+    return [
+        f"{'    ' * rng.randint(0, 3)}const {rng.choice(names)}{index} = {rng.choice(names)}.map(x => x * {rng.randint(1, 99)});\n"
+        for index in range(lines)
+    ]
+
+
+def edited_variants(rng: random.Random, lines: List[str]) -> dict:
+    """Modified versions of a text, from a few scattered edits to a full rewrite"""
+    few = list(lines)
+    for index in rng.sample(range(len(few)), min(10, len(few))):
+        few[index] = few[index].replace("const", "let", 1).replace("x * ", "x + ", 1)
+    many = list(lines)
+    for index in rng.sample(range(len(many)), len(many) // 20):
+        many[index] = many[index].replace("map", "filter", 1)
+    start = rng.randrange(len(lines) - 20)
+    block = lines[start:start + 20]
+    moved = lines[:start] + lines[start + 20:]
+    target = rng.randrange(len(moved))
+    moved = moved[:target] + block + moved[target:]
+    return {
+        "10 line edits": "".join(few),
+        "5% lines edited": "".join(many),
+        "20-line block moved": "".join(moved),
+        "rewritten": "".join(synthetic_source(rng, len(lines))),
+    }
+
+
+def benchmark_diff(args):
+    """
+    Time the ingest-time diff (app/diffing.py) on large texts, against a character-level
+    difflib.SequenceMatcher where that finishes in reasonable time. Exits with an error if
+    an edit script doesn't reproduce the modified text.
+    """
+    rng = random.Random(0)
+    failures = []
+    for size in (int(value) for value in args.lines.split(",")):
+        original = synthetic_source(rng, size)
+        original_text = "".join(original)
+        print(f"\n{size:,} lines ({len(original_text):,} characters)")
+        for label, modified_text in edited_variants(rng, original).items():
+            start = time.perf_counter()
+            metadata = diff_metadata(original_text, modified_text)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            if apply_edit_script(original_text, metadata.edit_script) != modified_text:
+                failures.append(f"{size} lines, {label}: edit script doesn't reproduce the modified text")
+            line = (
+                f"  {label:<20} {elapsed_ms:9.1f} ms  {len(metadata.edit_script):>6} hunks  "
+                f"{metadata.changed_chars:>9,} changed chars  min {metadata.min_key_strokes} keystrokes"
+            )
+            if len(original_text) <= args.baseline_max_chars:
+                start = time.perf_counter()
+                matcher = difflib.SequenceMatcher(None, original_text, modified_text, autojunk=False)
+                baseline_changed = sum(
+                    (i2 - i1) + (j2 - j1) for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != "equal"
+                )
+                line += f"  (difflib {(time.perf_counter() - start) * 1000:9.1f} ms, {baseline_changed:,} changed chars)"
+            print(line)
+
+    if failures:
+        raise SystemExit("Diff mismatch:\n  " + "\n  ".join(failures))
+    print("\nAll edit scripts reproduce the modified text.")
+
+
+def synthetic_problem_records(rng: random.Random, count: int, version: int = 0) -> List[ProblemRecord]:
+    """Small code-editing problems (a few lines with one or two changes each)"""
+    records = []
+    for index in range(count):
+        lines = synthetic_source(rng, rng.randint(3, 30))
+        modified = list(lines)
+        for line in rng.sample(range(len(lines)), min(2, len(lines))):
+            modified[line] = modified[line].replace("map", "filter", 1)
+        name = f"Synthetic problem {index}"
+        records.append(ProblemRecord(name, name, "".join(lines), "".join(modified) + "// v" * version))
+    return records
+
+
+def benchmark_problem_import(args):
+    """
+    Throughput of import_problems.py into an empty catalog, a re-import of the same
+    problems (all skipped by content hash) and a re-import with a share of them changed.
+    Exits with an error if the problems table doesn't end up matching the last import.
+    """
+    rng = random.Random(0)
+    records = synthetic_problem_records(rng, args.problems)
+    changed = list(records)
+    for index in rng.sample(range(len(changed)), int(len(changed) * args.changed_share)):
+        record = changed[index]
+        changed[index] = record._replace(modified_text=record.modified_text + "// changed\n")
+
+    failures = []
+    with scratch_engine() as scratch:
+        for label, batch, expected in (
+            ("initial import", records, {"inserted": len(records), "updated": 0, "unchanged": 0}),
+            ("re-import, unchanged", records, {"inserted": 0, "updated": 0, "unchanged": len(records)}),
+            (f"re-import, {args.changed_share:.0%} changed", changed, {
+                "inserted": 0,
+                "updated": int(len(records) * args.changed_share),
+                "unchanged": len(records) - int(len(records) * args.changed_share),
+            }),
+        ):
+            start = time.perf_counter()
+            counts = import_problems(batch, args.workers, args.chunk_size, bind=scratch)
+            elapsed = time.perf_counter() - start
+            print(f"  {label:<22} {len(batch) / elapsed:>10,.0f} problems/s  {counts}")
+            if counts != expected:
+                failures.append(f"{label}: {counts}, expected {expected}")
+
+        with Session(bind=scratch) as db:
+            stored = {
+                problem.import_key: problem for problem in db.execute(select(Problem)).scalars()
+            }
+            missing_metadata = sum(problem.changed_chars is None for problem in stored.values())
+            mismatched = sum(
+                stored[record.key].modified_text != record.modified_text for record in changed if record.key in stored
+            )
+            version = catalog_version.current(db)
+        if len(stored) != len(changed) or mismatched or missing_metadata:
+            failures.append(f"{len(stored)} problems stored for {len(changed)} imported, {mismatched} with stale "
+                            f"texts, {missing_metadata} without diff metadata")
+        print(f"  catalog version after the imports: {version}")
+
+    if failures:
+        raise SystemExit("Import mismatch:\n  " + "\n  ".join(failures))
+    print("Problems table matches the last import.")
+
+
+def benchmark_synthetic_data(args):
+    """
+    Throughput of generate_synthetic_data.py into a catalog of --problems problems (one of
+    them without diff metadata), run twice so the second run merges into existing data.
+    Exits with an error if the histograms, windows, sketches or user bests don't match
+    the stored attempts, or if any attempt couldn't have been accepted by the API.
+    """
+    failures = []
+    with scratch_engine() as scratch:
+        import_problems(synthetic_problems(0, args.problems), bind=scratch)
+        with scratch.begin() as connection:
+            connection.execute(text(
+                "UPDATE problems SET edit_script = NULL, changed_chars = NULL, min_key_strokes = NULL "
+                "WHERE id = (SELECT min(id) FROM problems)"
+            ))
+
+        for seed in (0, 1):
+            settings = SyntheticDataSettings(
+                users=args.users, attempts_per_user=args.attempts_per_user, days=args.days, seed=seed
+            )
+            start = time.perf_counter()
+            totals = generate_synthetic_data(settings, args.workers, args.chunk_users, bind=scratch)
+            elapsed = time.perf_counter() - start
+            print(f"  run {seed + 1}: {totals['users']:,} users, {totals['sessions']:,} sessions, "
+                  f"{totals['attempts']:,} attempts in {elapsed:.1f}s ({totals['attempts'] / elapsed:,.0f} attempts/s)")
+
+        with Session(bind=scratch) as db:
+            rows = db.execute(select(
+                Attempt.problem_id, Attempt.time_seconds, Attempt.key_strokes, Attempt.ccpm
+            )).all()
+            problem_ids, time_seconds, key_strokes, ccpm = (np.array(column) for column in zip(*rows))
+            expected_histograms: HistogramDeltas = {}
+            add_attempt_arrays(expected_histograms, problem_ids, time_seconds, key_strokes, ccpm)
+            stored_histograms = {
+                (histogram.problem_id, histogram.data_type): histogram.values
+                for histogram in db.execute(select(ProblemHistogram)).scalars()
+            }
+            if stored_histograms != expected_histograms:
+                failures.append("problem_histograms differ from histograms of the attempts")
+
+            window_sums: HistogramDeltas = {}
+            for problem_id, data_type, values in db.execute(text(
+                'SELECT problem_id, data_type, "values" FROM problem_histogram_windows'
+            )).all():
+                merge_histogram_deltas(window_sums, {(problem_id, HistogramDataType[data_type]): values})
+            if args.days <= HISTOGRAM_DAILY_RETENTION_DAYS and window_sums != expected_histograms:
+                failures.append("histogram windows don't add up to the histograms of the attempts")
+
+            expected_sketches: SketchDeltas = {}
+            add_attempt_sketch_arrays(expected_sketches, problem_ids, time_seconds, key_strokes, ccpm)
+            stored_sketches = {
+                (sketch.problem_id, sketch.metric): (sketch.zero_count, {int(key): count for key, count in sketch.counts.items()})
+                for sketch in db.execute(select(ProblemSketch)).scalars()
+            }
+            if stored_sketches != {key: (sketch.zero_count, sketch.counts) for key, sketch in expected_sketches.items()}:
+                failures.append("problem_sketches differ from sketches of the attempts")
+
+            best_differences = db.execute(text("""
+                SELECT count(*) FROM (
+                    (SELECT user_id, problem_id, min(time_seconds), min(key_strokes), max(ccpm)
+                     FROM attempts GROUP BY user_id, problem_id
+                     EXCEPT SELECT user_id, problem_id, best_time, best_key_strokes, best_ccpm FROM user_problem_best)
+                    UNION ALL
+                    (SELECT user_id, problem_id, best_time, best_key_strokes, best_ccpm FROM user_problem_best
+                     EXCEPT SELECT user_id, problem_id, min(time_seconds), min(key_strokes), max(ccpm)
+                     FROM attempts GROUP BY user_id, problem_id)
+                ) AS differences
+            """)).scalar()
+            if best_differences:
+                failures.append(f"{best_differences} user_problem_best rows differ from the attempts")
+
+            impossible = db.execute(text("""
+                SELECT count(*) FROM attempts JOIN problems ON problems.id = attempts.problem_id
+                WHERE attempts.time_seconds <= 0 OR attempts.key_strokes < coalesce(problems.min_key_strokes, 0)
+                    OR abs(attempts.ccpm - problems.changed_chars * 60 / attempts.time_seconds) > 1e-9 * attempts.ccpm
+            """)).scalar()
+            if impossible:
+                failures.append(f"{impossible} attempts the API would have rejected or scored differently")
+            print(f"  {len(rows):,} attempts, {len(stored_histograms):,} histograms, "
+                  f"{sum(len(sketch[1]) for sketch in stored_sketches.values()):,} sketch buckets checked")
+
+    if failures:
+        raise SystemExit("Synthetic data mismatch:\n  " + "\n  ".join(failures))
+    print("Histograms, windows, sketches and user bests match the generated attempts.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mouseless API benchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    random_problem = subparsers.add_parser("random-problem", help="Random problem selection latency")
+    random_problem.add_argument("--sizes", default="10,1000,100000,1000000", help="Comma-separated catalog sizes")
+    random_problem.add_argument("--iterations", type=int, default=1000, help="Pool picks per size")
+    random_problem.add_argument("--baseline-iterations", type=int, default=20, help="ORDER BY random() picks per size")
+    random_problem.add_argument("--text-size", type=int, default=512, help="Characters per problem text column")
+    random_problem.set_defaults(run=benchmark_random_problem)
+
+    histogram_concurrency = subparsers.add_parser(
+        "histogram-concurrency", help="Parallel attempt submissions against one problem's histograms"
+    )
+    histogram_concurrency.add_argument("--submissions", type=int, default=5000, help="Number of attempts to submit")
+    histogram_concurrency.add_argument("--workers", type=int, default=32, help="Parallel connections")
+    histogram_concurrency.set_defaults(run=benchmark_histogram_concurrency)
+
+    db_modes = subparsers.add_parser("db-modes", help="Throughput and p99 latency of sync vs async database mode")
+    db_modes.add_argument("--modes", default="sync,async", help="Comma-separated DATABASE_MODE values to compare")
+    db_modes.add_argument("--path", default="/api/problems/random", help="Endpoint to request")
+    db_modes.add_argument("--session-id", default=None, help="Optional X-Session-ID to send")
+    db_modes.add_argument("--concurrency", type=int, default=200, help="Concurrent keep-alive connections")
+    db_modes.add_argument("--requests", type=int, default=20000, help="Measured requests per mode")
+    db_modes.add_argument("--host", default="127.0.0.1")
+    db_modes.add_argument("--port", type=int, default=8765)
+    db_modes.set_defaults(run=benchmark_db_modes)
+
+    binning = subparsers.add_parser("binning", help="Scalar vs vectorized histogram binning throughput")
+    binning.add_argument("--values", type=int, default=1000000, help="Synthetic attempts to bin")
+    binning.add_argument("--problems", type=int, default=1000, help="Problems the attempts are spread over")
+    binning.set_defaults(run=benchmark_binning)
+
+    histogram_storage = subparsers.add_parser(
+        "histogram-storage", help="Table size, WAL and payload of float8[] vs int4[] histograms"
+    )
+    histogram_storage.add_argument("--problems", type=int, default=10000, help="Problems (3 histograms each)")
+    histogram_storage.add_argument("--updates", type=int, default=20000, help="Upserts measured for WAL volume")
+    histogram_storage.set_defaults(run=benchmark_histogram_storage)
+
+    leaderboard = subparsers.add_parser("leaderboard", help="Leaderboard reads mixed with attempt writes")
+    leaderboard.add_argument("--users", type=int, default=50000, help="Users with a best result for the problem")
+    leaderboard.add_argument("--attempts-per-user", type=int, default=4, help="Attempts per user before the run")
+    leaderboard.add_argument("--readers", type=int, default=8, help="Threads reading leaderboard pages")
+    leaderboard.add_argument("--writers", type=int, default=4, help="Threads storing attempts")
+    leaderboard.add_argument("--duration", type=float, default=10.0, help="Seconds of mixed load")
+    leaderboard.add_argument("--deep-fraction", type=float, default=0.2, help="Share of reads that are keyset pages")
+    leaderboard.set_defaults(run=benchmark_leaderboard)
+
+    attempt_history = subparsers.add_parser(
+        "attempt-history", help="Attempt history OFFSET vs keyset pages, and streaming export memory"
+    )
+    attempt_history.add_argument("--attempts", type=int, default=1000000, help="Attempts by the one user")
+    attempt_history.add_argument("--page-size", type=int, default=20, help="Attempts per page")
+    attempt_history.add_argument("--iterations", type=int, default=20, help="Page fetches per depth and method")
+    attempt_history.set_defaults(run=benchmark_attempt_history)
+
+    recommender = subparsers.add_parser("recommender", help="Next-problem pick cost vs catalog and history size")
+    recommender.add_argument("--sizes", default="1000,100000,1000000", help="Comma-separated catalog sizes")
+    recommender.add_argument("--picks", type=int, default=100000, help="Picks (and recorded attempts) per case")
+    recommender.set_defaults(run=benchmark_recommender)
+
+    diff = subparsers.add_parser("diff", help="Ingest-time problem diff on large texts")
+    diff.add_argument("--lines", default="1000,10000,100000", help="Comma-separated text sizes in lines")
+    diff.add_argument("--baseline-max-chars", type=int, default=5000,
+                      help="Largest text also diffed with difflib (much slower)")
+    diff.set_defaults(run=benchmark_diff)
+
+    problem_import = subparsers.add_parser("problem-import", help="Bulk problem import throughput")
+    problem_import.add_argument("--problems", type=int, default=50000)
+    problem_import.add_argument("--changed-share", type=float, default=0.1, help="Share of problems changed before the last import")
+    problem_import.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    problem_import.add_argument("--chunk-size", type=int, default=5000)
+    problem_import.set_defaults(run=benchmark_problem_import)
+
+    synthetic_data = subparsers.add_parser("synthetic-data", help="Synthetic data generator throughput and consistency")
+    synthetic_data.add_argument("--users", type=int, default=20000, help="Users per generator run")
+    synthetic_data.add_argument("--attempts-per-user", type=float, default=10.0)
+    synthetic_data.add_argument("--problems", type=int, default=1000)
+    synthetic_data.add_argument("--days", type=float, default=30.0, help="Attempts are spread over this many past days")
+    synthetic_data.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    synthetic_data.add_argument("--chunk-users", type=int, default=5000)
+    synthetic_data.set_defaults(run=benchmark_synthetic_data)
+
+    args = parser.parse_args()
+    random.seed(0)
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,28 +3,33 @@ Script to generate bell curve histogram statistics for all problems.
 This creates/updates histogram data for TIME, STROKES, and CCPM data types.
 
 Each histogram follows a bell curve (normal distribution) with all 25 bars filled.
+No attempts are created; for realistic attempts with matching histograms, sketches and
+best results see generate_synthetic_data.py.
 
 Usage:
     python generate_histogram_stats.py
 """
 import math
 from typing import List
+import numpy as np
 from sqlalchemy.orm import Session
 from app.database import SessionLocal, engine, Base
+from app.histograms import MAX_BARS
 from app.models import Problem, ProblemHistogram, HistogramDataType
 
 
-def normal_pdf(x: float, mean: float, std_dev: float) -> float:
+def normal_pdf(x, mean: float, std_dev: float):
     """
     Calculate the probability density function of a normal distribution.
+    Accepts a single value or a NumPy array of values.
     """
     variance = std_dev ** 2
     coefficient = 1 / math.sqrt(2 * math.pi * variance)
-    exponent = -((x - mean) ** 2) / (2 * variance)
-    return coefficient * math.exp(exponent)
+    exponent = -((np.asarray(x, dtype=np.float64) - mean) ** 2) / (2 * variance)
+    return coefficient * np.exp(exponent)
 
 
-def generate_bell_curve_counts(num_bins: int = 25, mean: float = 12.0, std_dev: float = 4.0, min_total: int = 500) -> List[float]:
+def generate_bell_curve_counts(num_bins: int = MAX_BARS, mean: float = 12.0, std_dev: float = 4.0, min_total: int = 500) -> List[int]:
     """
     Generate bell curve distribution counts for histogram bins.
     
@@ -35,30 +40,16 @@ def generate_bell_curve_counts(num_bins: int = 25, mean: float = 12.0, std_dev:
         min_total: Minimum total count across all bins (default 500 users)
     
     Returns:
-        List of counts (floats) for each bin, ensuring all bins have at least 1 count
+        List of (integer) counts for each bin, ensuring all bins have at least 1 count
     """
-    # Generate probabilities for each bin using normal distribution
-    probabilities = []
-    for bin_index in range(num_bins):
-        prob = normal_pdf(float(bin_index), mean, std_dev)
-        probabilities.append(prob)
+    # Probabilities for all bins at once, normalized so they sum to 1
+    probabilities = normal_pdf(np.arange(num_bins), mean, std_dev)
+    probabilities /= probabilities.sum()
     
-    # Normalize probabilities so they sum to 1
-    total_prob = sum(probabilities)
-    normalized_probs = [p / total_prob for p in probabilities]
-    
-    # Scale to minimum total count, ensuring each bin gets at least 1
-    # First, distribute the minimum across all bins
-    base_counts = [1.0] * num_bins  # At least 1 count per bin
+    # Scale to minimum total count, ensuring each bin gets at least 1:
+    # every bin starts at 1, the remaining count follows the bell curve
     remaining_count = max(0, min_total - num_bins)
-    
-    # Add remaining counts proportional to the bell curve distribution
-    counts = []
-    for i, prob in enumerate(normalized_probs):
-        additional = prob * remaining_count
-        counts.append(float(base_counts[i] + additional))
-    
-    return counts
+    return np.rint(1.0 + probabilities * remaining_count).astype(np.int64).tolist()
 
 
 def generate_histogram_stats_for_problem(db: Session, problem_id: int):
@@ -74,7 +65,7 @@ def generate_histogram_stats_for_problem(db: Session, problem_id: int):
     # Generate bell curve counts for all 25 bins
     # Mean around bin 12 (middle), std_dev 4.0 spreads it nicely
     bell_curve_counts = generate_bell_curve_counts(
-        num_bins=25,
+        num_bins=MAX_BARS,
         mean=12.0,
         std_dev=4.0,
         min_total=600  # Total of ~600 users per histogram type
@@ -0,0 +1,524 @@
+"""
+Script to generate production-scale synthetic users, sessions and attempts, for load
+and query-plan testing.
+
+Every generated user gets a skill factor, a heavy-tailed number of attempts and a
+Poisson number of sessions, spread over the last --days days. Attempts pick problems by
+popularity (a Zipf law over a random ranking of the catalog) and draw their values from
+per-problem distributions:
+- time: lognormal around the problem's median time (changed characters at --ccpm-median,
+  times a random per-problem difficulty), scaled by the user's skill,
+- key strokes: lognormal around changed characters x --strokes-per-char, never below the
+  problem's min_key_strokes,
+- CCPM: changed characters per minute of the attempt's time, as the API computes it.
+Any of these can be set per problem with --distributions, a JSON file:
+    {"problems": {"<problem id or import key>": {"weight": 5, "time_median": 12.5,
+        "time_sigma": 0.4, "strokes_median": 30, "strokes_sigma": 0.2, "ccpm_median": 400}}}
+(ccpm_median only sets the default time median).
+
+Users are generated --chunk-users at a time by --workers processes. Each chunk is written
+in one transaction: users, sessions, attempts and user_problem_best rows with COPY, then
+the chunk's histogram, histogram window and sketch increments, merged into the stored ones
+with the same element-wise upserts as live attempts. The derived tables stay consistent
+with the attempts after every chunk, and existing data is added to, never replaced.
+Window increments go to hourly rows within HISTOGRAM_HOURLY_RETENTION_HOURS and to daily
+rows before that, like the compactor leaves them; older attempts get none. The same seed
+and catalog generate the same data.
+
+Generated users are named synthetic_<id> and share the password --password. The users
+table is locked briefly to reserve their IDs.
+
+Usage:
+    python generate_synthetic_data.py --users 1000000 [--attempts-per-user 10] [--workers 4]
+    python generate_synthetic_data.py --users 100000 --problems 5000 --distributions distributions.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import create_engine, func, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.pool import NullPool
+from app.auth import hash_password
+from app.bulk_copy import copy_rows
+from app.database import engine
+from app.histogram_windows import (
+    COMPACTION_GRACE, HISTOGRAM_DAILY_RETENTION_DAYS, HISTOGRAM_HOURLY_RETENTION_HOURS, WINDOWS_TABLE, day_start,
+    histogram_compactor, merged_values_sql
+)
+from app.histograms import HISTOGRAM_SPECS, MERGED_VALUES_SQL, HistogramDeltas, add_attempt_arrays, trimmed_counts
+from app.models import HistogramDataType, HistogramGranularity, Problem
+from app.sketches import MERGED_COUNTS_SQL, SketchDeltas, add_attempt_sketch_arrays
+from import_problems import ProblemRecord, import_problems
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+# Increments of a chunk are staged here (per transaction) before being merged
+CREATE_STAGING_SQL = [
+    text("""
+        CREATE TEMPORARY TABLE synthetic_histograms (
+            problem_id integer NOT NULL, data_type histogramdatatype NOT NULL, "values" integer[] NOT NULL
+        ) ON COMMIT DROP
+    """),
+    text("""
+        CREATE TEMPORARY TABLE synthetic_windows (
+            problem_id integer NOT NULL, data_type histogramdatatype NOT NULL,
+            granularity histogramgranularity NOT NULL, window_start timestamptz NOT NULL, "values" integer[] NOT NULL
+        ) ON COMMIT DROP
+    """),
+    text("""
+        CREATE TEMPORARY TABLE synthetic_sketches (
+            problem_id integer NOT NULL, metric histogramdatatype NOT NULL, zero_count bigint NOT NULL, counts jsonb NOT NULL
+        ) ON COMMIT DROP
+    """),
+]
+
+# Rows are merged in the order live upserts lock them (problem, then type name), so
+# concurrent chunks and API workers can't deadlock
+MERGE_SQL = [
+    text(f"""
+        INSERT INTO problem_histograms (problem_id, data_type, "values")
+        SELECT problem_id, data_type, "values" FROM synthetic_histograms ORDER BY problem_id, data_type::text
+        ON CONFLICT ON CONSTRAINT uq_problem_histogram DO UPDATE SET "values" = {MERGED_VALUES_SQL.text}
+    """),
+    text(f"""
+        INSERT INTO {WINDOWS_TABLE} (problem_id, data_type, granularity, window_start, "values")
+        SELECT problem_id, data_type, granularity, window_start, "values" FROM synthetic_windows
+        ORDER BY problem_id, data_type::text, granularity, window_start
+        ON CONFLICT (problem_id, data_type, granularity, window_start) DO UPDATE
+        SET "values" = {merged_values_sql(WINDOWS_TABLE).text}
+    """),
+    text(f"""
+        INSERT INTO problem_sketches (problem_id, metric, zero_count, counts)
+        SELECT problem_id, metric, zero_count, counts FROM synthetic_sketches ORDER BY problem_id, metric::text
+        ON CONFLICT (problem_id, metric) DO UPDATE SET
+            zero_count = problem_sketches.zero_count + excluded.zero_count, counts = {MERGED_COUNTS_SQL.text}
+    """),
+]
+
+ANALYZED_TABLES = (
+    "users", "sessions", "attempts", "user_problem_best", "problem_histograms", WINDOWS_TABLE, "problem_sketches",
+)
+
+# (problem_id, data_type, granularity, window_start epoch seconds) -> per-bin counts
+WindowDeltas = Dict[Tuple[int, HistogramDataType, HistogramGranularity, int], List[int]]
+
+
+class SyntheticDataSettings(NamedTuple):
+    users: int
+    sessions_per_user: float = 2.0
+    attempts_per_user: float = 10.0
+    activity_sigma: float = 1.0  # Spread of attempts per user (lognormal, same mean)
+    skill_sigma: float = 0.4  # Spread of users' speed (a time factor)
+    days: float = 30.0
+    popularity_skew: float = 1.0  # Zipf exponent of problem popularity (0: uniform)
+    ccpm_median: float = 300.0
+    difficulty_sigma: float = 0.3  # Spread of problems' median times at the same changed characters
+    time_sigma: float = 0.5
+    strokes_per_char: float = 0.6
+    strokes_sigma: float = 0.3
+    seed: int = 0
+    password: str = "synthetic"
+
+
+class ProblemParameters(NamedTuple):
+    """Attempt distributions of every problem (parallel arrays)"""
+    ids: np.ndarray
+    cumulative_weights: np.ndarray
+    time_median: np.ndarray
+    time_sigma: np.ndarray
+    strokes_median: np.ndarray
+    strokes_sigma: np.ndarray
+    min_key_strokes: np.ndarray
+    changed_chars: np.ndarray  # NaN where the diff metadata is missing
+    ccpm_median: np.ndarray
+
+
+class GenerationPlan(NamedTuple):
+    """Everything a worker process needs to generate and write chunks"""
+    settings: SyntheticDataSettings
+    problems: ProblemParameters
+    url: str
+    search_path: str
+    hashed_password: str
+    now: float  # Epoch seconds
+    hourly_cutoff: float  # Window increments of attempts from here on go to hourly rows...
+    daily_cutoff: float  # ...and from here on to daily rows
+
+
+def problem_parameters(
+    rows: Iterable[tuple], settings: SyntheticDataSettings, overrides: Optional[dict] = None
+) -> ProblemParameters:
+    """Distributions for problems given as (id, import_key, changed_chars, min_key_strokes) rows"""
+    rows = sorted(rows)
+    if not rows:
+        raise ValueError("No problems to attempt; seed or import problems first")
+    rng = np.random.default_rng(settings.seed)
+    count = len(rows)
+    overrides = overrides or {}
+
+    # Popularity: Zipf over a random ranking
+    ranks = rng.permutation(count) + 1
+    weights = 1.0 / ranks ** settings.popularity_skew
+    difficulty = rng.lognormal(0.0, settings.difficulty_sigma, count)
+
+    columns = {name: np.empty(count) for name in ProblemParameters._fields if name != "cumulative_weights"}
+    for index, (problem_id, import_key, changed_chars, min_key_strokes) in enumerate(rows):
+        override = overrides.get(str(problem_id)) or overrides.get(import_key) or {}
+        ccpm_median = float(override.get("ccpm_median", settings.ccpm_median))
+        time_median = float(override.get("time_median", 0.0))
+        if not time_median:
+            # Legacy problems without diff metadata get a 20-second median at the default speed
+            chars = changed_chars if changed_chars is not None else settings.ccpm_median / 3
+            time_median = max(1.0, max(chars, 1) * 60 / ccpm_median) * difficulty[index]
+        chars = changed_chars if changed_chars is not None else ccpm_median * time_median / 60
+        weights[index] = float(override.get("weight", weights[index]))
+        columns["ids"][index] = problem_id
+        columns["time_median"][index] = time_median
+        columns["time_sigma"][index] = float(override.get("time_sigma", settings.time_sigma))
+        columns["strokes_median"][index] = float(override.get(
+            "strokes_median", max(min_key_strokes or 1, chars * settings.strokes_per_char)
+        ))
+        columns["strokes_sigma"][index] = float(override.get("strokes_sigma", settings.strokes_sigma))
+        columns["min_key_strokes"][index] = max(min_key_strokes or 0, 1)
+        columns["changed_chars"][index] = np.nan if changed_chars is None else changed_chars
+        columns["ccpm_median"][index] = ccpm_median
+    return ProblemParameters(
+        cumulative_weights=np.cumsum(weights),
+        **{name: values.astype(np.int64) if name in ("ids", "min_key_strokes") else values for name, values in columns.items()},
+    )
+
+
+def timestamps(epochs: np.ndarray) -> List[str]:
+    """Epoch seconds as UTC timestamptz literals, vectorized"""
+    return (np.char.add(np.datetime_as_string((epochs * 1e6).astype("datetime64[us]"), unit="us"), "+00")).tolist()
+
+
+def array_literal(counts: List[int]) -> str:
+    return "{" + ",".join(map(str, counts)) + "}"
+
+
+def window_deltas(
+    problem_ids: np.ndarray, created_at: np.ndarray, values: Dict[HistogramDataType, np.ndarray],
+    hourly_cutoff: float, daily_cutoff: float,
+) -> WindowDeltas:
+    """Histogram increments of attempts per (problem, window), for the hourly and daily windows"""
+    deltas: WindowDeltas = {}
+    for granularity, selected, width in (
+        (HistogramGranularity.HOUR, created_at >= hourly_cutoff, HOUR),
+        (HistogramGranularity.DAY, (created_at >= daily_cutoff) & (created_at < hourly_cutoff), DAY),
+    ):
+        if not selected.any():
+            continue
+        starts = (created_at[selected] // width * width).astype(np.int64)
+        windows, group_ids = np.unique(np.stack([problem_ids[selected], starts], axis=1), axis=0, return_inverse=True)
+        for data_type, spec in HISTOGRAM_SPECS.items():
+            for group, counts in spec.grouped_bin_counts(group_ids.ravel(), values[data_type][selected]).items():
+                counts = trimmed_counts(counts)
+                if counts:
+                    problem_id, window_start = windows[group].tolist()
+                    deltas[(problem_id, data_type, granularity, window_start)] = counts
+    return deltas
+
+
+def best_rows(user_ids: np.ndarray, problem_ids: np.ndarray, time_seconds, key_strokes, ccpm) -> Iterable[tuple]:
+    """user_problem_best rows of a set of attempts: (user, problem, min time, min strokes, max CCPM)"""
+    order = np.lexsort((problem_ids, user_ids))
+    users, problems = user_ids[order], problem_ids[order]
+    starts = np.flatnonzero(np.concatenate([[True], (users[1:] != users[:-1]) | (problems[1:] != problems[:-1])]))
+    return zip(
+        users[starts].tolist(),
+        problems[starts].tolist(),
+        np.minimum.reduceat(time_seconds[order], starts).tolist(),
+        np.minimum.reduceat(key_strokes[order], starts).tolist(),
+        np.maximum.reduceat(ccpm[order], starts).tolist(),
+    )
+
+
+def generate_attempts(plan: GenerationPlan, rng: np.random.Generator, user_ids: np.ndarray, users_created: np.ndarray):
+    """Attempts of a chunk of users, in creation order: (user_ids, problem_ids, time, strokes, ccpm, created_at)"""
+    settings, problems = plan.settings, plan.problems
+    # Heavy-tailed activity with mean attempts_per_user
+    activity = rng.lognormal(
+        np.log(settings.attempts_per_user) - settings.activity_sigma ** 2 / 2, settings.activity_sigma, len(user_ids)
+    ) if settings.attempts_per_user > 0 else np.zeros(len(user_ids))
+    per_user = rng.poisson(activity)
+    users = np.repeat(np.arange(len(user_ids)), per_user)
+    count = len(users)
+
+    picked = np.searchsorted(problems.cumulative_weights, rng.random(count) * problems.cumulative_weights[-1], side="right")
+    picked = np.minimum(picked, len(problems.ids) - 1)
+    skill = rng.lognormal(0.0, settings.skill_sigma, len(user_ids))
+    time_seconds = np.maximum(np.round(
+        problems.time_median[picked] * skill[users] * rng.lognormal(0.0, problems.time_sigma[picked]), 3
+    ), 0.001)
+    key_strokes = np.maximum(
+        np.rint(problems.strokes_median[picked] * rng.lognormal(0.0, problems.strokes_sigma[picked])),
+        problems.min_key_strokes[picked],
+    ).astype(np.int64)
+    changed_chars = problems.changed_chars[picked]
+    # Problems without diff metadata: the client's CCPM, as if typing ccpm_median at median time
+    ccpm = np.where(
+        np.isnan(changed_chars),
+        problems.ccpm_median[picked] * problems.time_median[picked] / time_seconds,
+        np.nan_to_num(changed_chars) * 60 / time_seconds,
+    )
+    created_at = users_created[users] + rng.random(count) * (plan.now - users_created[users])
+
+    order = np.argsort(created_at, kind="stable")
+    return (
+        user_ids[users][order], problems.ids[picked][order], time_seconds[order], key_strokes[order], ccpm[order],
+        created_at[order],
+    )
+
+
+def write_chunk(connection: Connection, plan: GenerationPlan, chunk: int, first_user_id: int, user_count: int) -> Dict[str, int]:
+    """Generate one chunk of users and write it with everything derived from it (in the caller's transaction)"""
+    settings = plan.settings
+    rng = np.random.default_rng([settings.seed, chunk])
+    user_ids = np.arange(first_user_id, first_user_id + user_count, dtype=np.int64)
+    users_created = plan.now - rng.random(user_count) * settings.days * DAY
+    copy_rows(connection, "users", ("id", "username", "hashed_password", "created_at"), (
+        (user_id, f"synthetic_{user_id}", plan.hashed_password, created_at)
+        for user_id, created_at in zip(user_ids.tolist(), timestamps(users_created))
+    ))
+
+    per_user = rng.poisson(settings.sessions_per_user, user_count)
+    session_users = np.repeat(user_ids, per_user)
+    session_starts = np.repeat(users_created, per_user)
+    sessions_created = session_starts + rng.random(len(session_users)) * (plan.now - session_starts)
+    sessions_accessed = sessions_created + rng.random(len(session_users)) * (plan.now - sessions_created)
+    session_ids = (
+        str(uuid.UUID(bytes=token, version=4))
+        for token in np.frombuffer(rng.bytes(16 * len(session_users)), dtype="V16").tolist()
+    )
+    copy_rows(connection, "sessions", ("session_id", "user_id", "created_at", "last_accessed_at"), zip(
+        session_ids, session_users.tolist(), timestamps(sessions_created), timestamps(sessions_accessed)
+    ))
+
+    attempt_users, problem_ids, time_seconds, key_strokes, ccpm, created_at = generate_attempts(
+        plan, rng, user_ids, users_created
+    )
+    copy_rows(connection, "attempts", ("user_id", "problem_id", "time_seconds", "key_strokes", "ccpm", "created_at"), zip(
+        attempt_users.tolist(), problem_ids.tolist(), time_seconds.tolist(), key_strokes.tolist(), ccpm.tolist(),
+        timestamps(created_at),
+    ))
+    copy_rows(
+        connection, "user_problem_best", ("user_id", "problem_id", "best_time", "best_key_strokes", "best_ccpm"),
+        best_rows(attempt_users, problem_ids, time_seconds, key_strokes, ccpm),
+    )
+
+    histograms: HistogramDeltas = {}
+    add_attempt_arrays(histograms, problem_ids, time_seconds, key_strokes, ccpm)
+    windows = window_deltas(problem_ids, created_at, {
+        HistogramDataType.TIME: time_seconds,
+        HistogramDataType.STROKES: key_strokes,
+        HistogramDataType.CCPM: ccpm,
+    }, plan.hourly_cutoff, plan.daily_cutoff)
+    sketches: SketchDeltas = {}
+    add_attempt_sketch_arrays(sketches, problem_ids, time_seconds, key_strokes, ccpm)
+
+    for statement in CREATE_STAGING_SQL:
+        connection.execute(statement)
+    copy_rows(connection, "synthetic_histograms", ("problem_id", "data_type", "values"), (
+        (problem_id, data_type.name, array_literal(counts)) for (problem_id, data_type), counts in histograms.items()
+    ))
+    window_starts = timestamps(np.array([key[3] for key in windows], dtype=np.float64))
+    copy_rows(connection, "synthetic_windows", ("problem_id", "data_type", "granularity", "window_start", "values"), (
+        (problem_id, data_type.name, granularity.name, window_start, array_literal(counts))
+        for ((problem_id, data_type, granularity, _), counts), window_start in zip(windows.items(), window_starts)
+    ))
+    copy_rows(connection, "synthetic_sketches", ("problem_id", "metric", "zero_count", "counts"), (
+        (problem_id, metric.name, sketch.zero_count, json.dumps({str(key): count for key, count in sketch.counts.items()}))
+        for (problem_id, metric), sketch in sketches.items()
+    ))
+    for statement in MERGE_SQL:
+        connection.execute(statement)
+    return {"users": user_count, "sessions": len(session_users), "attempts": len(attempt_users)}
+
+
+_plan: Optional[GenerationPlan] = None
+_engine: Optional[Engine] = None
+
+
+def init_worker(plan: GenerationPlan):
+    global _plan, _engine
+    _plan = plan
+    _engine = create_engine(plan.url, poolclass=NullPool)
+
+
+def generate_chunk(chunk: int, first_user_id: int, user_count: int) -> Dict[str, int]:
+    """Generate and commit one chunk (runs in a worker process, see init_worker)"""
+    with _engine.begin() as connection:
+        connection.execute(text(f"SET LOCAL search_path TO {_plan.search_path}"))
+        return write_chunk(connection, _plan, chunk, first_user_id, user_count)
+
+
+def reserve_user_ids(bind: Engine, count: int) -> int:
+    """Advance the users ID sequence past `count` IDs and return the first one"""
+    with bind.begin() as connection:
+        # Concurrent signups wait, so none can take an ID from the reserved range
+        connection.execute(text("LOCK TABLE users IN SHARE ROW EXCLUSIVE MODE"))
+        first = connection.execute(text("SELECT nextval(pg_get_serial_sequence('users', 'id'))")).scalar()
+        first = max(first, connection.execute(text("SELECT coalesce(max(id), 0) + 1 FROM users")).scalar())
+        connection.execute(
+            text("SELECT setval(pg_get_serial_sequence('users', 'id'), :last)"), {"last": first + max(count, 1) - 1}
+        )
+    return first
+
+
+def generate_synthetic_data(
+    settings: SyntheticDataSettings,
+    workers: int = 1,
+    chunk_users: int = 10000,
+    overrides: Optional[dict] = None,
+    bind: Engine = engine,
+    progress=None,
+) -> Dict[str, int]:
+    """
+    Generate settings.users users with their sessions and attempts against the problems
+    in the database, in chunks of chunk_users users (in parallel with workers > 1), then
+    ANALYZE the tables. Returns counts of users, sessions and attempts.
+    """
+    with bind.connect() as connection:
+        problems = problem_parameters(connection.execute(
+            select(Problem.id, Problem.import_key, Problem.changed_chars, Problem.min_key_strokes)
+        ).all(), settings, overrides)
+        search_path = connection.execute(text("SHOW search_path")).scalar()
+
+    now = datetime.now(timezone.utc)
+    plan = GenerationPlan(
+        settings=settings,
+        problems=problems,
+        url=bind.url.render_as_string(hide_password=False),
+        search_path=search_path,
+        hashed_password=hash_password(settings.password),
+        now=now.timestamp(),
+        # The cutoffs the histogram compactor uses
+        hourly_cutoff=min(
+            day_start(now - timedelta(hours=HISTOGRAM_HOURLY_RETENTION_HOURS)), day_start(now - COMPACTION_GRACE)
+        ).timestamp(),
+        daily_cutoff=day_start(now - timedelta(days=HISTOGRAM_DAILY_RETENTION_DAYS)).timestamp(),
+    )
+    first_user_id = reserve_user_ids(bind, settings.users)
+    chunks = [
+        (chunk, first_user_id + start, min(chunk_users, settings.users - start))
+        for chunk, start in enumerate(range(0, settings.users, chunk_users))
+    ]
+
+    totals = {"users": 0, "sessions": 0, "attempts": 0}
+
+    def add(counts: Dict[str, int]):
+        for name, count in counts.items():
+            totals[name] += count
+        if progress:
+            progress(totals)
+
+    if workers <= 1:
+        init_worker(plan)
+        try:
+            for chunk in chunks:
+                add(generate_chunk(*chunk))
+        finally:
+            _engine.dispose()
+    else:
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn"), initializer=init_worker, initargs=(plan,)
+        ) as executor:
+            for future in as_completed([executor.submit(generate_chunk, *chunk) for chunk in chunks]):
+                add(future.result())
+
+    # Fresh planner statistics for the new row counts
+    with bind.begin() as connection:
+        connection.execute(text(f"ANALYZE {', '.join(ANALYZED_TABLES)}"))
+    return totals
+
+
+def synthetic_problems(start: int, count: int, seed: int = 0) -> List[ProblemRecord]:
+    """Small code-editing problems: a function with one identifier renamed"""
+    rng = random.Random(seed)
+    words = ["total", "items", "value", "index", "result", "count", "name", "price", "user", "entry"]
+    records = []
+    for number in range(start, start + count):
+        old, new = rng.sample(words, 2)
+        lines = [f"function step{number}({old}) {{\n"]
+        for line in range(rng.randint(2, 20)):
+            lines.append(f"  const {rng.choice(words)}{line} = {old} * {rng.randint(1, 99)};\n")
+        lines.append(f"  return {old};\n}}\n")
+        original = "".join(lines)
+        name = f"Synthetic problem {number}"
+        records.append(ProblemRecord(f"synthetic-{number}", name, original, original.replace(old, new)))
+    return records
+
+
+if __name__ == "__main__":
+    defaults = SyntheticDataSettings(users=100000)
+    parser = argparse.ArgumentParser(description="Generate synthetic users, sessions and attempts with consistent statistics")
+    parser.add_argument("--users", type=int, default=defaults.users)
+    parser.add_argument("--sessions-per-user", type=float, default=defaults.sessions_per_user, help="Mean (Poisson)")
+    parser.add_argument("--attempts-per-user", type=float, default=defaults.attempts_per_user, help="Mean")
+    parser.add_argument("--activity-sigma", type=float, default=defaults.activity_sigma,
+                        help="Lognormal spread of attempts per user")
+    parser.add_argument("--skill-sigma", type=float, default=defaults.skill_sigma,
+                        help="Lognormal spread of users' speed")
+    parser.add_argument("--days", type=float, default=defaults.days, help="Attempts are spread over this many past days")
+    parser.add_argument("--problems", type=int, default=0,
+                        help="Import synthetic problems until the catalog has this many")
+    parser.add_argument("--popularity-skew", type=float, default=defaults.popularity_skew,
+                        help="Zipf exponent of problem popularity (0: uniform)")
+    parser.add_argument("--ccpm-median", type=float, default=defaults.ccpm_median,
+                        help="Typing speed that sets problems' median times")
+    parser.add_argument("--difficulty-sigma", type=float, default=defaults.difficulty_sigma,
+                        help="Lognormal spread of problems' median times")
+    parser.add_argument("--time-sigma", type=float, default=defaults.time_sigma,
+                        help="Lognormal spread of attempt times around a problem's median")
+    parser.add_argument("--strokes-per-char", type=float, default=defaults.strokes_per_char,
+                        help="Median key strokes per changed character")
+    parser.add_argument("--strokes-sigma", type=float, default=defaults.strokes_sigma,
+                        help="Lognormal spread of key strokes")
+    parser.add_argument("--distributions", type=Path, default=None, help="JSON file of per-problem distributions")
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("--password", default=defaults.password, help="Password of every generated user")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Parallel worker processes")
+    parser.add_argument("--chunk-users", type=int, default=10000, help="Users per chunk (and transaction)")
+    args = parser.parse_args()
+
+    settings = SyntheticDataSettings(**{
+        name: getattr(args, name) for name in SyntheticDataSettings._fields if hasattr(args, name)
+    })
+    overrides = json.loads(args.distributions.read_text())["problems"] if args.distributions else None
+
+    if args.problems:
+        with engine.connect() as connection:
+            existing = connection.execute(select(func.count()).select_from(Problem)).scalar()
+        if existing < args.problems:
+            counts = import_problems(synthetic_problems(existing, args.problems - existing, args.seed), max(1, args.workers))
+            print(f"✓ Imported {counts['inserted']:,} synthetic problems")
+
+    # Roll up existing hourly windows first: days given daily rows here are no longer rolled up
+    histogram_compactor.run_once()
+
+    started = time.perf_counter()
+
+    def report(totals: Dict[str, int]):
+        elapsed = time.perf_counter() - started
+        print(f"  {totals['users']:,} users, {totals['sessions']:,} sessions, {totals['attempts']:,} attempts "
+              f"({totals['attempts'] / max(elapsed, 1e-9):,.0f} attempts/s)", flush=True)
+
+    try:
+        totals = generate_synthetic_data(settings, max(1, args.workers), args.chunk_users, overrides, progress=report)
+    except ValueError as e:
+        raise SystemExit(f"✗ {e}")
+    elapsed = time.perf_counter() - started
+    print(f"✓ Generated {totals['users']:,} users, {totals['sessions']:,} sessions and {totals['attempts']:,} attempts "
+          f"in {elapsed:.1f}s; histograms, windows, sketches and bests include them. Password: {settings.password!r}")
@@ -0,0 +1,213 @@
+"""
+Script to bulk import problems from JSONL or a directory of before/after file pairs.
+
+Sources:
+- a .jsonl file, one problem per line:
+  {"name": "...", "original_text": "...", "modified_text": "...", "key": "..."}
+  ("key" is optional and defaults to the name)
+- a directory of file pairs NAME.before[.ext] / NAME.after[.ext] (searched recursively);
+  the path of NAME relative to the directory is both the key and the name
+
+Problems are identified by their key (problems.import_key) and their content by a
+SHA-256 content hash, so an import can be re-run: unchanged problems are skipped
+before any diffing, changed ones are updated in place (keeping their id, attempts
+and histograms) and new ones are inserted.
+
+Records are read as a stream and processed --chunk-size at a time. The diff metadata
+of new and changed problems (app/diffing.py) is computed by --workers processes while
+the main process loads finished chunks: each chunk is COPYed into a temporary staging
+table and upserted into problems with one INSERT ... ON CONFLICT, in its own
+transaction, which also bumps the catalog version so API workers pick the problems up.
+
+Usage:
+    python import_problems.py problems.jsonl [--workers 4] [--chunk-size 5000]
+    python import_problems.py problems_dir/
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Tuple
+from sqlalchemy import select, text
+from sqlalchemy.engine import Engine
+from app.bulk_copy import copy_csv, csv_rows
+from app.catalog import CATALOG_VERSION_COUNTER
+from app.counters import bump_counter
+from app.database import engine
+from app.diffing import diff_metadata
+from app.models import Problem
+
+STAGING_TABLE = "problems_import"
+
+STAGING_COLUMNS = (
+    "import_key", "name", "original_text", "modified_text", "content_hash", "edit_script", "changed_chars",
+    "min_key_strokes",
+)
+
+CREATE_STAGING_SQL = text(f"""
+    CREATE TEMPORARY TABLE {STAGING_TABLE} (
+        import_key varchar(255) NOT NULL, name varchar(255) NOT NULL, original_text text NOT NULL,
+        modified_text text NOT NULL, content_hash varchar(64) NOT NULL, edit_script jsonb NOT NULL,
+        changed_chars integer NOT NULL, min_key_strokes integer NOT NULL
+    ) ON COMMIT DROP
+""")
+
+# Insert new problems, update changed ones; (xmax = 0) is true for inserted rows
+UPSERT_SQL = text(f"""
+    INSERT INTO problems ({", ".join(STAGING_COLUMNS)})
+    SELECT {", ".join(STAGING_COLUMNS)} FROM {STAGING_TABLE}
+    ON CONFLICT (import_key) DO UPDATE SET
+        {", ".join(f"{column} = excluded.{column}" for column in STAGING_COLUMNS[1:])}
+    WHERE problems.content_hash IS DISTINCT FROM excluded.content_hash
+    RETURNING (xmax = 0) AS inserted
+""")
+
+
+class ProblemRecord(NamedTuple):
+    key: str
+    name: str
+    original_text: str
+    modified_text: str
+
+
+def content_hash(record: ProblemRecord) -> str:
+    digest = hashlib.sha256()
+    for part in (record.name, record.original_text, record.modified_text):
+        digest.update(part.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def read_jsonl(path: Path) -> Iterator[ProblemRecord]:
+    with path.open(encoding="utf-8") as lines:
+        for number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+                yield ProblemRecord(
+                    str(data.get("key") or data["name"]), data["name"], data["original_text"], data["modified_text"]
+                )
+            except (ValueError, KeyError) as e:
+                raise ValueError(f"{path}:{number}: invalid problem record ({e})")
+
+
+def read_file_pairs(directory: Path) -> Iterator[ProblemRecord]:
+    for before in sorted(directory.rglob("*.before*")):
+        stem, _, extension = before.name.partition(".before")
+        after = before.with_name(f"{stem}.after{extension}")
+        if not after.is_file():
+            raise ValueError(f"{before}: no matching {after.name}")
+        name = str(before.parent.relative_to(directory) / stem)
+        yield ProblemRecord(
+            name, name, before.read_text(encoding="utf-8"), after.read_text(encoding="utf-8")
+        )
+
+
+def read_source(path: Path) -> Iterator[ProblemRecord]:
+    return read_file_pairs(path) if path.is_dir() else read_jsonl(path)
+
+
+def chunked(records: Iterable[ProblemRecord], chunk_size: int) -> Iterator[List[ProblemRecord]]:
+    """Chunks of records, repeated keys within a chunk resolved to their last occurrence"""
+    chunk: Dict[str, ProblemRecord] = {}
+    for record in records:
+        chunk[record.key] = record
+        if len(chunk) >= chunk_size:
+            yield list(chunk.values())
+            chunk = {}
+    if chunk:
+        yield list(chunk.values())
+
+
+def prepare_chunk(records: List[Tuple[ProblemRecord, str]]) -> str:
+    """Diff a chunk of (record, content hash) and render it as CSV for COPY (runs in a worker process)"""
+    rows = []
+    for record, digest in records:
+        metadata = diff_metadata(record.original_text, record.modified_text)
+        rows.append((
+            record.key, record.name, record.original_text, record.modified_text, digest,
+            json.dumps(metadata.edit_script, separators=(",", ":")), metadata.changed_chars, metadata.min_key_strokes,
+        ))
+    return csv_rows(rows)
+
+
+def load_chunk(bind: Engine, rows: str) -> Tuple[int, int]:
+    """COPY a prepared chunk into staging and upsert it, in one transaction. Returns (inserted, updated)."""
+    with bind.begin() as connection:
+        connection.execute(CREATE_STAGING_SQL)
+        copy_csv(connection, STAGING_TABLE, STAGING_COLUMNS, rows)
+        inserted = connection.execute(UPSERT_SQL).scalars().all()
+        if inserted:
+            bump_counter(connection, CATALOG_VERSION_COUNTER)
+    return sum(inserted), len(inserted) - sum(inserted)
+
+
+def import_problems(
+    records: Iterable[ProblemRecord], workers: int = 1, chunk_size: int = 5000, bind: Engine = engine
+) -> Dict[str, int]:
+    """
+    Import problems, skipping unchanged ones. With workers > 1, chunks are diffed in
+    that many processes (at most 2 chunks per worker in flight). Returns counts of
+    inserted, updated and unchanged problems.
+    """
+    with bind.connect() as connection:
+        known = dict(connection.execute(
+            select(Problem.import_key, Problem.content_hash).where(Problem.import_key.is_not(None))
+        ).all())
+
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+
+    def changed_records():
+        for chunk in chunked(records, chunk_size):
+            pending = []
+            for record in chunk:
+                digest = content_hash(record)
+                if known.get(record.key) == digest:
+                    counts["unchanged"] += 1
+                else:
+                    pending.append((record, digest))
+            if pending:
+                yield pending
+
+    def load(rows: str):
+        inserted, updated = load_chunk(bind, rows)
+        counts["inserted"] += inserted
+        counts["updated"] += updated
+
+    if workers <= 1:
+        for pending in changed_records():
+            load(prepare_chunk(pending))
+        return counts
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        in_flight = deque()
+        for pending in changed_records():
+            in_flight.append(executor.submit(prepare_chunk, pending))
+            if len(in_flight) >= 2 * workers:
+                load(in_flight.popleft().result())
+        while in_flight:
+            load(in_flight.popleft().result())
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk import problems from JSONL or before/after file pairs")
+    parser.add_argument("source", type=Path, help="A .jsonl file or a directory of NAME.before / NAME.after files")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Parallel diff worker processes")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="Problems per COPY and transaction")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    counts = import_problems(read_source(args.source), max(1, args.workers), args.chunk_size)
+    elapsed = time.perf_counter() - started
+    total = sum(counts.values())
+    print(
+        f"✓ {total:,} problems in {elapsed:.1f}s ({total / max(elapsed, 1e-9):,.0f} problems/s): "
+        f"{counts['inserted']:,} inserted, {counts['updated']:,} updated, {counts['unchanged']:,} unchanged"
+    )
@@ -1,8 +1,25 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from app.auth import password_hasher
 from app.database import engine, Base
+from app.catalog import problem_catalog
+from app.histogram_buffer import histogram_buffer
+from app.histogram_windows import histogram_compactor
+from app.idempotency import idempotency_key_pruner
+from app.leaderboard import leaderboard_cache
+from app.recommender import recommender
+from app.problem_deck import problem_decks
+from app.session_cache import session_cache
+from app.session_reaper import session_reaper
+from app.session_touch import session_touches
+from app.tokens import token_revocations
 from app.routers import auth, problems, attempts
 import logging
+import math
 
 logger = logging.getLogger(__name__)
 
@@ -14,7 +31,30 @@ except Exception as e:
     logger.error(f"Error creating database tables: {e}")
     # Don't fail startup, tables might already exist
 
-app = FastAPI(title="Mouseless API", version="1.0.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Start per-worker background tasks
+    histogram_buffer.start()
+    session_touches.start()
+    session_reaper.start()
+    idempotency_key_pruner.start()
+    histogram_compactor.start()
+    token_revocations.start()
+    recommender.start()
+    yield
+    # Graceful shutdown: flush anything still buffered
+    histogram_buffer.stop()
+    session_touches.stop()
+    session_reaper.stop()
+    idempotency_key_pruner.stop()
+    histogram_compactor.stop()
+    token_revocations.stop()
+    recommender.stop()
+    password_hasher.shutdown()
+
+
+app = FastAPI(title="Mouseless API", version="1.0.0", lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -25,6 +65,24 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+def json_safe(value):
+    """Replace infinity and NaN (not valid JSON) with their string form, recursively"""
+    if isinstance(value, float) and not math.isfinite(value):
+        return str(value)
+    if isinstance(value, dict):
+        return {key: json_safe(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [json_safe(item) for item in value]
+    return value
+
+
+@app.exception_handler(RequestValidationError)
+async def validation_exception_handler(request: Request, exc: RequestValidationError):
+    """The default 422 response, except that rejected inputs such as 1e999 can't break its JSON encoding"""
+    return JSONResponse(status_code=422, content={"detail": json_safe(jsonable_encoder(exc.errors()))})
+
+
 # Include routers
 app.include_router(auth.router, prefix="/api/auth", tags=["auth"])
 app.include_router(problems.router, prefix="/api/problems", tags=["problems"])
@@ -40,3 +98,20 @@ def read_root():
 def health_check():
     return {"status": "healthy"}
 
+
+@app.get("/api/metrics")
+def metrics():
+    """Per-worker cache and write-coalescing statistics"""
+    return {
+        "session_touch": session_touches.stats(),
+        "session_cache": session_cache.stats(),
+        "session_reaper": session_reaper.stats(),
+        "idempotency_key_pruner": idempotency_key_pruner.stats(),
+        "histogram_compactor": histogram_compactor.stats(),
+        "token_revocations": token_revocations.stats(),
+        "catalog_cache": problem_catalog.stats(),
+        "leaderboard_cache": leaderboard_cache.stats(),
+        "recommender": recommender.stats(),
+        "problem_decks": problem_decks.stats(),
+        "password_hasher": password_hasher.stats(),
+    }
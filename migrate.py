@@ -0,0 +1,107 @@
+"""
+Script to bring an existing database up to date with the current models.
+
+Base.metadata.create_all() only creates missing tables; it never adds indexes or
+columns to tables that already exist. Each step here is idempotent, so the script
+can be run any number of times (run.py runs it on every start).
+
+Indexes are built with CREATE INDEX CONCURRENTLY so a live database keeps serving
+writes while they are created.
+
+Usage:
+    python migrate.py
+"""
+from sqlalchemy import text
+from app.database import engine, Base
+import app.models  # noqa: F401  (registers every table with Base.metadata)
+
+MIGRATIONS = [
+    (
+        "Index sessions.last_accessed_at (idle expiry)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_sessions_last_accessed_at ON sessions (last_accessed_at)",
+    ),
+    (
+        "Index sessions.created_at (absolute expiry)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_sessions_created_at ON sessions (created_at)",
+    ),
+    (
+        # Rewrites the (small) table under an exclusive lock. The old synthetic data generator
+        # wrote fractional counts, so every count is rounded to the nearest whole number first
+        "Store problem_histograms.values as int4[] instead of float8[]",
+        """
+        DO $$ BEGIN
+            IF EXISTS (
+                SELECT 1 FROM information_schema.columns
+                WHERE table_schema = current_schema() AND table_name = 'problem_histograms'
+                    AND column_name = 'values' AND udt_name = '_float8'
+            ) THEN
+                LOCK TABLE problem_histograms IN ACCESS EXCLUSIVE MODE;
+                UPDATE problem_histograms SET "values" = (
+                    SELECT coalesce(array_agg(round(counts.value) ORDER BY counts.ord), '{}')
+                    FROM unnest("values") WITH ORDINALITY AS counts(value, ord)
+                );
+                ALTER TABLE problem_histograms ALTER COLUMN "values" TYPE integer[] USING "values"::integer[];
+            END IF;
+        END $$
+        """,
+    ),
+    (
+        "Index user_problem_best for time leaderboards",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_user_problem_best_time "
+        "ON user_problem_best (problem_id, best_time, user_id)",
+    ),
+    (
+        "Index user_problem_best for keystroke leaderboards",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_user_problem_best_key_strokes "
+        "ON user_problem_best (problem_id, best_key_strokes, user_id)",
+    ),
+    (
+        "Index user_problem_best for CCPM leaderboards",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_user_problem_best_ccpm "
+        "ON user_problem_best (problem_id, best_ccpm DESC, user_id)",
+    ),
+    (
+        "Index attempts (user_id, created_at, id) for attempt history",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_attempts_user_created_id ON attempts (user_id, created_at, id)",
+    ),
+    (
+        # Nullable without a default: no table rewrite. Fill in with backfill_problem_diffs.py
+        "Add problems diff metadata columns (edit_script, changed_chars, min_key_strokes)",
+        "ALTER TABLE problems ADD COLUMN IF NOT EXISTS edit_script jsonb, "
+        "ADD COLUMN IF NOT EXISTS changed_chars integer, ADD COLUMN IF NOT EXISTS min_key_strokes integer",
+    ),
+    (
+        "Add problems import columns (import_key, content_hash)",
+        "ALTER TABLE problems ADD COLUMN IF NOT EXISTS import_key varchar(255), "
+        "ADD COLUMN IF NOT EXISTS content_hash varchar(64)",
+    ),
+    (
+        "Unique index problems.import_key (upserts by import_problems.py)",
+        "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ix_problems_import_key ON problems (import_key)",
+    ),
+    (
+        # Lets seed_data.py (and imports keyed by name) update earlier seeded problems instead of duplicating them
+        "Key problems created before imports by their name, where it is unique",
+        """
+        UPDATE problems AS p SET import_key = p.name
+        WHERE p.import_key IS NULL
+            AND NOT EXISTS (SELECT 1 FROM problems AS q WHERE q.name = p.name AND q.id <> p.id)
+            AND NOT EXISTS (SELECT 1 FROM problems AS q WHERE q.import_key = p.name)
+        """,
+    ),
+]
+
+
+def run_migrations():
+    """Create missing tables, then apply every migration step"""
+    Base.metadata.create_all(bind=engine)
+    # CONCURRENTLY can't run inside a transaction block
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        for description, statement in MIGRATIONS:
+            connection.execute(text(statement))
+            print(f"✓ {description}")
+
+
+if __name__ == "__main__":
+    run_migrations()
+    print("\nDatabase is up to date.")
@@ -0,0 +1,202 @@
+"""
+Script to rebuild problem_histograms from the stored attempts.
+
+Use it to repair drift or to re-bin every histogram after changing HISTOGRAM_SPECS
+(bin widths, offsets, bar counts) in app/histograms.py. Attempts are read through
+server-side cursors in --chunk-size rows at a time (memory stays flat however large
+the table is) by --workers processes. Each bins the attempts of one range of problem
+IDs (read through the attempts.problem_id index) a chunk at a time with the vectorized
+path of the histogram specs live attempts use.
+
+The rebuild covers the attempts up to a cutoff ID read while attempts is briefly
+locked against writes (SHARE mode), so every attempt at or below it has committed and
+is seen by the workers. The new histograms then replace the old ones in a single
+transaction: they are loaded into a staging table first, then attempts and
+problem_histograms are locked against writes (reads continue), the histograms are
+swapped and caught up with the attempts stored after the cutoff. Readers see either
+all old or all new histograms, and no stored attempt is lost or counted twice. The
+tables are locked in the order attempt submissions write them (attempt first, then
+histograms), so a rebuild never deadlocks with live submissions.
+
+Histogram increments buffered in API workers (HISTOGRAM_WRITE_BEHIND) can't be told
+apart from the attempts they came from, so the script refuses to run with write-behind
+enabled: turn it off in the API workers (and here) for the rebuild.
+
+Anonymous attempts are not stored, so their contribution to the current
+histograms is dropped by a rebuild.
+
+Usage:
+    python rebuild_histograms.py [--workers 4] [--chunk-size 10000]
+"""
+import argparse
+import multiprocessing
+import os
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+from sqlalchemy import Column, Integer, MetaData, Table, create_engine, func, insert, select, text
+from sqlalchemy.dialects.postgresql import ARRAY, ENUM
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+from app.database import SessionLocal, engine
+from app.histogram_buffer import HISTOGRAM_WRITE_BEHIND
+from app.histograms import (
+    HistogramDeltas, add_attempt_arrays, add_attempt_values, apply_histogram_deltas, merge_histogram_deltas
+)
+from app.models import Attempt, HistogramDataType, ProblemHistogram
+
+# Rebuilt rows are staged here (per transaction) before the swap
+staging = Table(
+    "problem_histograms_rebuild",
+    MetaData(),
+    Column("problem_id", Integer, nullable=False),
+    Column("data_type", ENUM(HistogramDataType, name="histogramdatatype", create_type=False), nullable=False),
+    Column("values", ARRAY(Integer), nullable=False),
+    prefixes=["TEMPORARY"],
+    postgresql_on_commit="DROP",
+)
+
+
+def attempt_values(*conditions):
+    return select(Attempt.problem_id, Attempt.time_seconds, Attempt.key_strokes, Attempt.ccpm).where(*conditions)
+
+
+# Problem ID ranges per worker: more ranges than workers keep them busy when attempts are skewed
+RANGES_PER_WORKER = 4
+
+
+def problem_ranges(first_problem_id: int, last_problem_id: int, ranges: int) -> List[Tuple[int, int]]:
+    """Split [first_problem_id, last_problem_id] into at most `ranges` contiguous inclusive ranges"""
+    width = max(1, -(-(last_problem_id - first_problem_id + 1) // ranges))
+    return [
+        (start, min(start + width - 1, last_problem_id))
+        for start in range(first_problem_id, last_problem_id + 1, width)
+    ]
+
+
+def bin_problem_range(
+    first_problem_id: int, last_problem_id: int, max_attempt_id: int, chunk_size: int
+) -> Tuple[HistogramDeltas, int, float]:
+    """
+    Bin every attempt (up to max_attempt_id) of the problems with IDs in
+    [first_problem_id, last_problem_id]. Runs in a worker process with its own
+    connection. Returns (histograms, rows read, seconds).
+    """
+    started = time.perf_counter()
+    worker_engine = create_engine(engine.url, poolclass=NullPool)
+    deltas: HistogramDeltas = {}
+    rows = 0
+    try:
+        with worker_engine.connect() as connection:
+            result = connection.execution_options(stream_results=True, max_row_buffer=chunk_size).execute(
+                attempt_values(
+                    Attempt.problem_id.between(first_problem_id, last_problem_id), Attempt.id <= max_attempt_id
+                )
+            )
+            for chunk in result.partitions(chunk_size):
+                problem_ids, time_seconds, key_strokes, ccpm = (np.array(column) for column in zip(*chunk))
+                add_attempt_arrays(deltas, problem_ids, time_seconds, key_strokes, ccpm)
+                rows += len(chunk)
+    finally:
+        worker_engine.dispose()
+    return deltas, rows, time.perf_counter() - started
+
+
+def read_cutoff(db: Session) -> Tuple[int, Optional[int], Optional[int]]:
+    """
+    Highest attempt ID to rebuild from, and the lowest and highest problem IDs with attempts
+    (None without attempts). Commits, releasing the lock taken to read the cutoff.
+    """
+    # Wait for attempts being stored to commit, so none at or below the cutoff is still invisible
+    db.execute(text(f"LOCK TABLE {Attempt.__tablename__} IN SHARE MODE"))
+    max_attempt_id = db.execute(select(func.max(Attempt.id))).scalar() or 0
+    first_problem_id, last_problem_id = db.execute(
+        select(func.min(Attempt.problem_id), func.max(Attempt.problem_id))
+    ).one()
+    db.commit()
+    return max_attempt_id, first_problem_id, last_problem_id
+
+
+def swap_histograms(db: Session, histograms: HistogramDeltas, max_attempt_id: int) -> Tuple[int, float]:
+    """
+    Replace problem_histograms with the rebuilt histograms in one transaction, adding
+    attempts stored after max_attempt_id. Returns (attempts caught up, seconds writes were blocked).
+    """
+    try:
+        staging.create(db.connection())
+        rows = [
+            {"problem_id": problem_id, "data_type": data_type, "values": counts}
+            for (problem_id, data_type), counts in sorted(histograms.items(), key=lambda item: (item[0][0], item[0][1].name))
+        ]
+        if rows:
+            db.execute(insert(staging), rows)
+
+        # Block new attempts (in-flight ones commit first, so the catch-up sees them) and concurrent
+        # histogram upserts (they wait and then apply to the new rows); reads continue. Attempts
+        # are locked first: submissions insert their attempt before they upsert histograms.
+        db.execute(text(f"LOCK TABLE {Attempt.__tablename__} IN SHARE MODE"))
+        db.execute(text(f"LOCK TABLE {ProblemHistogram.__tablename__} IN EXCLUSIVE MODE"))
+        locked = time.perf_counter()
+        db.execute(ProblemHistogram.__table__.delete())
+        db.execute(
+            insert(ProblemHistogram).from_select(
+                ["problem_id", "data_type", "values"],
+                select(staging.c.problem_id, staging.c.data_type, staging.c["values"]),
+            )
+        )
+
+        # Attempts committed since the rebuild started already updated the old histograms
+        caught_up: HistogramDeltas = {}
+        missed = db.execute(attempt_values(Attempt.id > max_attempt_id)).all()
+        for problem_id, time_seconds, key_strokes, ccpm in missed:
+            add_attempt_values(caught_up, problem_id, time_seconds, key_strokes, ccpm)
+        apply_histogram_deltas(db, caught_up)
+
+        db.commit()
+        return len(missed), time.perf_counter() - locked
+    except Exception:
+        db.rollback()
+        raise
+
+
+def rebuild_histograms(workers: int, chunk_size: int):
+    """Rebuild every problem's histograms from attempts"""
+    with SessionLocal() as db:
+        max_attempt_id, first_problem_id, last_problem_id = read_cutoff(db)
+    ranges = problem_ranges(first_problem_id, last_problem_id, workers * RANGES_PER_WORKER) if max_attempt_id else []
+
+    print(f"Rebuilding histograms from attempts 1..{max_attempt_id} with {workers} workers...")
+    started = time.perf_counter()
+    histograms: HistogramDeltas = {}
+    total_rows = 0
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = [
+            executor.submit(bin_problem_range, first, last, max_attempt_id, chunk_size)
+            for first, last in ranges
+        ]
+        for (first, last), future in zip(ranges, futures):
+            deltas, rows, seconds = future.result()
+            merge_histogram_deltas(histograms, deltas)
+            total_rows += rows
+            print(f"  ✓ Problems {first}-{last}: {rows:,} attempts in {seconds:.1f}s "
+                  f"({rows / max(seconds, 1e-9):,.0f} rows/s)")
+    read_seconds = time.perf_counter() - started
+    print(f"Read {total_rows:,} attempts in {read_seconds:.1f}s ({total_rows / max(read_seconds, 1e-9):,.0f} rows/s)")
+
+    with SessionLocal() as db:
+        caught_up, blocked_seconds = swap_histograms(db, histograms, max_attempt_id)
+    problems = len({problem_id for problem_id, _ in histograms})
+    print(f"✓ Swapped in {len(histograms)} histograms for {problems} problems "
+          f"(+{caught_up} attempts stored meanwhile; writes blocked for {blocked_seconds * 1000:.0f} ms)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild problem_histograms from the attempts table")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Parallel worker processes")
+    parser.add_argument("--chunk-size", type=int, default=10000, help="Rows fetched per round trip")
+    args = parser.parse_args()
+    if HISTOGRAM_WRITE_BEHIND:
+        raise SystemExit("✗ HISTOGRAM_WRITE_BEHIND is enabled: buffered increments would be counted twice. "
+                         "Disable write-behind in the API workers and here, then rebuild.")
+    rebuild_histograms(max(1, args.workers), args.chunk_size)
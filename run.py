@@ -1,17 +1,17 @@
 """
 Quick start script for the Mouseless backend API.
 This script will:
-1. Create database tables if they don't exist
-2. Seed the database with initial problems (if empty)
+1. Create database tables if they don't exist and apply migrations (migrate.py)
+2. Seed the database with initial problems (only new or changed ones are written)
 3. Start the FastAPI server
 """
 import uvicorn
-from app.database import engine, Base
+from migrate import run_migrations
 
 if __name__ == "__main__":
-    # Create tables
+    # Create tables and bring existing ones up to date
     print("Creating database tables...")
-    Base.metadata.create_all(bind=engine)
+    run_migrations()
     print("Database tables created.")
     
     # Seed database
@@ -1,10 +1,9 @@
 """
 Seed script to populate the database with problems from the frontend temp data.
-Run this after creating the database tables.
+Safe to re-run: problems are upserted by name (see import_problems.py).
 """
-from sqlalchemy.orm import Session
-from app.database import SessionLocal, engine, Base
-from app.models import Problem
+from migrate import run_migrations
+from import_problems import ProblemRecord, import_problems
 
 # Sample problems from the frontend Editor.tsx
 PROBLEMS_DATA = [
@@ -57,38 +56,22 @@ PROBLEMS_DATA = [
 
 
 def seed_problems():
-    """Seed the database with problems"""
-    db: Session = SessionLocal()
-    
-    try:
-        # Check if problems already exist
-        existing_count = db.query(Problem).count()
-        if existing_count > 0:
-            print(f"Database already contains {existing_count} problems. Skipping seed.")
-            return
-        
-        # Add all problems
-        for problem_data in PROBLEMS_DATA:
-            problem = Problem(
-                name=problem_data["name"],
-                original_text=problem_data["original_text"],
-                modified_text=problem_data["modified_text"]
-            )
-            db.add(problem)
-        
-        db.commit()
-        print(f"Successfully seeded {len(PROBLEMS_DATA)} problems into the database.")
-        
-    except Exception as e:
-        db.rollback()
-        print(f"Error seeding database: {e}")
-        raise
-    finally:
-        db.close()
+    """
+    Seed the database with the sample problems, through the bulk import pipeline:
+    re-running it updates changed problems and skips unchanged ones.
+    """
+    counts = import_problems(
+        ProblemRecord(problem_data["name"], problem_data["name"], problem_data["original_text"], problem_data["modified_text"])
+        for problem_data in PROBLEMS_DATA
+    )
+    print(
+        f"Seeded {len(PROBLEMS_DATA)} problems: {counts['inserted']} inserted, "
+        f"{counts['updated']} updated, {counts['unchanged']} unchanged."
+    )
 
 
 if __name__ == "__main__":
-    # Ensure tables are created
-    Base.metadata.create_all(bind=engine)
+    # Ensure tables, columns and indexes exist
+    run_migrations()
     seed_problems()
 
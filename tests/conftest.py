@@ -0,0 +1,42 @@
+"""
+Shared fixtures. Tests that need a database run against DATABASE_URL, but inside a
+temporary schema that is dropped afterwards, so existing data is never touched.
+They are skipped when the database can't be reached.
+"""
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+from app.database import engine, Base
+
+TEST_SCHEMA = "mouseless_test"
+
+# Connections the scratch engine may open at once (parallel submission tests use them all)
+SCRATCH_POOL_SIZE = 16
+
+
+@pytest.fixture
+def scratch():
+    """
+    An engine whose connections use a throwaway schema (via search_path) with all
+    tables created. The schema is dropped afterwards.
+    """
+    try:
+        with engine.begin() as connection:
+            connection.execute(text(f"DROP SCHEMA IF EXISTS {TEST_SCHEMA} CASCADE"))
+            connection.execute(text(f"CREATE SCHEMA {TEST_SCHEMA}"))
+    except OperationalError as exc:
+        pytest.skip(f"database unavailable: {exc.orig}")
+
+    scratch = create_engine(
+        engine.url,
+        connect_args={"options": f"-csearch_path={TEST_SCHEMA}"},
+        pool_size=SCRATCH_POOL_SIZE,
+        max_overflow=0,
+    )
+    try:
+        Base.metadata.create_all(bind=scratch)
+        yield scratch
+    finally:
+        scratch.dispose()
+        with engine.begin() as connection:
+            connection.execute(text(f"DROP SCHEMA IF EXISTS {TEST_SCHEMA} CASCADE"))
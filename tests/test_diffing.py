@@ -0,0 +1,128 @@
+"""Ingest-time problem diffs (no database)"""
+import difflib
+import random
+import pytest
+from app import diffing
+from app.diffing import apply_edit_script, diff_metadata, diff_texts, myers_matching_blocks
+
+
+def lcs_length(a, b) -> int:
+    """Length of a longest common subsequence (quadratic dynamic program, small inputs only)"""
+    previous = [0] * (len(b) + 1)
+    for x in a:
+        current = [0]
+        for j, y in enumerate(b):
+            current.append(previous[j] + 1 if x == y else max(previous[j + 1], current[j]))
+        previous = current
+    return previous[-1]
+
+
+def edited(rng: random.Random, text: str, alphabet: str, edits: int) -> str:
+    chars = list(text)
+    for _ in range(edits):
+        position = rng.randint(0, len(chars))
+        operation = rng.random()
+        if operation < 0.4 and position < len(chars):
+            del chars[position]
+        elif operation < 0.7 and position < len(chars):
+            chars[position] = rng.choice(alphabet)
+        else:
+            chars.insert(position, rng.choice(alphabet))
+    return "".join(chars)
+
+
+CASES = [
+    ("", ""),
+    ("", "typed from scratch\n"),
+    ("deleted entirely\n", ""),
+    ("same\n", "same\n"),
+    ("def f(x):\n    return x\n", "def f(x, y):\n    return x + y\n"),
+    ("a\r\nb\r\nc\r\n", "a\r\nB\r\nc\r\nd\r\n"),
+    ("line one\r\nline two\n", "line one\nline two\r\n"),
+    ("no newline at end", "no newline at the end\n"),
+    ("naïve café 🐍\n", "naive café 🐍🐍\n"),
+    ("日本語のテキスト\n二行目\n", "日本語テキスト\n二行目です\n"),
+    ("x = 1\n" * 50, "x = 1\n" * 20 + "x = 2\n" + "x = 1\n" * 30),
+]
+
+
+@pytest.mark.parametrize("original, modified", CASES)
+def test_edit_script_round_trips(original, modified):
+    script = diff_texts(original, modified)
+    assert apply_edit_script(original, script) == modified
+    positions = [position for start, end, _ in script for position in (start, end)]
+    assert positions == sorted(positions)  # Hunks are in order and don't overlap
+
+
+def test_edit_script_round_trips_random_edits():
+    rng = random.Random(0)
+    alphabet = "ab\n\r é"
+    for _ in range(300):
+        original = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 60)))
+        modified = edited(rng, original, alphabet, rng.randint(0, 10))
+        assert apply_edit_script(original, diff_texts(original, modified)) == modified
+
+
+def test_myers_finds_a_longest_common_subsequence():
+    rng = random.Random(1)
+    for _ in range(300):
+        a = [rng.randint(0, 3) for _ in range(rng.randint(0, 30))]
+        b = [rng.randint(0, 3) for _ in range(rng.randint(0, 30))]
+        blocks = myers_matching_blocks(a, b, len(a) + len(b))
+        for i, j, size in blocks:
+            assert size > 0 and a[i:i + size] == b[j:j + size]
+        assert all(i + size <= next_i and j + size <= next_j
+                   for (i, j, size), (next_i, next_j, _) in zip(blocks, blocks[1:]))
+        assert sum(size for _, _, size in blocks) == lcs_length(a, b)
+
+
+def test_myers_gives_up_beyond_max_edits():
+    assert myers_matching_blocks("abc", "xyz", 5) is None
+    assert myers_matching_blocks("abc", "xyz", 6) == []
+
+
+def test_changed_chars_is_minimal():
+    """
+    Below the edit limits, deleted plus inserted characters equal a shortest edit script's.
+    Texts are single lines, so the line pass can't pick a different (coarser) alignment.
+    """
+    rng = random.Random(2)
+    alphabet = "abcd é"
+    for _ in range(200):
+        original = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 80)))
+        modified = edited(rng, original, alphabet, rng.randint(0, 20))
+        minimal = len(original) + len(modified) - 2 * lcs_length(original, modified)
+        assert diff_metadata(original, modified).changed_chars == minimal
+
+
+def test_fallback_beyond_max_edit_distance(monkeypatch):
+    matched = []
+    sequence_matcher = difflib.SequenceMatcher
+
+    def spy(*args):
+        matched.append(args)
+        return sequence_matcher(*args)
+
+    monkeypatch.setattr(diffing, "DIFF_MAX_EDIT_DISTANCE", 4)
+    monkeypatch.setattr(diffing.difflib, "SequenceMatcher", spy)
+    rng = random.Random(3)
+    original = "".join(f"line {index}\n" for index in range(200))
+    modified = "".join(
+        f"line {index}\n" if rng.random() < 0.7 else f"changed {index}\n" for index in range(200)
+    )
+    script = diff_texts(original, modified)
+    assert matched
+    assert apply_edit_script(original, script) == modified
+    # Unchanged lines are still matched, not replaced wholesale
+    assert diff_metadata(original, modified).changed_chars < len(original) + len(modified)
+
+
+@pytest.mark.parametrize("original, modified, min_key_strokes", [
+    ("same", "same", 0),
+    ("abc", "ab", 1),        # A deletion is still a keystroke
+    ("abc", "abcabc", 1),    # Copy and paste
+    ("abc", "abcxyz", 3),    # Characters that can't be copied
+    ("abc", "abcxxx", 1),    # One typed character, copied twice
+])
+def test_min_key_strokes(original, modified, min_key_strokes):
+    assert diff_metadata(original, modified).min_key_strokes == min_key_strokes
@@ -0,0 +1,43 @@
+"""Histogram increments under parallel attempt submissions for one problem"""
+import random
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from app.histograms import HistogramDeltas, apply_histogram_deltas, attempt_histogram_deltas, merge_histogram_deltas
+from app.models import Problem, ProblemHistogram
+from conftest import SCRATCH_POOL_SIZE
+
+SUBMISSIONS = 2000
+
+
+def random_attempt_values(rng: random.Random):
+    """Plausible (time_seconds, key_strokes, ccpm) for one attempt"""
+    return rng.uniform(0.5, 60.0), rng.randint(1, 120), rng.uniform(10.0, 2500.0)
+
+
+def test_parallel_submissions_lose_no_increments(scratch):
+    rng = random.Random(0)
+    submissions = [random_attempt_values(rng) for _ in range(SUBMISSIONS)]
+    with Session(bind=scratch) as db:
+        problem = Problem(name="Concurrency", original_text="a", modified_text="b")
+        db.add(problem)
+        db.commit()
+        problem_id = problem.id
+
+    def submit(values):
+        with Session(bind=scratch) as db:
+            apply_histogram_deltas(db, attempt_histogram_deltas(problem_id, *values))
+            db.commit()
+
+    with ThreadPoolExecutor(max_workers=SCRATCH_POOL_SIZE) as executor:
+        list(executor.map(submit, submissions))
+
+    expected: HistogramDeltas = {}
+    for values in submissions:
+        merge_histogram_deltas(expected, attempt_histogram_deltas(problem_id, *values))
+    with Session(bind=scratch) as db:
+        stored = {
+            (problem_id, histogram.data_type): list(histogram.values)
+            for histogram in db.execute(select(ProblemHistogram)).scalars()
+        }
+    assert stored == expected
@@ -0,0 +1,58 @@
+"""Histogram binning: the scalar path live attempts use and the vectorized path must agree (no database)"""
+import numpy as np
+import pytest
+from app.histograms import (
+    HISTOGRAM_SPECS, HistogramDeltas, HistogramSpec, add_attempt_arrays, add_attempt_values, centered_spec
+)
+
+SPECS = {
+    **{data_type.value: spec for data_type, spec in HISTOGRAM_SPECS.items()},
+    "clamped": HistogramSpec(bin_width=1.0, offset=0.0, bars=5, clamp_overflow=True),
+}
+
+
+def edge_values(spec: HistogramSpec) -> np.ndarray:
+    """Bin boundaries (halfway between centers) and their neighbours, plus values binning can't round"""
+    boundaries = spec.offset + (np.arange(spec.bars + 2) + 0.5) * spec.bin_width
+    specials = [0.0, -0.0, -1.0, spec.offset, np.nextafter(spec.offset, np.inf), np.inf, -np.inf, np.nan, 1e300, -1e300]
+    return np.concatenate([
+        boundaries, np.nextafter(boundaries, np.inf), np.nextafter(boundaries, -np.inf), specials,
+    ])
+
+
+def random_values(spec: HistogramSpec) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    top = spec.offset + spec.bars * spec.bin_width
+    return np.concatenate([rng.uniform(-top, 2 * top, 100000), rng.lognormal(2.3, 1.5, 100000)])
+
+
+@pytest.mark.parametrize("name", SPECS)
+def test_scalar_and_vectorized_bins_agree(name):
+    spec = SPECS[name]
+    for values in (edge_values(spec), random_values(spec)):
+        scalar = [spec.bin_index(value) for value in values.tolist()]
+        assert [-1 if index is None else index for index in scalar] == spec.bin_indices(values).tolist()
+
+
+def test_bins_of_a_centered_spec():
+    spec = centered_spec(2.5)
+    values = (0.0, 1.25, 1.26, 2.49, 2.51, 3.75, 4.99, 5.01, 6.25)
+    assert [spec.bin_index(value) for value in values] == [0, 0, 1, 1, 2, 2, 2, 3, 3]
+    assert spec.bin_index(1000.0) is None
+    assert spec.bin_index(float("nan")) is None
+
+
+def test_scalar_and_vectorized_histograms_agree():
+    rng = np.random.default_rng(1)
+    count = 50000
+    problem_ids = rng.integers(1, 200, count)
+    time_seconds = rng.lognormal(2.3, 0.8, count)
+    key_strokes = rng.geometric(1 / 25.0, count).astype(np.float64)
+    ccpm = rng.lognormal(6.5, 0.9, count)
+
+    scalar: HistogramDeltas = {}
+    for row in zip(problem_ids.tolist(), time_seconds.tolist(), key_strokes.tolist(), ccpm.tolist()):
+        add_attempt_values(scalar, *row)
+    vectorized: HistogramDeltas = {}
+    add_attempt_arrays(vectorized, problem_ids, time_seconds, key_strokes, ccpm)
+    assert scalar == vectorized
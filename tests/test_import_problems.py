@@ -0,0 +1,35 @@
+"""Bulk problem imports"""
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from app.models import Problem
+from import_problems import ProblemRecord, import_problems
+
+
+def stored_problems(scratch):
+    with Session(bind=scratch) as db:
+        return {
+            problem.import_key: (problem.original_text, problem.modified_text, problem.changed_chars)
+            for problem in db.execute(select(Problem)).scalars()
+        }
+
+
+def test_import_then_reimport(scratch):
+    records = [ProblemRecord(f"key {index}", f"Problem {index}", "a = 1\n", f"a = {index}\n") for index in range(5)]
+    assert import_problems(records, bind=scratch) == {"inserted": 5, "updated": 0, "unchanged": 0}
+
+    records[0] = records[0]._replace(modified_text="a = 2\n")
+    assert import_problems(records, bind=scratch) == {"inserted": 0, "updated": 1, "unchanged": 4}
+    assert stored_problems(scratch)["key 0"][1] == "a = 2\n"
+
+
+def test_empty_texts_stay_empty_strings(scratch):
+    records = [
+        ProblemRecord("from scratch", "Type from scratch", "", "print('hi')\n"),
+        ProblemRecord("delete all", "Delete everything", "x, y\n\"quoted\"\n", ""),
+        ProblemRecord("blank", "Nothing to do", "", ""),
+    ]
+    assert import_problems(records, bind=scratch)["inserted"] == 3
+    stored = stored_problems(scratch)
+    assert stored["from scratch"] == ("", "print('hi')\n", len("print('hi')\n"))
+    assert stored["delete all"][:2] == ("x, y\n\"quoted\"\n", "")
+    assert stored["blank"] == ("", "", 0)
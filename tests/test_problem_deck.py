@@ -0,0 +1,74 @@
+"""Per-session shuffled problem decks (no database)"""
+import random
+from collections import Counter
+from app.problem_deck import ProblemDecks, ShuffledDeck
+
+
+def test_deck_deals_a_permutation():
+    pool = list(range(1, 1001))
+    deck = ShuffledDeck(pool, random.Random(0))
+    dealt = [deck.deal() for _ in range(len(pool))]
+    assert sorted(dealt) == pool
+    assert dealt != pool
+    assert deck.remaining() == 0
+
+
+def test_first_card_is_uniform():
+    pool = [10, 20, 30, 40, 50]
+    rng = random.Random(1)
+    firsts = Counter(ShuffledDeck(pool, rng).deal() for _ in range(10000))
+    assert set(firsts) == set(pool)
+    assert all(1600 < count < 2400 for count in firsts.values())
+
+
+def test_no_repeats_until_the_pool_is_exhausted():
+    pool = list(range(100))
+    decks = ProblemDecks()
+    dealt = []
+    for _ in range(len(pool) // 10):
+        dealt += decks.deal("session", pool, 10)
+    assert sorted(dealt) == pool
+    assert decks.reshuffles == 0
+    # The next round starts mid-batch: the batch stays distinct
+    batch = decks.deal("session", pool, 30)
+    assert len(set(batch)) == 30
+    assert decks.reshuffles == 1
+
+
+def test_sessions_have_their_own_decks():
+    pool = list(range(20))
+    decks = ProblemDecks()
+    first = decks.deal("a", pool, 20)
+    second = decks.deal("b", pool, 20)
+    assert sorted(first) == sorted(second) == pool
+
+
+def test_changed_pool_starts_a_new_deck():
+    decks = ProblemDecks()
+    decks.deal("session", list(range(10)), 5)
+    new_pool = list(range(100, 110))
+    assert set(decks.deal("session", new_pool, 10)) == set(new_pool)
+
+
+def test_exclude_is_skipped():
+    pool = list(range(10))
+    decks = ProblemDecks()
+    for _ in range(20):
+        batch = decks.deal("session", pool, 10, exclude={0, 1, 2})
+        assert sorted(batch) == list(range(3, 10))
+
+
+def test_stale_excluded_ids_terminate():
+    pool = list(range(10))
+    decks = ProblemDecks()
+    # IDs no longer in the pool (e.g. deleted problems) can't be dealt anyway
+    for exclude in ({100, 101}, set(range(100, 120)), {5, 100, 101, 102}):
+        for count in (1, 5, 10, 50):
+            batch = decks.deal("session", pool, count, exclude=exclude)
+            assert len(batch) == len(set(batch)) <= count
+            assert set(batch) <= set(pool) - exclude
+
+
+def test_empty_pool_deals_nothing():
+    assert ProblemDecks().deal("session", [], 5) == []
+    assert ProblemDecks().deal("session", [1, 2], 5, exclude={1, 2}) == []
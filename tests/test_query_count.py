@@ -0,0 +1,119 @@
+"""
+Statement-count regression checks for the hot read paths: warm requests (caches
+loaded, periodic version checks excluded) must stay within their statement budgets.
+"""
+from contextlib import contextmanager
+from typing import List
+import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app import tokens
+from app.catalog import catalog_version, problem_catalog
+from app.histograms import apply_histogram_deltas, attempt_histogram_deltas
+from app.models import Attempt, Problem, Session as SessionModel, User
+from app.problem_pool import problem_pool
+from app.routers.auth import load_session
+from app.routers.problems import load_problem_batch, load_random_problem
+from app.session_cache import session_generation
+from app.user_best import record_best
+
+# Statements per warm GET /api/problems/random; raise only together with a deliberate change
+RANDOM_PROBLEM_STATEMENT_BUDGET = 1
+RANDOM_PROBLEM_REQUESTS = 20
+
+# Statements per warm GET /api/problems/batch, whatever the count
+PROBLEM_BATCH_STATEMENT_BUDGET = 1
+PROBLEM_BATCH_COUNTS = (1, 10, 50)
+
+# Signed session tokens are verified in memory
+TOKEN_AUTH_STATEMENT_BUDGET = 0
+
+SESSION_ID = "query-count"
+
+
+@contextmanager
+def count_statements(bind):
+    """Collect the SQL statements executed on an engine"""
+    statements: List[str] = []
+
+    def record(connection, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(bind, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(bind, "before_cursor_execute", record)
+
+
+@pytest.fixture
+def catalog(scratch, monkeypatch):
+    """
+    Enough problems for the largest batch, each with an attempt by one user who has
+    a session and a signed token. Yields the token; the whole catalog is cached.
+    """
+    monkeypatch.setattr(tokens, "SESSION_TOKEN_SECRETS", tokens.SESSION_TOKEN_SECRETS or [b"query-count"])
+    # Periodic version checks are amortized over many requests; keep them out of the count
+    monkeypatch.setattr(catalog_version, "check_seconds", float("inf"))
+    monkeypatch.setattr(session_generation, "check_seconds", float("inf"))
+
+    with Session(bind=scratch) as db:
+        user = User(username="query-count", hashed_password="x")
+        problems = [
+            Problem(name=f"Query count {index}", original_text="a", modified_text="b")
+            for index in range(max(PROBLEM_BATCH_COUNTS))
+        ]
+        db.add_all([user, *problems])
+        db.flush()
+        db.add(SessionModel(session_id=SESSION_ID, user_id=user.id))
+        for problem in problems:
+            db.add(Attempt(user_id=user.id, problem_id=problem.id, time_seconds=3.0, key_strokes=4, ccpm=100.0))
+            record_best(db, user.id, problem.id, 3.0, 4, 100.0)
+            apply_histogram_deltas(db, attempt_histogram_deltas(problem.id, 3.0, 4, 100.0))
+        db.commit()
+        token, _ = tokens.issue_token(user.id, user.username)
+
+    problem_pool.invalidate()  # The pool may still hold the IDs of an earlier scratch schema
+    with Session(bind=scratch) as db:
+        problem_catalog.get_many(db, problem_pool.get_ids(db))
+    yield token
+
+
+@pytest.mark.parametrize("auth", ["anonymous", "logged in", "token"])
+def test_random_problem_statement_budget(scratch, catalog, auth):
+    session_id = {"anonymous": None, "logged in": SESSION_ID, "token": catalog}[auth]
+    with Session(bind=scratch) as db:
+        load_random_problem(db, session_id)  # Warm the ID pool, catalog and session caches
+        counts = []
+        for _ in range(RANDOM_PROBLEM_REQUESTS):
+            with count_statements(scratch) as statements:
+                response = load_random_problem(db, session_id)
+            counts.append(len(statements))
+            db.rollback()
+    assert max(counts) <= RANDOM_PROBLEM_STATEMENT_BUDGET
+    assert response.time_histogram is not None
+    if session_id:
+        assert response.best_time is not None
+
+
+@pytest.mark.parametrize("session_id", [None, SESSION_ID], ids=["anonymous", "logged in"])
+def test_problem_batch_statement_budget(scratch, catalog, session_id):
+    with Session(bind=scratch) as db:
+        for count in PROBLEM_BATCH_COUNTS:
+            with count_statements(scratch) as statements:
+                response = load_problem_batch(db, session_id, count)
+            db.rollback()
+            assert len(statements) <= PROBLEM_BATCH_STATEMENT_BUDGET, f"batch of {count}"
+            assert len({problem.id for problem in response.problems}) == count
+            for problem in response.problems:
+                assert problem.time_histogram is not None
+                if session_id:
+                    assert problem.best_time is not None
+
+
+def test_token_auth_executes_no_statements(scratch, catalog):
+    with Session(bind=scratch) as db:
+        load_session(db, catalog)  # Load the revocation set
+        with count_statements(scratch) as statements:
+            load_session(db, catalog)
+    assert len(statements) <= TOKEN_AUTH_STATEMENT_BUDGET
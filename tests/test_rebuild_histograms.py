@@ -0,0 +1,81 @@
+"""Histogram rebuild swaps while attempts are being submitted"""
+import random
+import threading
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from app.database import SessionLocal
+from app.histograms import HistogramDeltas, add_attempt_values
+from app.models import Attempt, Problem, ProblemHistogram, Session as SessionModel, User
+from app.routers.attempts import store_attempt
+from app.schemas import AttemptCreate
+from rebuild_histograms import attempt_values, problem_ranges, read_cutoff, swap_histograms
+
+SUBMITTERS = 4
+SWAPS = 20
+
+
+def binned_attempts(db: Session, *conditions) -> HistogramDeltas:
+    histograms: HistogramDeltas = {}
+    for problem_id, time_seconds, key_strokes, ccpm in db.execute(attempt_values(*conditions)):
+        add_attempt_values(histograms, problem_id, time_seconds, key_strokes, ccpm)
+    return histograms
+
+
+def stored_histograms(db: Session) -> HistogramDeltas:
+    return {
+        (histogram.problem_id, histogram.data_type): list(histogram.values)
+        for histogram in db.execute(select(ProblemHistogram)).scalars()
+    }
+
+
+def test_problem_ranges_cover_every_id_once():
+    for first, last, ranges in ((1, 1, 4), (1, 10, 3), (5, 1000, 16), (3, 5, 10)):
+        covered = [problem_id for start, end in problem_ranges(first, last, ranges) for problem_id in range(start, end + 1)]
+        assert covered == list(range(first, last + 1))
+        assert len(problem_ranges(first, last, ranges)) <= ranges
+
+
+def test_swap_during_submissions(scratch):
+    with Session(bind=scratch) as db:
+        user = User(username="rebuild", hashed_password="x")
+        problems = [Problem(name=f"Rebuild {index}", original_text="a", modified_text="b") for index in range(3)]
+        db.add_all([user, *problems])
+        db.flush()
+        db.add(SessionModel(session_id="rebuild", user_id=user.id))
+        db.commit()
+        problem_ids = [problem.id for problem in problems]
+
+    stop = threading.Event()
+    errors = []
+
+    def submit(seed: int):
+        rng = random.Random(seed)
+        try:
+            # Configured like request sessions (autoflush off), so the attempt is only written at commit
+            with SessionLocal(bind=scratch) as db:
+                while not stop.is_set():
+                    attempt = AttemptCreate(
+                        problem_id=rng.choice(problem_ids), time_seconds=rng.uniform(0.5, 60.0),
+                        key_strokes=rng.randint(1, 120), ccpm=rng.uniform(10.0, 2500.0),
+                    )
+                    store_attempt(db, attempt, "rebuild")
+        except Exception as exc:
+            errors.append(exc)
+
+    submitters = [threading.Thread(target=submit, args=(seed,)) for seed in range(SUBMITTERS)]
+    for thread in submitters:
+        thread.start()
+    try:
+        for _ in range(SWAPS):
+            with Session(bind=scratch) as db:
+                max_attempt_id, _, _ = read_cutoff(db)
+                swap_histograms(db, binned_attempts(db, Attempt.id <= max_attempt_id), max_attempt_id)
+    finally:
+        stop.set()
+        for thread in submitters:
+            thread.join()
+    assert not errors
+
+    with Session(bind=scratch) as db:
+        assert db.query(Attempt).count() > 0
+        assert stored_histograms(db) == binned_attempts(db)
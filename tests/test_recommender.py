@@ -0,0 +1,106 @@
+"""Weighted next-problem picks (no database)"""
+import random
+from collections import Counter
+import pytest
+from app.recommender import CLASS_WEIGHTS, IndexedSet, UserProblemWeights, WeightClass, classify
+
+PICKS = 50000
+MEDIAN = 30.0
+
+
+def test_indexed_set_add_remove_choice():
+    items = IndexedSet([1, 2, 3, 2])
+    assert len(items) == 3
+    items.remove(1)  # The last item moves into the freed slot
+    items.remove(42)  # Absent: no-op
+    assert len(items) == 2 and 1 not in items and {2, 3} <= set(items._items)
+    items.add(4)
+    rng = random.Random(0)
+    assert {items.choice(rng) for _ in range(200)} == {2, 3, 4}
+    for item in (2, 3, 4):
+        items.remove(item)
+    assert len(items) == 0
+
+
+def test_indexed_set_positions_stay_consistent():
+    rng = random.Random(1)
+    items, expected = IndexedSet(), set()
+    for _ in range(2000):
+        item = rng.randrange(50)
+        if rng.random() < 0.5:
+            items.add(item)
+            expected.add(item)
+        else:
+            items.remove(item)
+            expected.discard(item)
+        assert len(items) == len(expected)
+    assert set(items._items) == expected
+    assert all(items._items[position] == item for item, position in items._positions.items())
+
+
+def test_classify():
+    assert classify(20.0, None) is WeightClass.AVERAGE
+    assert classify(20.0, MEDIAN) is WeightClass.MASTERED
+    assert classify(40.0, MEDIAN) is WeightClass.AVERAGE
+    assert classify(60.0, MEDIAN) is WeightClass.BEHIND
+
+
+@pytest.mark.parametrize("catalog, share", [(1000, 0.0), (1000, 0.1), (1000, 0.5), (1000, 0.95), (1000, 1.0)])
+def test_picks_follow_class_weights(catalog, share):
+    rng = random.Random(2)
+    pool = list(range(1, catalog + 1))
+    attempted = rng.sample(pool, int(catalog * share))
+    # Best times spread over the mastered, average and behind classes
+    bests = {problem_id: rng.choice((20.0, 40.0, 60.0)) for problem_id in attempted}
+    state = UserProblemWeights(bests, {problem_id: MEDIAN for problem_id in pool})
+
+    picked = Counter(state.class_of.get(state.pick(rng, pool), WeightClass.NEW) for _ in range(PICKS))
+    sizes = Counter({weight_class: len(members) for weight_class, members in state.classes.items()})
+    sizes[WeightClass.NEW] = catalog - len(attempted)
+    total = sum(CLASS_WEIGHTS[weight_class] * count for weight_class, count in sizes.items())
+    for weight_class, count in sizes.items():
+        expected = CLASS_WEIGHTS[weight_class] * count / total
+        assert picked[weight_class] / PICKS == pytest.approx(expected, abs=0.01), weight_class
+
+
+def test_new_picks_are_uniform_over_unattempted_problems():
+    rng = random.Random(3)
+    pool = list(range(100))
+    # Few unattempted problems left: they are listed explicitly
+    state = UserProblemWeights({problem_id: 20.0 for problem_id in pool[5:]}, {})
+    picked = Counter(state._pick_new(rng, pool) for _ in range(5000))
+    assert set(picked) == set(pool[:5])
+    assert all(800 < count < 1200 for count in picked.values())
+
+
+def test_recorded_attempts_move_problems_between_classes():
+    pool = list(range(10))
+    state = UserProblemWeights({}, {})
+    rng = random.Random(4)
+    state.pick(rng, pool)
+    state.record(3, 60.0, MEDIAN)
+    assert state.class_of[3] is WeightClass.BEHIND
+    state.record(3, 20.0, MEDIAN)  # Improved best: moved, not duplicated
+    assert state.class_of[3] is WeightClass.MASTERED
+    assert 3 in state.classes[WeightClass.MASTERED] and 3 not in state.classes[WeightClass.BEHIND]
+    state.record(3, 90.0, MEDIAN)  # A worse attempt keeps the best
+    assert state.class_of[3] is WeightClass.MASTERED
+
+    for problem_id in pool:
+        state.record(problem_id, 20.0, MEDIAN)
+    # Nothing left unattempted: never picks outside the attempted problems
+    assert {state.pick(rng, pool) for _ in range(500)} <= set(pool)
+    assert state._pick_new(rng, pool) is None
+
+
+def test_removed_problems_are_never_picked_as_new():
+    rng = random.Random(5)
+    pool = list(range(20))
+    state = UserProblemWeights({problem_id: 20.0 for problem_id in pool[:18]}, {})
+    assert state._pick_new(rng, pool) in (18, 19)  # Builds the explicit list
+    state.record(18, 20.0, None)
+    assert {state._pick_new(rng, pool) for _ in range(200)} == {19}
+
+
+def test_empty_pool_picks_nothing():
+    assert UserProblemWeights({}, {}).pick(random.Random(0), []) is None
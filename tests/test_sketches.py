@@ -0,0 +1,67 @@
+"""Accuracy of the quantile sketches behind /api/problems/{id}/percentile (no database)"""
+import random
+from bisect import bisect_left, bisect_right
+from typing import List
+import pytest
+from app.models import HistogramDataType
+from app.sketches import DDSketch, SKETCH_RELATIVE_ACCURACY
+
+ATTEMPTS_PER_METRIC = 100000
+QUANTILES = [0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99]
+
+
+def synthetic_metric_values(rng: random.Random, metric: HistogramDataType, count: int) -> List[float]:
+    """Skewed, long-tailed values resembling real attempts (including a few zeros)"""
+    if metric == HistogramDataType.TIME:
+        return [rng.lognormvariate(2.3, 0.8) for _ in range(count)]
+    if metric == HistogramDataType.STROKES:
+        return [float(int(rng.expovariate(1 / 25.0))) for _ in range(count)]
+    return [rng.lognormvariate(6.5, 0.9) for _ in range(count)]
+
+
+@pytest.fixture(params=list(HistogramDataType), ids=lambda metric: metric.value)
+def metric_values(request):
+    return synthetic_metric_values(random.Random(0), request.param, ATTEMPTS_PER_METRIC)
+
+
+def sketch_of(values: List[float]) -> DDSketch:
+    sketch = DDSketch()
+    for value in values:
+        sketch.add(value)
+    return sketch
+
+
+def test_quantiles_within_relative_accuracy(metric_values):
+    ordered = sorted(metric_values)
+    sketch = sketch_of(metric_values)
+    for q in QUANTILES:
+        exact = ordered[int(q * (len(ordered) - 1))]
+        estimate = sketch.quantile(q)
+        error = abs(estimate - exact) / exact if exact else abs(estimate)
+        assert error <= SKETCH_RELATIVE_ACCURACY + 1e-9, f"p{q * 100:g}: {estimate:.4f} vs exact {exact:.4f}"
+
+
+def test_ranks_close_to_exact(metric_values):
+    ordered = sorted(metric_values)
+    sketch = sketch_of(metric_values)
+    for q in QUANTILES:
+        exact = ordered[int(q * (len(ordered) - 1))]
+        exact_rank = (bisect_left(ordered, exact) + bisect_right(ordered, exact)) / 2 / len(ordered)
+        # Values that share a bucket can't be told apart, so ranks are close rather than exact
+        assert sketch.rank(exact) == pytest.approx(exact_rank, abs=0.02)
+
+
+def test_merged_sketch_equals_sketch_of_all_values(metric_values):
+    merged = DDSketch()
+    merged.merge(sketch_of(metric_values[0::2]))
+    merged.merge(sketch_of(metric_values[1::2]))
+    whole = sketch_of(metric_values)
+    assert merged.counts == whole.counts
+    assert merged.zero_count == whole.zero_count
+
+
+def test_non_finite_values_are_ignored():
+    sketch = sketch_of([1.0, float("inf"), float("nan"), 2.0])
+    assert sketch.count == 2
+    assert sketch.rank(float("nan")) is None
+    assert sketch.rank(float("inf")) == 1.0
@@ -0,0 +1,73 @@
+"""Signed session tokens: signing, verification, expiry and revocation"""
+from datetime import datetime, timedelta, timezone
+import pytest
+from sqlalchemy.orm import Session
+from app import tokens
+from app.tokens import TOKEN_PREFIX, TokenRevocations, issue_token, verify_token
+
+NOW = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+@pytest.fixture(autouse=True)
+def secrets(monkeypatch):
+    monkeypatch.setattr(tokens, "SESSION_TOKEN_SECRETS", [b"current", b"previous"])
+    monkeypatch.setattr(tokens, "SESSION_ABSOLUTE_TIMEOUT_SECONDS", 3600)
+
+
+def test_valid_token_round_trips():
+    token, claims = issue_token(7, "ada", now=NOW)
+    assert token.startswith(TOKEN_PREFIX)
+    assert verify_token(token, now=NOW) == claims
+    assert (claims.user_id, claims.username, claims.expires_at) == (7, "ada", NOW + timedelta(hours=1))
+
+
+def test_old_secret_still_verifies(monkeypatch):
+    monkeypatch.setattr(tokens, "SESSION_TOKEN_SECRETS", [b"previous"])
+    token, claims = issue_token(7, "ada", now=NOW)
+    monkeypatch.setattr(tokens, "SESSION_TOKEN_SECRETS", [b"current", b"previous"])
+    assert verify_token(token, now=NOW) == claims
+    monkeypatch.setattr(tokens, "SESSION_TOKEN_SECRETS", [b"current"])
+    assert verify_token(token, now=NOW) is None
+
+
+def flipped(text: str, index: int) -> str:
+    return text[:index] + ("A" if text[index] != "A" else "B") + text[index + 1:]
+
+
+def test_tampered_tokens_are_rejected():
+    token, _ = issue_token(7, "ada", now=NOW)
+    payload, signature = token[len(TOKEN_PREFIX):].split(".")
+    for index in (0, len(signature) // 2, len(signature) - 1):
+        assert verify_token(f"{TOKEN_PREFIX}{payload}.{flipped(signature, index)}", now=NOW) is None
+    assert verify_token(f"{TOKEN_PREFIX}{flipped(payload, 5)}.{signature}", now=NOW) is None
+    # Another user's claims under this token's signature
+    other, _ = issue_token(8, "bob", now=NOW)
+    assert verify_token(f"{other.rsplit('.', 1)[0]}.{signature}", now=NOW) is None
+
+
+@pytest.mark.parametrize("token", [
+    "", "v1.", "v1..", "v1.abc", "v1.abc.", "v1.é.abc", "v1.abc.é", "v1.a+b.c/d", "v1.abc.def=", "not-a-token",
+])
+def test_malformed_tokens_are_rejected(token):
+    assert verify_token(token, now=NOW) is None
+
+
+def test_expired_token_is_rejected():
+    token, claims = issue_token(7, "ada", now=NOW)
+    assert verify_token(token, now=claims.expires_at - timedelta(seconds=1)) == claims
+    assert verify_token(token, now=claims.expires_at) is None
+
+
+def test_revoked_token_is_seen_by_every_worker(scratch):
+    token, claims = issue_token(7, "ada", now=datetime.now(timezone.utc))
+    other, other_claims = issue_token(7, "ada", now=datetime.now(timezone.utc))
+    this_worker, other_worker = TokenRevocations(), TokenRevocations()
+    with Session(bind=scratch) as db:
+        assert not this_worker.is_revoked(db, claims.token_id)
+        assert not other_worker.is_revoked(db, claims.token_id)
+        this_worker.revoke(db, verify_token(token))
+        assert this_worker.is_revoked(db, claims.token_id)
+        # Other workers pick the revocation up on their next refresh
+        other_worker._load(db)
+        assert other_worker.is_revoked(db, claims.token_id)
+        assert not other_worker.is_revoked(db, other_claims.token_id)